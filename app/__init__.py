@@ -11,10 +11,14 @@ from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from config import config
 from app.models import db, User
+from app.utils.db_profile import configure_engine_options, init_engine_profile
 
 # Import extended models for database migrations
 from app import models_extended
 
+# Registers the full-text index DDL that runs with db.create_all()
+from app.services import search_service
+
 # Initialize extensions
 login_manager = LoginManager()
 migrate = Migrate()
@@ -49,7 +53,9 @@ def create_app(config_name='default'):
             raise ValueError("SECRET_KEY must be at least 32 characters for production.")
 
     # Initialize extensions
+    configure_engine_options(app)
     db.init_app(app)
+    init_engine_profile(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
@@ -5,6 +5,8 @@ SQLAlchemy ORM models for the POS system
 
 from datetime import datetime, date
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import validates
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -237,6 +239,12 @@ class Supplier(db.Model):
 class Product(db.Model):
     """Product/Inventory items"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # Keyset pagination of the inventory listing
+        db.Index('ix_products_active_name_id', 'is_active', 'name', 'id'),
+        # POS catalog change feed
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(64), unique=True, nullable=False, index=True)
@@ -549,10 +557,17 @@ class Product(db.Model):
 class Customer(db.Model):
     """Customer management"""
     __tablename__ = 'customers'
+    __table_args__ = (
+        # Keyset pagination of the customer listing
+        db.Index('ix_customers_active_name_id', 'is_active', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False, index=True)
     phone = db.Column(db.String(32), unique=True, index=True)
+    # Derived from phone: E.164 form, and its digits reversed for last-N-digit lookups
+    phone_e164 = db.Column(db.String(20), index=True)
+    phone_reversed = db.Column(db.String(20), index=True)
     email = db.Column(db.String(120))
     address = db.Column(db.Text)
     city = db.Column(db.String(64))
@@ -585,6 +600,21 @@ class Customer(db.Model):
     # Relationships
     sales = db.relationship('Sale', backref='customer', lazy='dynamic')
 
+    @validates('phone')
+    def validate_phone(self, key, value):
+        """Keep the normalized phone columns in step with the phone as entered"""
+        from app.utils.helpers import normalize_phone
+        self.phone_e164 = normalize_phone(value)
+        digits = ''.join(filter(str.isdigit, self.phone_e164 or value or ''))
+        self.phone_reversed = digits[::-1] or None
+        return value
+
+    @property
+    def search_tokens(self):
+        """Words of name and email indexed in customer_search_tokens"""
+        from app.utils.helpers import search_tokens
+        return search_tokens(self.name, self.email)
+
     @property
     def total_purchases(self):
         """Calculate total purchase amount"""
@@ -664,13 +694,58 @@ class Customer(db.Model):
         return f'<Customer {self.name}>'
 
 
+class CustomerSearchToken(db.Model):
+    """Word-prefix index over customer names and emails"""
+    __tablename__ = 'customer_search_tokens'
+    __table_args__ = (
+        # Per-customer token checks and rewrites
+        db.Index('ix_customer_search_tokens_customer_token', 'customer_id', 'token'),
+    )
+
+    token = db.Column(db.String(64), primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id', ondelete='CASCADE'),
+                            primary_key=True)
+
+    def __repr__(self):
+        return f'<CustomerSearchToken {self.token} -> {self.customer_id}>'
+
+
+@event.listens_for(Customer, 'after_insert')
+@event.listens_for(Customer, 'after_update')
+def _sync_customer_search_tokens(mapper, connection, target):
+    """Rewrite a customer's search tokens when the name or email changes"""
+    state = db.inspect(target)
+    if not (state.attrs.name.history.has_changes() or state.attrs.email.history.has_changes()):
+        return
+    table = CustomerSearchToken.__table__
+    connection.execute(table.delete().where(table.c.customer_id == target.id))
+    tokens = target.search_tokens
+    if tokens:
+        connection.execute(table.insert(), [{'token': token, 'customer_id': target.id}
+                                            for token in tokens])
+
+
+@event.listens_for(Customer, 'after_delete')
+def _drop_customer_search_tokens(mapper, connection, target):
+    table = CustomerSearchToken.__table__
+    connection.execute(table.delete().where(table.c.customer_id == target.id))
+
+
 class Sale(db.Model):
     """Sales transactions"""
     __tablename__ = 'sales'
+    __table_args__ = (
+        # Keyset pagination of the per-location sales list
+        db.Index('ix_sales_location_date_id', 'location_id', 'sale_date', 'id'),
+        # Customer lookup: last order and per-customer aggregates
+        db.Index('ix_sales_customer_date_id', 'customer_id', 'sale_date', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sale_number = db.Column(db.String(64), unique=True, nullable=False, index=True)
     sale_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Client-generated key; a retried or replayed checkout returns this sale
+    idempotency_key = db.Column(db.String(64), unique=True, index=True)
 
     # References
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), index=True)
@@ -741,6 +816,9 @@ class Sale(db.Model):
 class SaleItem(db.Model):
     """Individual items in a sale"""
     __tablename__ = 'sale_items'
+    __table_args__ = (
+        db.Index('ix_sale_items_sale_product', 'sale_id', 'product_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
@@ -786,6 +864,34 @@ class Payment(db.Model):
         return f'<Payment {self.id} - {self.amount}>'
 
 
+class HeldSale(db.Model):
+    """Cart parked at the POS, to be recalled on any terminal at the location"""
+    __tablename__ = 'held_sales'
+    __table_args__ = (
+        db.Index('ix_held_sales_location_user_created', 'location_id', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+
+    notes = db.Column(db.Text)
+    item_count = db.Column(db.Integer, default=0)
+    total = db.Column(db.Numeric(10, 2), default=0.00)
+    payload = db.Column(db.Text, nullable=False)  # JSON: items plus the terminal's cart state
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    # Relationships
+    user = db.relationship('User')
+    location = db.relationship('Location')
+
+    def __repr__(self):
+        return f'<HeldSale {self.id} user={self.user_id} items={self.item_count}>'
+
+
 class DigitalReceipt(db.Model):
     """Track digital receipts sent to customers"""
     __tablename__ = 'digital_receipts'
@@ -1036,6 +1142,7 @@ class ActivityLog(db.Model):
     __table_args__ = (
         db.Index('ix_activity_logs_user_timestamp', 'user_id', 'timestamp'),
         db.Index('ix_activity_logs_action_timestamp', 'action', 'timestamp'),
+        db.Index('ix_activity_logs_timestamp_id', 'timestamp', 'id'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -1191,6 +1298,8 @@ class DayClose(db.Model):
     # Z-Report tracking
     z_report_number = db.Column(db.String(32))  # Z-001, Z-002, etc.
     shift_count = db.Column(db.Integer, default=1)  # Number of shifts that day
+    z_report_data = db.Column(db.Text)  # JSON snapshot frozen at close
+    z_report_checksum = db.Column(db.String(64))  # SHA-256 of z_report_data
 
     # Report
     report_generated = db.Column(db.Boolean, default=False)
@@ -1209,6 +1318,14 @@ class DayClose(db.Model):
     def __repr__(self):
         return f'<DayClose {self.close_date}>'
 
+    @validates('z_report_data', 'z_report_checksum')
+    def validate_z_report(self, key, value):
+        """A Z-report snapshot can be written once and never changed"""
+        current = getattr(self, key)
+        if current is not None and value != current:
+            raise ValueError('Z-report snapshot is immutable once the day is closed')
+        return value
+
     def calculate_denomination_total(self):
         """Calculate total from denomination counts"""
         total = (
@@ -1226,6 +1343,44 @@ class DayClose(db.Model):
         return total
 
 
+class ShiftLedger(db.Model):
+    """Running sales totals per location and business day, updated as sales happen"""
+    __tablename__ = 'shift_ledgers'
+    __table_args__ = (
+        db.UniqueConstraint('location_id', 'business_date', name='uix_shift_ledger_location_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False, index=True)
+    business_date = db.Column(db.Date, nullable=False, index=True)
+
+    # Sales summary (same meaning as the DayClose columns)
+    sale_count = db.Column(db.Integer, default=0, nullable=False)
+    gross_sales = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_discounts = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_tax = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    net_sales = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    refund_count = db.Column(db.Integer, default=0, nullable=False)
+    total_refunds = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+
+    # Takings by payment method (split payments are spread over their methods)
+    total_cash = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_card = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_easypaisa = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_jazzcash = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_bank_transfer = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_credit = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+    total_other = db.Column(db.Numeric(12, 2), default=0.00, nullable=False)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    location = db.relationship('Location')
+
+    def __repr__(self):
+        return f'<ShiftLedger {self.location_id} {self.business_date}>'
+
+
 class InventorySpotCheck(db.Model):
     """Inventory spot check during day close - for daily/fortnightly verification"""
     __tablename__ = 'inventory_spot_checks'
@@ -1351,6 +1506,13 @@ class Location(db.Model):
 
     def get_final_cost_for_product(self, product):
         """Calculate final cost including kiosk charges"""
+        from app.services.cost_matrix_service import get_cost_matrix
+
+        # Stored LocationProductCost rows, read from the process-wide matrix
+        final_cost = get_cost_matrix().final_cost(product, self.id)
+        if final_cost is not None:
+            return float(final_cost)
+
         landed_cost = float(product.landed_cost or product.cost_price or 0)
         if self.kiosk_charge_type == 'percentage':
             return landed_cost + (landed_cost * float(self.kiosk_charge_rate or 0) / 100)
@@ -1391,6 +1553,9 @@ class LocationStock(db.Model):
     # Unique constraint: one stock record per product per location
     __table_args__ = (
         db.UniqueConstraint('location_id', 'product_id', name='uix_location_product'),
+        # POS catalog change feed
+        db.Index('ix_location_stock_location_updated', 'location_id', 'updated_at'),
+        db.Index('ix_location_stock_location_moved', 'location_id', 'last_movement_at'),
     )
 
     # Relationships
@@ -10,6 +10,8 @@ from decimal import Decimal
 from app.models import db, Customer, Sale, SyncQueue
 from app.utils.helpers import has_permission
 from app.utils.permissions import permission_required, Permissions
+from app.utils.pagination import keyset_paginate
+from app.services.customer_search_service import customer_search_filter, search_customers as find_customers
 from app.utils.birthday_gifts import (
     get_eligible_birthday_customers,
     get_tomorrow_birthday_notifications,
@@ -27,22 +29,17 @@ bp = Blueprint('customers', __name__)
 @permission_required(Permissions.CUSTOMER_VIEW)
 def index():
     """List all customers"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = current_app.config['ITEMS_PER_PAGE']
     search = request.args.get('search', '').strip()
 
-    query = Customer.query.filter_by(is_active=True)
-
     if search:
-        query = query.filter(
-            db.or_(
-                Customer.name.ilike(f'%{search}%'),
-                Customer.phone.ilike(f'%{search}%'),
-                Customer.email.ilike(f'%{search}%')
-            )
-        )
+        query = Customer.query.filter(customer_search_filter(search, active_only=True))
+    else:
+        query = Customer.query.filter_by(is_active=True)
 
-    customers = query.order_by(Customer.name).paginate(page=page, per_page=per_page, error_out=False)
+    customers = keyset_paginate(query, [(Customer.name, False), (Customer.id, False)],
+                                cursor=cursor, per_page=per_page)
 
     return render_template('customers/index.html', customers=customers)
 
@@ -182,15 +179,7 @@ def search_customers():
     if len(query) < 2:
         return jsonify({'customers': []})
 
-    customers = Customer.query.filter(
-        db.and_(
-            Customer.is_active == True,
-            db.or_(
-                Customer.name.ilike(f'%{query}%'),
-                Customer.phone.ilike(f'%{query}%')
-            )
-        )
-    ).limit(10).all()
+    customers = find_customers(query, limit=10)
 
     results = []
     for customer in customers:
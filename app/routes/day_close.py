@@ -11,6 +11,8 @@ from sqlalchemy import func, and_, or_
 from app.models import db, DayClose, Sale, SaleItem, Location, User, Product, LocationStock, InventorySpotCheck, InventorySpotCheckItem, RawMaterial, RawMaterialStock
 from app.utils.permissions import permission_required, Permissions
 from app.utils.location_context import get_current_location
+from app.services.shift_ledger_service import (ledger_totals, build_z_report_snapshot,
+                                                load_z_report_snapshot, compute_z_report_sections)
 
 bp = Blueprint('day_close', __name__, url_prefix='/day-close')
 
@@ -48,39 +50,27 @@ def index():
         flash(f'Day already closed for {location.name} on {today}', 'warning')
         return redirect(url_for('day_close.detail', close_id=existing_close.id))
 
-    # Get today's sales for this location
-    today_sales = Sale.query.filter(
-        func.date(Sale.sale_date) == today,
-        Sale.location_id == location.id,
-        Sale.status == 'completed'
-    ).all()
+    # Today's running totals for this location (kept up to date by each sale)
+    totals = ledger_totals(location.id, today)
 
-    # Get refunded sales
-    refunded_sales = Sale.query.filter(
-        func.date(Sale.sale_date) == today,
-        Sale.location_id == location.id,
-        Sale.status == 'refunded'
-    ).all()
+    total_sales = totals['sale_count']
+    gross_sales = float(totals['gross_sales'])
+    total_discounts = float(totals['total_discounts'])
+    total_tax = float(totals['total_tax'])
+    net_sales = float(totals['net_sales'])
 
-    # Calculate totals
-    total_sales = len(today_sales)
-    gross_sales = sum(float(sale.subtotal or 0) for sale in today_sales)
-    total_discounts = sum(float(sale.discount or 0) for sale in today_sales)
-    total_tax = sum(float(sale.tax or 0) for sale in today_sales)
-    net_sales = sum(float(sale.total or 0) for sale in today_sales)
-
-    # Payment breakdown
-    total_cash = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'cash')
-    total_card = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'card')
-    total_easypaisa = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'easypaisa')
-    total_jazzcash = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'jazzcash')
-    total_bank = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'bank_transfer')
-    total_credit = sum(float(sale.total or 0) for sale in today_sales if sale.payment_method == 'credit')
-    total_other = net_sales - total_cash - total_card - total_easypaisa - total_jazzcash - total_bank - total_credit
+    # Payment breakdown (split payments counted under each method)
+    total_cash = float(totals['total_cash'])
+    total_card = float(totals['total_card'])
+    total_easypaisa = float(totals['total_easypaisa'])
+    total_jazzcash = float(totals['total_jazzcash'])
+    total_bank = float(totals['total_bank_transfer'])
+    total_credit = float(totals['total_credit'])
+    total_other = float(totals['total_other'])
 
     # Refunds
-    total_refunds = sum(float(sale.total or 0) for sale in refunded_sales)
-    refund_count = len(refunded_sales)
+    total_refunds = float(totals['total_refunds'])
+    refund_count = totals['refund_count']
 
     # Get opening balance (from last close for this location)
     last_close = DayClose.query.filter_by(
@@ -136,37 +126,26 @@ def close_day():
             flash('Day already closed for this location', 'error')
             return redirect(url_for('day_close.detail', close_id=existing_close.id))
 
-        # Get today's sales
-        today_sales = Sale.query.filter(
-            func.date(Sale.sale_date) == today,
-            Sale.location_id == location.id,
-            Sale.status == 'completed'
-        ).all()
-
-        refunded_sales = Sale.query.filter(
-            func.date(Sale.sale_date) == today,
-            Sale.location_id == location.id,
-            Sale.status == 'refunded'
-        ).all()
-
-        # Calculate totals
-        total_sales = len(today_sales)
-        gross_sales = sum(Decimal(str(sale.subtotal or 0)) for sale in today_sales)
-        total_discounts = sum(Decimal(str(sale.discount or 0)) for sale in today_sales)
-        total_tax = sum(Decimal(str(sale.tax or 0)) for sale in today_sales)
-        net_sales = sum(Decimal(str(sale.total or 0)) for sale in today_sales)
+        # Today's running totals - a single-row read of the shift ledger
+        totals = ledger_totals(location.id, today)
+
+        total_sales = totals['sale_count']
+        gross_sales = totals['gross_sales']
+        total_discounts = totals['total_discounts']
+        total_tax = totals['total_tax']
+        net_sales = totals['net_sales']
 
         # Payment breakdown
-        total_cash = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'cash')
-        total_card = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'card')
-        total_easypaisa = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'easypaisa')
-        total_jazzcash = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'jazzcash')
-        total_bank = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'bank_transfer')
-        total_credit = sum(Decimal(str(sale.total or 0)) for sale in today_sales if sale.payment_method == 'credit')
-        total_other = net_sales - total_cash - total_card - total_easypaisa - total_jazzcash - total_bank - total_credit
+        total_cash = totals['total_cash']
+        total_card = totals['total_card']
+        total_easypaisa = totals['total_easypaisa']
+        total_jazzcash = totals['total_jazzcash']
+        total_bank = totals['total_bank_transfer']
+        total_credit = totals['total_credit']
+        total_other = totals['total_other']
 
         # Refunds
-        total_refunds = sum(Decimal(str(sale.total or 0)) for sale in refunded_sales)
+        total_refunds = totals['total_refunds']
 
         # Get opening balance
         last_close = DayClose.query.filter_by(
@@ -228,6 +207,9 @@ def close_day():
         # Determine variance status
         variance_status = 'approved' if cash_variance == 0 else 'pending'
 
+        # Freeze the Z-report as it stands at close
+        z_report_data, z_report_checksum = build_z_report_snapshot(location.id, today, totals)
+
         # Create day close record
         day_close = DayClose(
             close_date=today,
@@ -282,6 +264,8 @@ def close_day():
 
             # Z-Report
             z_report_number=z_report_number,
+            z_report_data=z_report_data,
+            z_report_checksum=z_report_checksum,
 
             # Notes
             notes=request.form.get('notes', ''),
@@ -422,36 +406,21 @@ def z_report(close_id):
     """Generate Z-Report (end of day report)"""
     day_close = DayClose.query.get_or_404(close_id)
 
-    # Get hourly sales breakdown
-    sales = Sale.query.filter(
-        func.date(Sale.sale_date) == day_close.close_date,
-        Sale.location_id == day_close.location_id,
-        Sale.status == 'completed'
-    ).all()
-
-    hourly_sales = {}
-    for sale in sales:
-        hour = sale.sale_date.hour
-        if hour not in hourly_sales:
-            hourly_sales[hour] = {'count': 0, 'total': 0}
-        hourly_sales[hour]['count'] += 1
-        hourly_sales[hour]['total'] += float(sale.total or 0)
-
-    # Get top products
-    top_products = db.session.query(
-        SaleItem.product_id,
-        func.sum(SaleItem.quantity).label('qty'),
-        func.sum(SaleItem.subtotal).label('total')
-    ).join(Sale).filter(
-        func.date(Sale.sale_date) == day_close.close_date,
-        Sale.location_id == day_close.location_id,
-        Sale.status == 'completed'
-    ).group_by(SaleItem.product_id).order_by(func.sum(SaleItem.subtotal).desc()).limit(10).all()
+    # Closes made since snapshots were introduced show exactly what was
+    # frozen at close; older ones are rebuilt from the day's sales
+    try:
+        snapshot = load_z_report_snapshot(day_close)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('day_close.detail', close_id=close_id))
+
+    if snapshot is None:
+        snapshot = compute_z_report_sections(day_close.location_id, day_close.close_date)
 
     return render_template('day_close/z_report.html',
                          day_close=day_close,
-                         hourly_sales=hourly_sales,
-                         top_products=top_products)
+                         hourly_sales=snapshot['hourly_sales'],
+                         top_products=snapshot['top_products'])
 
 
 # ============================================================================
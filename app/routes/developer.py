@@ -16,6 +16,8 @@ from app.utils.model_registry import (
     get_models_by_category, get_model_by_tablename,
     get_column_info, get_string_columns, coerce_value
 )
+from app.utils.pagination import keyset_paginate
+from app.utils.db_profile import pool_metrics, replica_engine
 
 bp = Blueprint('developer', __name__)
 
@@ -174,7 +176,7 @@ def db_table(tablename):
     if not model:
         abort(404)
 
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = request.args.get('per_page', 25, type=int)
     search = request.args.get('search', '')
     sort_by = request.args.get('sort', 'id')
@@ -192,12 +194,15 @@ def db_table(tablename):
             filters = [getattr(model, col).ilike(f'%{search}%') for col in string_cols]
             query = query.filter(db.or_(*filters))
 
-    # Sort
-    if sort_by in col_names:
-        sort_col = getattr(model, sort_by)
-        query = query.order_by(sort_col.desc() if sort_dir == 'desc' else sort_col.asc())
+    # Sort (primary key last so every position is unique)
+    descending = sort_dir == 'desc'
+    mapper = model.__mapper__
+    pk_attrs = [getattr(model, mapper.get_property_by_column(col).key) for col in mapper.primary_key]
+    keys = [(attr, descending) for attr in pk_attrs]
+    if sort_by in col_names and sort_by not in [attr.key for attr in pk_attrs]:
+        keys.insert(0, (getattr(model, sort_by), descending))
 
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(query, keys, cursor=cursor, per_page=per_page)
 
     # Limit displayed columns (show first 8 + id)
     display_columns = columns[:8]
@@ -333,3 +338,18 @@ def db_delete(tablename, record_id):
         flash(f'Error deleting record: {str(e)}', 'danger')
 
     return redirect(url_for('developer.db_table', tablename=tablename))
+
+
+# ============================================================
+# ENGINE METRICS
+# ============================================================
+
+@bp.route('/engine')
+@developer_required
+def engine_metrics():
+    """Connection pool state and counters for the primary and replica engines."""
+    engines = {'primary': pool_metrics(db.engine)}
+    replica = replica_engine()
+    if replica is not None:
+        engines['replica'] = pool_metrics(replica)
+    return jsonify(engines)
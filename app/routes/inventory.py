@@ -14,6 +14,8 @@ import io
 from app.models import db, Product, Category, Supplier, StockMovement, SyncQueue, Location, LocationStock, RawMaterial, RawMaterialStock, RawMaterialMovement
 from app.utils.helpers import has_permission, allowed_file
 from app.utils.permissions import permission_required, Permissions
+from app.utils.pagination import keyset_paginate
+from app.services.search_service import search_filter
 import json
 
 bp = Blueprint('inventory', __name__)
@@ -28,7 +30,7 @@ def index():
     from app.utils.location_context import get_current_location
     from sqlalchemy import and_
 
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = current_app.config['ITEMS_PER_PAGE']
     location = get_current_location()
 
@@ -45,13 +47,7 @@ def index():
     if supplier_id:
         query = query.filter_by(supplier_id=supplier_id)
     if search:
-        query = query.filter(
-            db.or_(
-                Product.code.ilike(f'%{search}%'),
-                Product.name.ilike(f'%{search}%'),
-                Product.brand.ilike(f'%{search}%')
-            )
-        )
+        query = query.filter(search_filter('product', search))
 
     # For location-specific stock filtering, we need to join with LocationStock
     if location and stock_status:
@@ -76,7 +72,8 @@ def index():
         elif stock_status == 'in_stock':
             query = query.filter(LocationStock.quantity > LocationStock.reorder_level)
 
-    products = query.order_by(Product.name).paginate(page=page, per_page=per_page, error_out=False)
+    products = keyset_paginate(query, [(Product.name, False), (Product.id, False)],
+                               cursor=cursor, per_page=per_page)
 
     # Add location-specific stock data to each product
     if location:
@@ -5,7 +5,7 @@ Handles CRUD operations for locations (kiosks and warehouses),
 location stock management, and location-related operations.
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 
@@ -164,6 +164,8 @@ def edit(id):
             manager_id = request.form.get('manager_id')
             location.manager_id = int(manager_id) if manager_id else None
 
+            old_charge = (location.kiosk_charge_type, location.kiosk_charge_rate)
+
             if location.is_kiosk:
                 location.can_sell = request.form.get('can_sell') == 'on'
 
@@ -178,6 +180,20 @@ def edit(id):
                     location.kiosk_charge_rate = 0
 
             db.session.commit()
+
+            # Kiosk charge changed - rebuild this location's cost matrix in bulk
+            if (location.kiosk_charge_type, location.kiosk_charge_rate) != old_charge:
+                try:
+                    from app.services.cost_matrix_service import rebuild_location_costs
+                    rebuild_location_costs(
+                        location_ids=[location.id],
+                        user_id=current_user.id,
+                        reason=f'Kiosk charge changed for {location.code}'
+                    )
+                except Exception as cost_error:
+                    db.session.rollback()
+                    current_app.logger.error(f"Location cost rebuild failed: {cost_error}")
+
             flash('Location updated successfully.', 'success')
             return redirect(url_for('locations.view', id=id))
 
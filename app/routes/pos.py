@@ -12,6 +12,20 @@ from app.utils.helpers import generate_sale_number, has_permission
 from app.utils.pdf_utils import generate_receipt_pdf
 from app.utils.permissions import permission_required, Permissions
 from app.utils.location_context import get_current_location, location_required, get_or_create_location_stock
+from app.services.catalog_service import catalog_snapshot, catalog_changes
+from app.services.checkout_service import (
+    CheckoutError, checkout, replay_offline_sales, normalize_idempotency_key,
+    find_sale_by_key, sale_result, deduct_raw_materials_for_sale, get_attar_oil_availability
+)
+from app.services.customer_service import lookup_customer_profile, invalidate_customer_profile
+from app.services.customer_search_service import customer_search_filter
+from app.services.search_service import search_filter
+from app.services.held_sale_service import (
+    hold_sale as park_sale, list_held_sales, get_held_sale, delete_held_sale as remove_held_sale,
+    serialize_held_sale, import_session_holds
+)
+from app.services.shift_ledger_service import record_sale_edit, record_refund, record_return, ledger_entry
+from sqlalchemy.exc import IntegrityError
 import json
 
 # Try to import Return models (may not exist in all setups)
@@ -24,164 +38,6 @@ except ImportError:
 bp = Blueprint('pos', __name__)
 
 
-def deduct_raw_materials_for_sale(product, quantity, location_id, sale_id, sale_number, user_id):
-    """
-    Deduct raw materials from location-specific stock for a made-to-order sale.
-    Returns: {'success': bool, 'message': str, 'deductions': list}
-    """
-    from app.models import RawMaterialMovement
-    from decimal import Decimal
-
-    recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
-    if not recipe:
-        return {'success': False, 'message': f'No recipe found for {product.name}', 'deductions': []}
-
-    output_ml = float(recipe.output_size_ml or 0)
-    deductions = []
-
-    for ingredient in recipe.ingredients:
-        raw_material = ingredient.raw_material
-        if not raw_material:
-            continue
-
-        if ingredient.is_packaging:
-            # Bottle: 1 per unit produced
-            required_qty = quantity
-        else:
-            # Oil: calculate based on percentage and output size
-            percentage = float(ingredient.percentage or 100) / 100
-            required_qty = output_ml * percentage * quantity
-
-        # Get location-specific stock
-        stock = RawMaterialStock.query.filter_by(
-            raw_material_id=raw_material.id,
-            location_id=location_id
-        ).first()
-
-        if not stock:
-            return {
-                'success': False,
-                'message': f'No stock record for {raw_material.name} at this location',
-                'deductions': []
-            }
-
-        available = float(stock.available_quantity)
-        if available < required_qty:
-            return {
-                'success': False,
-                'message': f'Insufficient {raw_material.name}: need {required_qty:.2f}, have {available:.2f}',
-                'deductions': []
-            }
-
-        # Deduct from location stock
-        stock.quantity = Decimal(str(stock.quantity)) - Decimal(str(required_qty))
-        stock.last_movement_at = datetime.utcnow()
-
-        # Create movement record
-        movement = RawMaterialMovement(
-            raw_material_id=raw_material.id,
-            location_id=location_id,
-            user_id=user_id,
-            movement_type='pos_consumption',
-            quantity=-required_qty,
-            reference=sale_number,
-            notes=f'Made-to-order sale: {product.name} x{quantity}'
-        )
-        db.session.add(movement)
-
-        deductions.append({
-            'material_id': raw_material.id,
-            'material_name': raw_material.name,
-            'quantity': required_qty,
-            'unit': 'pcs' if ingredient.is_packaging else 'ml'
-        })
-
-    return {'success': True, 'message': 'Raw materials deducted', 'deductions': deductions}
-
-
-def get_attar_oil_availability(product, location_id):
-    """
-    Check oil availability for made-to-order attar products.
-    Returns dict with oil availability info or None if not made-to-order.
-    """
-    if not product.is_made_to_order:
-        return None
-
-    # Get the recipe for this product
-    recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
-    if not recipe:
-        return None
-
-    # Check if recipe can be produced at kiosk
-    if not recipe.can_produce_at_kiosk:
-        return None
-
-    # Get oil ingredients (non-packaging)
-    oil_ingredients = [ing for ing in recipe.ingredients if not ing.is_packaging]
-    if not oil_ingredients:
-        return None
-
-    # Calculate oil requirement per unit
-    output_ml = float(recipe.output_size_ml or 0)
-    # For attars oil_percentage is 100%, for perfumes it's a fraction (e.g. 35%)
-    oil_percentage = float(recipe.oil_percentage or 100) / 100
-    oil_required_per_unit = output_ml * oil_percentage
-
-    # Check oil availability at location
-    oil_info = []
-    min_can_produce = float('inf')
-
-    for ingredient in oil_ingredients:
-        raw_material = ingredient.raw_material
-        if not raw_material:
-            continue
-
-        # Get stock at this location
-        stock = RawMaterialStock.query.filter_by(
-            raw_material_id=raw_material.id,
-            location_id=location_id
-        ).first()
-
-        available_ml = float(stock.available_quantity) if stock else 0
-
-        # For single oil: full output_ml per unit
-        # For blended: percentage of output_ml
-        # For perfume: percentage of (output_ml * oil_percentage)
-        percentage = float(ingredient.percentage or 100) / 100
-        required_per_unit = output_ml * oil_percentage * percentage
-
-        # How many units can be made with this oil
-        can_produce = int(available_ml / required_per_unit) if required_per_unit > 0 else 0
-        min_can_produce = min(min_can_produce, can_produce)
-
-        oil_info.append({
-            'oil_id': raw_material.id,
-            'oil_code': raw_material.code,
-            'oil_name': raw_material.name,
-            'available_ml': round(available_ml, 2),
-            'required_per_unit': round(required_per_unit, 2),
-            'can_produce': can_produce
-        })
-
-    if min_can_produce == float('inf'):
-        min_can_produce = 0
-
-    # Return primary oil info (first oil for display)
-    primary_oil = oil_info[0] if oil_info else None
-
-    return {
-        'is_made_to_order': True,
-        'recipe_type': recipe.recipe_type,
-        'output_size_ml': output_ml,
-        'oil_name': primary_oil['oil_name'] if primary_oil else 'Unknown',
-        'oil_code': primary_oil['oil_code'] if primary_oil else '',
-        'oil_available_ml': primary_oil['available_ml'] if primary_oil else 0,
-        'oil_required_per_unit': oil_required_per_unit,
-        'max_can_produce': min_can_produce,
-        'oils': oil_info
-    }
-
-
 @bp.route('/')
 @login_required
 @permission_required(Permissions.POS_VIEW)
@@ -246,15 +102,7 @@ def search_products():
         # Normal search by code, barcode, name, or brand
         if len(query) < 2:
             return jsonify({'products': []})
-        filter_condition = db.and_(
-            Product.is_active == True,
-            db.or_(
-                Product.code.ilike(f'%{query}%'),
-                Product.barcode.ilike(f'%{query}%'),
-                Product.name.ilike(f'%{query}%'),
-                Product.brand.ilike(f'%{query}%')
-            )
-        )
+        filter_condition = db.and_(Product.is_active == True, search_filter('product', query))
 
     # Search by code, barcode, name, or brand
     if location:
@@ -373,6 +221,41 @@ def get_product(product_id):
     return jsonify(result)
 
 
+@bp.route('/catalog')
+@login_required
+@permission_required(Permissions.POS_VIEW)
+def catalog():
+    """Versioned product/price/stock snapshot for offline search and scanning"""
+    location = get_current_location()
+    snapshot = catalog_snapshot(location.id if location else None)
+
+    if snapshot.etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = current_app.response_class(snapshot.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(snapshot.body, mimetype='application/json')
+
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    response.vary.add('Cookie')
+    return response
+
+
+@bp.route('/catalog/changes')
+@login_required
+@permission_required(Permissions.POS_VIEW)
+def catalog_delta():
+    """Catalog rows changed since the version the terminal holds"""
+    location = get_current_location()
+    changes = catalog_changes(location.id if location else None, request.args.get('since'))
+    if changes is None:
+        return jsonify({'reload': True, 'error': 'Unknown catalog version'}), 409
+    return jsonify(changes)
+
+
 def generate_transfer_number():
     """Generate unique transfer number for reorders"""
     today = date.today().strftime('%Y%m%d')
@@ -547,277 +430,67 @@ def complete_sale():
     try:
         data = request.get_json()
 
-        # Validate data
-        items = data.get('items', [])
-        if not items:
-            return jsonify({'success': False, 'error': 'No items in cart'}), 400
+        # A retried request (lost response, offline queue) carries the key of
+        # the original attempt; answer it with the sale already recorded
+        key = normalize_idempotency_key(
+            request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        )
+        existing = find_sale_by_key(key)
+        if existing:
+            return jsonify(sale_result(existing, replayed=True))
 
         # Get current location for multi-kiosk support
         location = get_current_location()
 
-        # Handle backdate sales (admin/manager only)
-        sale_date = None
-        backdate_str = data.get('sale_date')
-        if backdate_str:
-            # Check if user has permission to backdate
-            if current_user.role not in ['admin', 'manager']:
-                return jsonify({'success': False, 'error': 'Only admin/manager can backdate sales'}), 403
-            try:
-                sale_date = datetime.strptime(backdate_str, '%Y-%m-%d')
-                # Don't allow future dates
-                if sale_date.date() > date.today():
-                    return jsonify({'success': False, 'error': 'Cannot create sales with future dates'}), 400
-            except ValueError:
-                return jsonify({'success': False, 'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-
-        # Create sale
-        sale = Sale(
-            sale_number=generate_sale_number(),
-            user_id=current_user.id,
-            customer_id=data.get('customer_id'),
-            location_id=location.id if location else None,  # Multi-kiosk support
-            subtotal=Decimal(str(data.get('subtotal', 0))),
-            discount=Decimal(str(data.get('discount', 0))),
-            discount_type=data.get('discount_type', 'amount'),
-            tax=Decimal(str(data.get('tax', 0))),
-            total=Decimal(str(data.get('total', 0))),
-            payment_method=data.get('payment_method', 'cash'),
-            amount_paid=Decimal(str(data.get('amount_paid', 0))),
-            notes=data.get('notes', '')
-        )
-
-        # Set sale date if backdating
-        if sale_date:
-            sale.sale_date = sale_date
-
-        # Calculate amount due
-        sale.amount_due = sale.total - sale.amount_paid
-        if sale.amount_due > 0:
-            sale.payment_status = 'partial'
-        else:
-            sale.payment_status = 'paid'
-
-        db.session.add(sale)
-        db.session.flush()  # Get sale ID
-
-        # Add sale items and update stock
-        for item_data in items:
-            product = Product.query.get(item_data['product_id'])
-            if not product:
-                db.session.rollback()
-                return jsonify({'success': False, 'error': f'Product {item_data["product_id"]} not found'}), 404
-
-            quantity = int(item_data['quantity'])
-
-            # For made-to-order products, check oil availability instead of product stock
-            if product.is_made_to_order and location:
-                oil_info = get_attar_oil_availability(product, location.id)
-                if oil_info:
-                    if oil_info['max_can_produce'] < quantity:
-                        db.session.rollback()
-                        return jsonify({
-                            'success': False,
-                            'error': f'Insufficient oil for {product.name}. Can only make {oil_info["max_can_produce"]} units (need {oil_info["oil_required_per_unit"]}ml per unit, have {oil_info["oil_available_ml"]}ml of {oil_info["oil_name"]})'
-                        }), 400
-                    # Skip regular stock check for made-to-order products
-                    location_stock = None
-                else:
-                    # No recipe found - treat as regular product
-                    location_stock = LocationStock.query.filter_by(
-                        location_id=location.id,
-                        product_id=product.id
-                    ).first()
-                    available_qty = location_stock.available_quantity if location_stock else 0
-                    if available_qty < quantity:
-                        db.session.rollback()
-                        return jsonify({
-                            'success': False,
-                            'error': f'Insufficient stock for {product.name} at this location. Available: {available_qty}'
-                        }), 400
-            elif location:
-                # Regular product - check LocationStock for multi-kiosk
-                location_stock = LocationStock.query.filter_by(
-                    location_id=location.id,
-                    product_id=product.id
-                ).first()
-                available_qty = location_stock.available_quantity if location_stock else 0
-
-                if available_qty < quantity:
-                    db.session.rollback()
-                    return jsonify({
-                        'success': False,
-                        'error': f'Insufficient stock for {product.name} at this location. Available: {available_qty}'
-                    }), 400
-            else:
-                # Fallback: use product.quantity
-                location_stock = None
-                if product.quantity < quantity:
-                    db.session.rollback()
-                    return jsonify({
-                        'success': False,
-                        'error': f'Insufficient stock for {product.name}. Available: {product.quantity}'
-                    }), 400
-
-            # Create sale item
-            sale_item = SaleItem(
-                sale_id=sale.id,
-                product_id=product.id,
-                quantity=quantity,
-                unit_price=Decimal(str(item_data['unit_price'])),
-                discount=Decimal(str(item_data.get('discount', 0))),
-                subtotal=Decimal(str(item_data['subtotal']))
-            )
-            db.session.add(sale_item)
-
-            # Update stock - location-aware
-            # For made-to-order products, don't deduct from product stock (raw materials are deducted instead)
-            if product.is_made_to_order:
-                # Auto-deduct raw materials for made-to-order products
-                recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
-                if recipe:
-                    # Deduct from location-specific raw material stock
-                    deduction_result = deduct_raw_materials_for_sale(
-                        product, quantity, location.id if location else None, sale.id, sale.sale_number, current_user.id
-                    )
-                    if not deduction_result['success']:
-                        db.session.rollback()
-                        return jsonify({
-                            'success': False,
-                            'error': deduction_result['message']
-                        }), 400
-
-                # Create stock movement record (for tracking, even though no physical stock deducted)
-                stock_movement = StockMovement(
-                    product_id=product.id,
-                    user_id=current_user.id,
-                    movement_type='sale',
-                    quantity=-quantity,
-                    reference=sale.sale_number,
-                    notes=f'Made-to-order sale {sale.sale_number}',
-                    location_id=location.id if location else None
-                )
-                db.session.add(stock_movement)
-            else:
-                # Regular product - deduct from stock
-                if location and location_stock:
-                    # Update LocationStock
-                    location_stock.quantity -= quantity
-                    location_stock.last_movement_at = datetime.utcnow()
-                elif not location:
-                    # Fallback: update product.quantity
-                    product.quantity -= quantity
-
-                # Create stock movement record with location
-                stock_movement = StockMovement(
-                    product_id=product.id,
-                    user_id=current_user.id,
-                    movement_type='sale',
-                    quantity=-quantity,
-                    reference=sale.sale_number,
-                    notes=f'Sale {sale.sale_number}',
-                    location_id=location.id if location else None
-                )
-                db.session.add(stock_movement)
-
-        # Handle split payments
-        payments_data = data.get('payments', [])
-        is_split = len(payments_data) > 1
-
-        if is_split:
-            # Multiple payment methods
-            sale.is_split_payment = True
-            sale.payment_method = 'split'  # Indicate split payment
-
-            total_paid = Decimal('0')
-            for idx, pmt in enumerate(payments_data, 1):
-                pmt_amount = Decimal(str(pmt.get('amount', 0)))
-                total_paid += pmt_amount
-                payment = Payment(
-                    sale_id=sale.id,
-                    amount=pmt_amount,
-                    payment_method=pmt.get('method', 'cash'),
-                    reference_number=pmt.get('reference', ''),
-                    notes=pmt.get('notes', ''),
-                    payment_order=idx
-                )
-                db.session.add(payment)
-
-            # Recalculate amount_paid from actual payments
-            sale.amount_paid = total_paid
-            sale.amount_due = sale.total - total_paid
-            sale.payment_status = 'paid' if sale.amount_due <= 0 else 'partial'
-
-        elif sale.amount_paid > 0:
-            # Single payment (existing logic)
-            payment = Payment(
-                sale_id=sale.id,
-                amount=sale.amount_paid,
-                payment_method=sale.payment_method,
-                reference_number=data.get('reference_number', ''),
-                notes=data.get('payment_notes', ''),
-                payment_order=1
-            )
-            db.session.add(payment)
+        result = checkout(data, current_user, location, idempotency_key=key)
+        db.session.commit()
+        invalidate_customer_profile(data.get('customer_id'))
+        return jsonify(result)
 
-        # Queue for sync
-        sync_item = SyncQueue(
-            table_name='sales',
-            operation='insert',
-            record_id=sale.id,
-            data_json=json.dumps({
-                'sale_id': sale.id,
-                'sale_number': sale.sale_number
-            })
-        )
-        db.session.add(sync_item)
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': e.message}), e.status_code
 
-        # Award loyalty points if customer is selected
-        points_earned = 0
-        new_badges = []
-        completed_challenges = []
-        if sale.customer_id:
-            customer = Customer.query.get(sale.customer_id)
-            if customer:
-                # Award 1 point per Rs. 100 spent
-                points_earned = customer.add_loyalty_points(float(sale.total))
-
-                # Check and award badges (gamified loyalty)
-                try:
-                    from app.routes.loyalty import check_and_award_badges, update_challenge_progress
-                    new_badges = check_and_award_badges(sale.customer_id, sale)
-                    completed_challenges = update_challenge_progress(sale.customer_id, sale)
-                except Exception as badge_error:
-                    current_app.logger.error(f"Badge checking error: {badge_error}")
+    except IntegrityError:
+        # Same key committed by a concurrent retry
+        db.session.rollback()
+        existing = find_sale_by_key(key)
+        if existing:
+            return jsonify(sale_result(existing, replayed=True))
+        return jsonify({'success': False, 'error': 'Sale could not be saved, please retry'}), 409
 
-        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        # Get customer loyalty info for response
-        customer_info = None
-        if sale.customer_id:
-            customer = Customer.query.get(sale.customer_id)
-            if customer:
-                customer_info = {
-                    'points_earned': points_earned,
-                    'total_points': customer.loyalty_points,
-                    'loyalty_tier': customer.loyalty_tier,
-                    'points_value': customer.points_value_pkr,
-                    'new_badges': new_badges,
-                    'completed_challenges': completed_challenges
-                }
 
-        return jsonify({
-            'success': True,
-            'sale_id': sale.id,
-            'sale_number': sale.sale_number,
-            'total': float(sale.total),
-            'change': float(sale.amount_paid - sale.total),
-            'loyalty': customer_info
-        })
+@bp.route('/replay-sales', methods=['POST'])
+@login_required
+@permission_required(Permissions.POS_CREATE_SALE)
+def replay_sales():
+    """Replay a batch of sales queued while the terminal was offline"""
+    data = request.get_json(silent=True) or {}
+    queued = data.get('sales')
+    if not isinstance(queued, list):
+        return jsonify({'success': False, 'error': 'Expected a list of sales'}), 400
 
+    try:
+        results = replay_offline_sales(queued, current_user, get_current_location())
+    except CheckoutError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': e.message}), e.status_code
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    return jsonify({
+        'success': True,
+        'created': sum(1 for r in results if r['status'] == 'created'),
+        'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+        'rejected': sum(1 for r in results if r['status'] == 'rejected'),
+        'results': results
+    })
+
 
 @bp.route('/print-receipt/<int:sale_id>')
 @login_required
@@ -846,8 +519,9 @@ def sales_list():
     """List all sales - filtered by location for non-global admins"""
     from datetime import datetime, timedelta
     from app.models import Location
+    from app.utils.pagination import keyset_paginate
 
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = current_app.config['ITEMS_PER_PAGE']
 
     # Filter parameters
@@ -855,7 +529,7 @@ def sales_list():
     to_date_str = request.args.get('to_date')
     location_filter = request.args.get('location_id', type=int)
 
-    query = Sale.query.order_by(Sale.sale_date.desc())
+    query = Sale.query
 
     # Location filtering
     locations = []
@@ -884,7 +558,8 @@ def sales_list():
         except ValueError:
             pass
 
-    sales = query.paginate(page=page, per_page=per_page, error_out=False)
+    sales = keyset_paginate(query, [(Sale.sale_date, True), (Sale.id, True)],
+                            cursor=cursor, per_page=per_page)
 
     # Get user's location for display
     user_location = None
@@ -935,6 +610,9 @@ def refund_sale(sale_id):
                 )
                 db.session.add(stock_movement)
 
+        # Move the sale from the day's sales to its refunds
+        record_refund(sale)
+
         # Update sale status
         sale.status = 'refunded'
 
@@ -948,6 +626,7 @@ def refund_sale(sale_id):
         db.session.add(sync_item)
 
         db.session.commit()
+        invalidate_customer_profile(sale.customer_id)
 
         return jsonify({'success': True, 'message': 'Sale refunded successfully'})
 
@@ -972,6 +651,8 @@ def edit_sale(sale_id):
         try:
             # Track changes for audit
             changes = []
+            ledger_before = ledger_entry(sale)
+            previous_customer_id = sale.customer_id
 
             # Update customer
             new_customer_id = request.form.get('customer_id', type=int)
@@ -1051,6 +732,7 @@ def edit_sale(sale_id):
 
             # Recalculate sale totals
             sale.calculate_totals()
+            record_sale_edit(ledger_before, sale)
 
             # Add edit note with timestamp
             edit_note = f"\n[Edited by {current_user.full_name} on {datetime.now().strftime('%Y-%m-%d %H:%M')}]"
@@ -1063,6 +745,7 @@ def edit_sale(sale_id):
                 sale.notes = edit_note.strip()
 
             db.session.commit()
+            invalidate_customer_profile(previous_customer_id, sale.customer_id)
             flash('Sale updated successfully.', 'success')
             return redirect(url_for('pos.sale_details', sale_id=sale_id))
 
@@ -1078,45 +761,92 @@ def edit_sale(sale_id):
 @permission_required(Permissions.POS_HOLD_SALE)
 def hold_sale():
     """Hold a sale for later"""
-    data = request.get_json()
+    data = request.get_json() or {}
+    location = get_current_location()
+    location_id = location.id if location else None
 
-    # Store in session
-    if 'held_sales' not in session:
-        session['held_sales'] = []
+    # Parked carts live in the held_sales table, not the cookie session
+    import_session_holds(session, current_user.id, location_id)
+    held = park_sale(current_user.id, location_id, data)
+    db.session.commit()
 
-    session['held_sales'].append({
-        'timestamp': datetime.now().isoformat(),
-        'items': data.get('items', []),
-        'customer_id': data.get('customer_id'),
-        'notes': data.get('notes', '')
-    })
-    session.modified = True
+    return jsonify({'success': True, 'message': 'Sale held successfully', 'id': held.id})
 
-    return jsonify({'success': True, 'message': 'Sale held successfully'})
+
+def _held_sale_scope():
+    """(location_id, user_id) for held-sale lookups; ?scope=location lists every cashier's carts"""
+    location = get_current_location()
+    location_id = location.id if location else None
+    user_id = None if request.args.get('scope') == 'location' else current_user.id
+    return location_id, user_id
 
 
 @bp.route('/retrieve-held-sales')
 @login_required
 @permission_required(Permissions.POS_VIEW)
 def retrieve_held_sales():
-    """Get list of held sales"""
-    held_sales = session.get('held_sales', [])
-    return jsonify({'sales': held_sales})
+    """Get list of held sales, or one of them with ?index= or ?id="""
+    location_id, user_id = _held_sale_scope()
+    if import_session_holds(session, current_user.id, location_id):
+        db.session.commit()
+
+    held_id = request.args.get('id', type=int)
+    index = request.args.get('index', type=int)
+    if held_id is not None or index is not None:
+        held = get_held_sale(location_id, user_id, held_id=held_id, index=index)
+        if not held:
+            return jsonify({'success': False, 'error': 'Sale not found'}), 404
+        return jsonify({'sale': serialize_held_sale(held, index)})
+
+    held_sales = list_held_sales(location_id, user_id)
+    return jsonify({'sales': [serialize_held_sale(held, i) for i, held in enumerate(held_sales)]})
+
+
+@bp.route('/held-sales/<int:held_id>')
+@login_required
+@permission_required(Permissions.POS_VIEW)
+def get_held_sale_by_id(held_id):
+    """Get one held sale parked at this location"""
+    location = get_current_location()
+    held = get_held_sale(location.id if location else None, held_id=held_id)
+    if not held:
+        return jsonify({'success': False, 'error': 'Sale not found'}), 404
+    return jsonify({'sale': serialize_held_sale(held)})
 
 
 @bp.route('/delete-held-sale/<int:index>', methods=['POST'])
 @login_required
 @permission_required(Permissions.POS_HOLD_SALE)
 def delete_held_sale(index):
-    """Delete a held sale"""
-    if 'held_sales' in session and 0 <= index < len(session['held_sales']):
-        session['held_sales'].pop(index)
-        session.modified = True
+    """Delete a held sale by its position in retrieve-held-sales"""
+    location_id, user_id = _held_sale_scope()
+    imported = import_session_holds(session, current_user.id, location_id)
+    held = get_held_sale(location_id, user_id, index=index)
+    if held:
+        remove_held_sale(held)
+        db.session.commit()
         return jsonify({'success': True})
 
+    if imported:
+        db.session.commit()
     return jsonify({'success': False, 'error': 'Sale not found'}), 404
 
 
+@bp.route('/held-sales/<int:held_id>/delete', methods=['POST'])
+@login_required
+@permission_required(Permissions.POS_HOLD_SALE)
+def delete_held_sale_by_id(held_id):
+    """Delete a held sale parked at this location (recalled on any terminal)"""
+    location = get_current_location()
+    held = get_held_sale(location.id if location else None, held_id=held_id)
+    if not held:
+        return jsonify({'success': False, 'error': 'Sale not found'}), 404
+
+    remove_held_sale(held)
+    db.session.commit()
+    return jsonify({'success': True})
+
+
 @bp.route('/close-day-summary')
 @login_required
 @permission_required(Permissions.POS_CLOSE_DAY)
@@ -1289,166 +1019,16 @@ def close_day():
 def customer_lookup(phone):
     """Look up customer by phone and get their purchase history"""
     try:
-        customer = Customer.query.filter_by(phone=phone).first()
-        
-        if not customer:
+        profile = lookup_customer_profile(phone)
+        if not profile:
             return jsonify({'success': False, 'message': 'Customer not found'})
-        
-        # Get last order
-        last_sale = Sale.query.filter_by(customer_id=customer.id)\
-            .order_by(Sale.sale_date.desc()).first()
-        
-        last_order = None
-        if last_sale:
-            last_order = {
-                'sale_number': last_sale.sale_number,
-                'sale_date': last_sale.sale_date.strftime('%d %b %Y %H:%M'),
-                'days_ago': (datetime.utcnow() - last_sale.sale_date).days,
-                'total': float(last_sale.total),
-                'payment_method': last_sale.payment_method,
-                'items': [
-                    {
-                        'product_name': item.product.name if item.product else 'Unknown',
-                        'quantity': item.quantity,
-                        'unit_price': float(item.unit_price),
-                        'subtotal': float(item.subtotal)
-                    }
-                    for item in last_sale.items.all()
-                ]
-            }
-        
-        # Get purchase history (top 5 products)
-        from sqlalchemy import func, desc
-        top_products = db.session.query(
-            Product.id,
-            Product.name,
-            Product.image_url,
-            func.count(SaleItem.id).label('purchase_count'),
-            func.sum(SaleItem.quantity).label('total_quantity')
-        ).select_from(Product)\
-        .join(SaleItem, SaleItem.product_id == Product.id)\
-        .join(Sale, Sale.id == SaleItem.sale_id)\
-        .filter(Sale.customer_id == customer.id)\
-        .group_by(Product.id, Product.name, Product.image_url)\
-        .order_by(desc('purchase_count'))\
-        .limit(5).all()
-        
-        frequently_purchased = [
-            {
-                'product_id': p.id,
-                'product_name': p.name,
-                'image_url': p.image_url,
-                'purchase_count': p.purchase_count,
-                'total_quantity': p.total_quantity
-            }
-            for p in top_products
-        ]
-        
-        # Get recommendations (products similar customers bought)
-        recommendations = get_product_recommendations(customer.id)
-
-        # Calculate customer stats
-        total_orders = customer.sales.count()
-        avg_order_value = float(customer.total_purchases) / total_orders if total_orders > 0 else 0
-
-        # Check for birthday
-        is_birthday = False
-        birthday_str = None
-        if customer.birthday:
-            today = datetime.now().date()
-            is_birthday = (customer.birthday.month == today.month and customer.birthday.day == today.day)
-            birthday_str = customer.birthday.strftime('%d %b')
-
-        # Get preferred payment method
-        preferred_payment = db.session.query(
-            Sale.payment_method,
-            db.func.count(Sale.id).label('count')
-        ).filter(Sale.customer_id == customer.id)\
-        .group_by(Sale.payment_method)\
-        .order_by(db.desc('count')).first()
 
-        return jsonify({
-            'success': True,
-            'customer': {
-                'id': customer.id,
-                'name': customer.name,
-                'phone': customer.phone,
-                'email': customer.email,
-                'address': customer.address,
-                'loyalty_points': customer.loyalty_points,
-                'loyalty_tier': customer.loyalty_tier,
-                'loyalty_tier_color': customer.loyalty_tier_color,
-                'points_value_pkr': customer.points_value_pkr,
-                'points_to_next_tier': customer.points_to_next_tier,
-                'total_purchases': float(customer.total_purchases),
-                'customer_type': customer.customer_type,
-                'account_balance': float(customer.account_balance or 0),
-                'notes': customer.notes,
-                'birthday': birthday_str,
-                'is_birthday': is_birthday
-            },
-            'stats': {
-                'total_orders': total_orders,
-                'avg_order_value': round(avg_order_value, 2),
-                'preferred_payment': preferred_payment[0] if preferred_payment else 'cash',
-                'member_since': customer.created_at.strftime('%b %Y') if customer.created_at else None
-            },
-            'last_order': last_order,
-            'frequently_purchased': frequently_purchased,
-            'recommendations': recommendations
-        })
-    
+        return jsonify({'success': True, **profile})
+
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def get_product_recommendations(customer_id, limit=5):
-    """Get intelligent product recommendations based on purchase history"""
-    from sqlalchemy import func, desc, and_
-
-    try:
-        # Get products purchased by this customer
-        customer_products = db.session.query(Product.id)\
-            .select_from(Product)\
-            .join(SaleItem, SaleItem.product_id == Product.id)\
-            .join(Sale, Sale.id == SaleItem.sale_id)\
-            .filter(Sale.customer_id == customer_id).distinct().subquery()
-
-        # Get popular products not yet purchased by this customer
-        recommendations = db.session.query(
-            Product.id,
-            Product.name,
-            Product.selling_price,
-            Product.image_url,
-            func.count(Sale.id).label('popularity')
-        ).select_from(Product)\
-        .join(SaleItem, SaleItem.product_id == Product.id)\
-        .join(Sale, Sale.id == SaleItem.sale_id)\
-        .filter(
-            and_(
-                Product.is_active == True,
-                Product.id.notin_(customer_products),  # Exclude already purchased
-                Sale.customer_id != customer_id  # From other customers
-            )
-        ).group_by(Product.id, Product.name, Product.selling_price, Product.image_url)\
-        .order_by(desc('popularity'))\
-        .limit(limit).all()
-
-        return [
-            {
-                'product_id': r.id,
-                'product_name': r.name,
-                'selling_price': float(r.selling_price),
-                'image_url': r.image_url,
-                'popularity': r.popularity
-            }
-            for r in recommendations
-        ]
-    except Exception:
-        # Return empty list if recommendations fail
-        return []
-
-
 # ============================================================
 # RETURNS FROM POS
 # ============================================================
@@ -1467,8 +1047,7 @@ def search_sales_for_return():
     sales = Sale.query.filter(
         db.or_(
             Sale.sale_number.ilike(f'%{query}%'),
-            Sale.customer.has(Customer.phone.ilike(f'%{query}%')),
-            Sale.customer.has(Customer.name.ilike(f'%{query}%'))
+            Sale.customer.has(customer_search_filter(query))
         ),
         Sale.status.in_(['completed', 'partial_return'])
     ).order_by(Sale.sale_date.desc()).limit(10).all()
@@ -1654,6 +1233,7 @@ def process_return():
                     )
                     db.session.add(credit)
 
+            record_return(ret)
             return_number = ret.return_number
 
         else:
@@ -1684,9 +1264,11 @@ def process_return():
                     db.session.add(movement)
 
         # Update sale status if fully returned
-        sale.status = 'partial_return'
+        if sale.status == 'completed':
+            sale.status = 'partial_return'
 
         db.session.commit()
+        invalidate_customer_profile(sale.customer_id)
 
         return jsonify({
             'success': True,
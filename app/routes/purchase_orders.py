@@ -17,6 +17,7 @@ from app.services.reorder_service import (
     generate_po_number
 )
 from app.utils.permissions import permission_required, Permissions
+from app.services.search_service import search_filter
 
 bp = Blueprint('purchase_orders', __name__, url_prefix='/purchase-orders')
 
@@ -38,12 +39,7 @@ def index():
     query = PurchaseOrder.query
 
     if search:
-        query = query.filter(
-            db.or_(
-                PurchaseOrder.po_number.ilike(f'%{search}%'),
-                PurchaseOrder.supplier.has(Supplier.name.ilike(f'%{search}%'))
-            )
-        )
+        query = query.filter(search_filter('purchase_order', search))
     if status:
         query = query.filter_by(status=status)
     if supplier_id:
@@ -11,6 +11,8 @@ from app.models import db, Sale, SaleItem, Product, Customer, StockMovement, Loc
 from app.models_extended import Return, ReturnItem, CustomerCredit
 from app.utils.permissions import permission_required, Permissions
 from app.utils.feature_flags import feature_required, Features
+from app.services.batch_allocation_service import restock_sale_batches
+from app.services.shift_ledger_service import record_return
 
 bp = Blueprint('returns', __name__)
 
@@ -213,6 +215,7 @@ def complete(return_id):
 
     try:
         # Process items
+        batch_lines = {}
         for item in ret.items:
             if item.restock:
                 # Restock to location stock if location is set
@@ -233,6 +236,8 @@ def complete(return_id):
                             quantity=item.quantity
                         )
                         db.session.add(location_stock)
+                    if ret.sale and ret.sale.location_id == location_id:
+                        batch_lines[item.product_id] = batch_lines.get(item.product_id, 0) + item.quantity
                 else:
                     # Fallback to global product quantity for non-location users
                     product = Product.query.get(item.product_id)
@@ -251,6 +256,11 @@ def complete(return_id):
                 )
                 db.session.add(movement)
 
+        # Put batch-tracked units back into the batches the sale drew from
+        if batch_lines:
+            restock_sale_batches(ret.sale_id, batch_lines, current_user.id,
+                                 reference_id=ret.id, reason=f'Return {ret.return_number}')
+
         # Process credit if applicable
         if ret.return_type == 'credit' and ret.credit_issued > 0:
             customer = ret.customer
@@ -276,6 +286,7 @@ def complete(return_id):
 
         ret.status = 'completed'
         ret.completed_at = datetime.utcnow()
+        record_return(ret)
         db.session.commit()
 
         return jsonify({'success': True, 'message': 'Return completed successfully'})
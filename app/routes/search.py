@@ -1,12 +1,14 @@
 """
 Global Search API
-Provides unified search across pages, products, customers, and suppliers
+Provides unified search across pages, products, customers, suppliers,
+purchase orders, sales and transfers
 """
 
 from flask import Blueprint, jsonify, request
 from flask_login import login_required, current_user
-from sqlalchemy import or_
-from app.models import db, Product, Customer, Supplier
+from app.models import Product, Customer, Supplier, PurchaseOrder, Sale, StockTransfer
+from app.services.customer_search_service import search_customers
+from app.services.search_service import load_ranked, search
 
 bp = Blueprint('search', __name__, url_prefix='/api')
 
@@ -43,94 +45,133 @@ NAVIGATION_PAGES = [
 ]
 
 
+ADMIN_ONLY_PAGES = ('/settings', '/features')
+
+# Lowercased name + keywords, computed once instead of per request and page
+_PAGE_HAYSTACKS = [
+    (page, f"{page['name']} {page.get('keywords', '')}".lower())
+    for page in NAVIGATION_PAGES
+]
+
+# Kinds searched through the full-text index, and the permission each needs
+INDEXED_KINDS = {
+    'products': ('product', None),
+    'suppliers': ('supplier', None),
+    'purchase_orders': ('purchase_order', 'po.view'),
+    'sales': ('sale', 'pos.view'),
+    'transfers': ('transfer', 'transfer.view'),
+}
+
+
+def _allowed(permission, granted):
+    """Permission check memoized for the request"""
+    if permission is None:
+        return True
+    if permission not in granted:
+        granted[permission] = current_user.has_permission(permission)
+    return granted[permission]
+
+
+def _looks_like_phone(query):
+    digits = sum(ch.isdigit() for ch in query)
+    return digits >= 4 and digits >= len(query.replace(' ', '').replace('-', '').replace('+', '')) - 1
+
+
 @bp.route('/search')
 @login_required
 def global_search():
-    """Global search across pages, products, customers, suppliers"""
+    """Global search across pages and indexed records"""
     query = request.args.get('q', '').strip()
+    results = {'pages': [], 'products': [], 'customers': [], 'suppliers': [],
+               'purchase_orders': [], 'sales': [], 'transfers': []}
 
-    if not query or len(query) < 1:
-        return jsonify({'pages': [], 'products': [], 'customers': [], 'suppliers': []})
+    if not query:
+        return jsonify(results)
 
     q_lower = query.lower()
-    results = {}
+    granted = {}
+    is_admin = current_user.role == 'admin' or current_user.is_global_admin
 
-    # 1. Search navigation pages (client-filtered by permission)
-    matched_pages = []
-    for page in NAVIGATION_PAGES:
-        # Check permission
-        if page['permission'] and not current_user.has_permission(page['permission']):
+    # 1. Navigation pages the user may open
+    for page, haystack in _PAGE_HAYSTACKS:
+        if q_lower not in haystack:
             continue
-        # Admin-only pages
-        if page['url'] in ['/settings', '/features'] and not (current_user.role == 'admin' or current_user.is_global_admin):
+        if not _allowed(page['permission'], granted):
             continue
-
-        # Match against name and keywords
-        if q_lower in page['name'].lower() or q_lower in page.get('keywords', '').lower():
-            matched_pages.append({
-                'name': page['name'],
-                'url': page['url'],
-                'icon': page['icon'],
-                'type': 'page'
-            })
-    results['pages'] = matched_pages[:8]
-
-    # 2. Search products (by name, code, barcode)
-    if len(query) >= 2:
-        products = Product.query.filter(
-            Product.is_active == True,
-            or_(
-                Product.name.ilike(f'%{query}%'),
-                Product.code.ilike(f'%{query}%'),
-                Product.barcode.ilike(f'%{query}%'),
-                Product.brand.ilike(f'%{query}%')
-            )
-        ).limit(5).all()
-
-        results['products'] = [{
-            'name': p.name,
-            'url': f'/inventory/edit/{p.id}',
-            'icon': 'fas fa-box',
-            'type': 'product',
-            'subtitle': f'{p.code} • Rs. {p.selling_price:,.0f}'
-        } for p in products]
-    else:
-        results['products'] = []
-
-    # 3. Search customers (by name, phone)
-    if len(query) >= 2:
-        customers = Customer.query.filter(
-            or_(
-                Customer.name.ilike(f'%{query}%'),
-                Customer.phone.ilike(f'%{query}%')
-            )
-        ).limit(5).all()
-
-        results['customers'] = [{
-            'name': c.name,
-            'url': f'/customers/{c.id}',
-            'icon': 'fas fa-user',
-            'type': 'customer',
-            'subtitle': c.phone or ''
-        } for c in customers]
-    else:
-        results['customers'] = []
-
-    # 4. Search suppliers (by name)
-    if len(query) >= 2:
-        suppliers = Supplier.query.filter(
-            Supplier.is_active == True,
-            Supplier.name.ilike(f'%{query}%')
-        ).limit(5).all()
-
-        results['suppliers'] = [{
-            'name': s.name,
-            'url': f'/suppliers/{s.id}',
-            'icon': 'fas fa-truck',
-            'type': 'supplier',
-            'subtitle': s.phone or ''
-        } for s in suppliers]
-    else:
-        results['suppliers'] = []
+        if page['url'] in ADMIN_ONLY_PAGES and not is_admin:
+            continue
+        results['pages'].append({
+            'name': page['name'],
+            'url': page['url'],
+            'icon': page['icon'],
+            'type': 'page'
+        })
+        if len(results['pages']) == 8:
+            break
+
+    if len(query) < 2:
+        return jsonify(results)
+
+    # 2. One ranked full-text lookup for every indexed kind the user may see
+    kinds = {key: kind for key, (kind, permission) in INDEXED_KINDS.items()
+             if _allowed(permission, granted)}
+    # Phone numbers are typed in many formats; the customer phone index handles them
+    phone_query = _looks_like_phone(query)
+    if not phone_query:
+        kinds['customers'] = 'customer'
+    ranked = search(query, kinds.values(), limit=5)
+
+    def rows(key, model):
+        return load_ranked(model, ranked.get(kinds.get(key), []))
+
+    results['products'] = [{
+        'name': p.name,
+        'url': f'/inventory/edit/{p.id}',
+        'icon': 'fas fa-box',
+        'type': 'product',
+        'subtitle': f'{p.code} • Rs. {p.selling_price:,.0f}'
+    } for p in rows('products', Product)]
+
+    customers = (search_customers(query, limit=5, active_only=False) if phone_query
+                 else rows('customers', Customer))
+    results['customers'] = [{
+        'name': c.name,
+        'url': f'/customers/{c.id}',
+        'icon': 'fas fa-user',
+        'type': 'customer',
+        'subtitle': c.phone or ''
+    } for c in customers]
+
+    results['suppliers'] = [{
+        'name': s.name,
+        'url': f'/suppliers/{s.id}',
+        'icon': 'fas fa-truck',
+        'type': 'supplier',
+        'subtitle': s.phone or ''
+    } for s in rows('suppliers', Supplier)]
+
+    results['purchase_orders'] = [{
+        'name': po.po_number,
+        'url': f'/purchase-orders/{po.id}',
+        'icon': 'fas fa-file-alt',
+        'type': 'purchase_order',
+        'subtitle': f'{po.supplier.name if po.supplier else ""} • {po.status}'
+    } for po in rows('purchase_orders', PurchaseOrder)]
+
+    results['sales'] = [{
+        'name': sale.sale_number,
+        'url': f'/pos/sale-details/{sale.id}',
+        'icon': 'fas fa-receipt',
+        'type': 'sale',
+        'subtitle': f'Rs. {float(sale.total or 0):,.0f}'
+    } for sale in rows('sales', Sale)]
+
+    results['transfers'] = [{
+        'name': t.transfer_number,
+        'url': f'/transfers/{t.id}',
+        'icon': 'fas fa-exchange-alt',
+        'type': 'transfer',
+        'subtitle': t.status or ''
+    } for t in rows('transfers', StockTransfer)]
 
     return jsonify(results)
@@ -9,6 +9,7 @@ from werkzeug.security import generate_password_hash
 from app.models import db, User, Setting, Category, ActivityLog, Location
 from app.utils.helpers import has_permission
 from app.utils.permissions import permission_required, Permissions
+from app.utils.pagination import keyset_paginate
 from datetime import datetime
 
 bp = Blueprint('settings', __name__)
@@ -316,7 +317,7 @@ def activity_log():
         flash('You do not have permission to view activity log', 'danger')
         return redirect(url_for('index'))
 
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = request.args.get('per_page', 50, type=int)
 
     # Get filter parameters
@@ -350,8 +351,8 @@ def activity_log():
         except ValueError:
             pass
 
-    logs = query.order_by(ActivityLog.timestamp.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
+    logs = keyset_paginate(query, [(ActivityLog.timestamp, True), (ActivityLog.id, True)],
+                           cursor=cursor, per_page=per_page)
 
     # Get unique action types for filter dropdown
     action_types = db.session.query(ActivityLog.action).distinct().all()
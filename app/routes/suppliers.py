@@ -9,6 +9,7 @@ from decimal import Decimal
 from app.models import db, Supplier, Product, PurchaseOrder, SyncQueue
 from app.utils.helpers import has_permission
 from app.utils.permissions import permission_required, Permissions
+from app.services.search_service import search_filter
 import json
 
 bp = Blueprint('suppliers', __name__)
@@ -30,12 +31,7 @@ def index():
     query = Supplier.query.filter_by(is_active=True)
 
     if search:
-        query = query.filter(
-            db.or_(
-                Supplier.name.ilike(f'%{search}%'),
-                Supplier.contact_person.ilike(f'%{search}%')
-            )
-        )
+        query = query.filter(search_filter('supplier', search))
 
     suppliers = query.order_by(Supplier.name).paginate(page=page, per_page=per_page, error_out=False)
 
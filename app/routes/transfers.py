@@ -14,6 +14,9 @@ from app.models import (db, Location, LocationStock, Product, StockTransfer,
 from app.utils.permissions import permission_required, Permissions
 from app.utils.location_context import (get_current_location, can_access_location,
                                          generate_transfer_number)
+from app.services.transfer_service import (dispatch_transfers, receive_transfers,
+                                           load_transfer_items)
+from app.services.warehouse_metrics_service import invalidate_warehouse_metrics
 
 bp = Blueprint('transfers', __name__, url_prefix='/transfers')
 
@@ -155,6 +158,7 @@ def create():
                         db.session.add(item)
 
             db.session.commit()
+            invalidate_warehouse_metrics(transfer.source_location_id)
 
             flash(f'Transfer request {transfer.transfer_number} created successfully.', 'success')
             return redirect(url_for('transfers.view', id=transfer.id))
@@ -235,6 +239,7 @@ def approve(id):
                 transfer.status = 'rejected'
                 transfer.rejection_reason = request.form.get('rejection_reason', '').strip()
                 db.session.commit()
+                invalidate_warehouse_metrics(transfer.source_location_id)
 
                 flash(f'Transfer {transfer.transfer_number} has been rejected.', 'warning')
                 return redirect(url_for('transfers.pending'))
@@ -262,6 +267,7 @@ def approve(id):
             transfer.approved_at = datetime.utcnow()
             transfer.approval_notes = notes
             db.session.commit()
+            invalidate_warehouse_metrics(transfer.source_location_id)
 
             flash(f'Transfer {transfer.transfer_number} has been approved.', 'success')
             return redirect(url_for('transfers.view', id=id))
@@ -311,44 +317,8 @@ def dispatch(id):
     try:
         notes = request.form.get('notes', '').strip()
 
-        # Deduct stock from source and update dispatched quantities
-        for item in transfer.items:
-            qty = item.quantity_approved or item.quantity_requested
-            item.quantity_dispatched = qty
-
-            # Deduct from source stock
-            source_stock = LocationStock.query.filter_by(
-                location_id=transfer.source_location_id,
-                product_id=item.product_id
-            ).first()
-
-            if source_stock:
-                source_stock.quantity -= qty
-                source_stock.reserved_quantity -= qty
-                if source_stock.quantity < 0:
-                    source_stock.quantity = 0
-                if source_stock.reserved_quantity < 0:
-                    source_stock.reserved_quantity = 0
-                source_stock.last_movement_at = datetime.utcnow()
-
-            # Create stock movement for outgoing
-            movement = StockMovement(
-                product_id=item.product_id,
-                user_id=current_user.id,
-                movement_type='transfer_out',
-                quantity=-qty,
-                reference=transfer.transfer_number,
-                notes=f'Transfer to {transfer.destination_location.name}',
-                location_id=transfer.source_location_id,
-                transfer_id=transfer.id
-            )
-            db.session.add(movement)
-
-        transfer.status = 'dispatched'
-        transfer.dispatched_by = current_user.id
-        transfer.dispatched_at = datetime.utcnow()
-        transfer.dispatch_notes = notes
-        db.session.commit()
+        dispatch_transfers([transfer], current_user.id, notes=notes)
+        invalidate_warehouse_metrics(transfer.source_location_id)
 
         flash(f'Transfer {transfer.transfer_number} has been dispatched.', 'success')
 
@@ -381,52 +351,20 @@ def receive(id):
         try:
             notes = request.form.get('notes', '').strip()
 
-            # Update received quantities and add to destination stock
-            for item in transfer.items:
-                received_qty = request.form.get(f'received_qty_{item.id}', type=int)
-                if received_qty is None:
-                    received_qty = item.quantity_dispatched
-
-                item.quantity_received = received_qty
-
-                if received_qty > 0:
-                    # Get or create destination stock
-                    dest_stock = LocationStock.query.filter_by(
-                        location_id=transfer.destination_location_id,
-                        product_id=item.product_id
-                    ).first()
-
-                    if not dest_stock:
-                        product = Product.query.get(item.product_id)
-                        dest_stock = LocationStock(
-                            location_id=transfer.destination_location_id,
-                            product_id=item.product_id,
-                            quantity=0,
-                            reorder_level=product.reorder_level if product else 10
-                        )
-                        db.session.add(dest_stock)
-
-                    dest_stock.quantity += received_qty
-                    dest_stock.last_movement_at = datetime.utcnow()
-
-                    # Create stock movement for incoming
-                    movement = StockMovement(
-                        product_id=item.product_id,
-                        user_id=current_user.id,
-                        movement_type='transfer_in',
-                        quantity=received_qty,
-                        reference=transfer.transfer_number,
-                        notes=f'Transfer from {transfer.source_location.name}',
-                        location_id=transfer.destination_location_id,
-                        transfer_id=transfer.id
-                    )
-                    db.session.add(movement)
-
-            transfer.status = 'received'
-            transfer.received_by = current_user.id
-            transfer.received_at = datetime.utcnow()
-            transfer.receive_notes = notes
-            db.session.commit()
+            # Received quantities posted as received_qty_<item id>
+            received_quantities = {}
+            for key in request.form:
+                if key.startswith('received_qty_'):
+                    qty = request.form.get(key, type=int)
+                    if qty is not None:
+                        try:
+                            received_quantities[int(key[len('received_qty_'):])] = qty
+                        except ValueError:
+                            continue
+
+            receive_transfers([transfer], current_user.id,
+                              received_quantities=received_quantities, notes=notes)
+            invalidate_warehouse_metrics(transfer.source_location_id)
 
             flash(f'Transfer {transfer.transfer_number} has been received successfully.', 'success')
             return redirect(url_for('transfers.view', id=id))
@@ -436,13 +374,8 @@ def receive(id):
             flash(f'Error receiving transfer: {str(e)}', 'danger')
 
     # GET - show receive form
-    items = []
-    for item in transfer.items:
-        product = Product.query.get(item.product_id)
-        items.append({
-            'item': item,
-            'product': product
-        })
+    items = [{'item': item, 'product': item.product}
+             for item in load_transfer_items([transfer.id])]
 
     return render_template('transfers/receive.html',
                            transfer=transfer,
@@ -479,6 +412,7 @@ def cancel(id):
         transfer.status = 'cancelled'
         transfer.rejection_reason = reason
         db.session.commit()
+        invalidate_warehouse_metrics(transfer.source_location_id)
 
         flash(f'Transfer {transfer.transfer_number} has been cancelled.', 'warning')
 
@@ -671,6 +605,7 @@ def submit_reorder(id):
         transfer.priority = request.form.get('priority', 'normal')
 
         db.session.commit()
+        invalidate_warehouse_metrics(transfer.source_location_id)
         flash(f'Reorder {transfer.transfer_number} submitted to warehouse.', 'success')
 
     except Exception as e:
@@ -14,6 +14,10 @@ from app.models import (db, Location, LocationStock, Product, StockTransfer,
                         StockTransferItem, StockMovement, Sale, GatePass, TransferRequest)
 from app.utils.permissions import permission_required, Permissions
 from app.utils.location_context import get_current_location, warehouse_required
+from app.services.warehouse_metrics_service import (get_warehouse_metrics, get_purchase_order_stats,
+                                                     invalidate_warehouse_metrics)
+from app.services.transfer_service import (create_bulk_transfers, dispatch_transfers,
+                                           load_transfer_items, prefetch_location_stock)
 
 bp = Blueprint('warehouse', __name__, url_prefix='/warehouse')
 
@@ -40,21 +44,11 @@ def index():
         return redirect(url_for('index'))
 
     # Get warehouse stats
-    total_products = LocationStock.query.filter_by(location_id=warehouse.id).count()
-    low_stock_count = LocationStock.query.filter_by(location_id=warehouse.id).filter(
-        LocationStock.quantity <= LocationStock.reorder_level
-    ).count()
-
-    # Get total stock value
-    stock_value = db.session.query(
-        func.sum(LocationStock.quantity * Product.cost_price)
-    ).join(Product).filter(LocationStock.location_id == warehouse.id).scalar() or 0
-
-    # Pending transfer requests
-    pending_requests = StockTransfer.query.filter_by(
-        source_location_id=warehouse.id,
-        status='requested'
-    ).count()
+    summary = get_warehouse_metrics(warehouse, kiosks=[])['summary']
+    total_products = summary['total_products']
+    low_stock_count = summary['low_stock_count']
+    stock_value = summary['stock_value']
+    pending_requests = summary['pending_requests']
 
     # Recent transfers
     recent_transfers = StockTransfer.query.filter(
@@ -219,42 +213,19 @@ def analytics():
         is_active=True
     ).all()
 
+    # All kiosk KPIs come from grouped queries, independent of kiosk count
+    kiosk_metrics = get_warehouse_metrics(warehouse, kiosks=kiosks)['kiosks']
+
     kiosk_stats = []
     for kiosk in kiosks:
-        # Calculate kiosk metrics
-        total_stock = db.session.query(func.sum(LocationStock.quantity)).filter_by(
-            location_id=kiosk.id
-        ).scalar() or 0
-
-        low_stock = LocationStock.query.filter_by(location_id=kiosk.id).filter(
-            LocationStock.quantity <= LocationStock.reorder_level
-        ).count()
-
-        # Recent sales (last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        sales_count = Sale.query.filter(
-            Sale.location_id == kiosk.id,
-            Sale.sale_date >= thirty_days_ago
-        ).count()
-
-        sales_revenue = db.session.query(func.sum(Sale.total)).filter(
-            Sale.location_id == kiosk.id,
-            Sale.sale_date >= thirty_days_ago
-        ).scalar() or 0
-
-        # Pending transfers to this kiosk
-        pending_transfers = StockTransfer.query.filter(
-            StockTransfer.destination_location_id == kiosk.id,
-            StockTransfer.status.in_(['requested', 'approved', 'dispatched'])
-        ).count()
-
+        metrics = kiosk_metrics[kiosk.id]
         kiosk_stats.append({
             'kiosk': kiosk,
-            'total_stock': total_stock,
-            'low_stock': low_stock,
-            'sales_count': sales_count,
-            'sales_revenue': float(sales_revenue),
-            'pending_transfers': pending_transfers
+            'total_stock': metrics['total_stock'],
+            'low_stock': metrics['low_stock'],
+            'sales_count': metrics['sales_count'],
+            'sales_revenue': metrics['sales_revenue'],
+            'pending_transfers': metrics['pending_transfers']
         })
 
     # Transfer statistics
@@ -338,47 +309,25 @@ def bulk_transfer():
                 flash('Product not available in warehouse.', 'danger')
                 return redirect(url_for('warehouse.bulk_transfer'))
 
-            total_qty = sum(int(q) for q in quantities if q)
-            if total_qty > warehouse_stock.available_quantity:
-                flash(f'Insufficient stock. Available: {warehouse_stock.available_quantity}', 'danger')
-                return redirect(url_for('warehouse.bulk_transfer'))
-
-            # Create transfers for each kiosk
-            from app.utils.location_context import generate_transfer_number
-
-            created = 0
+            allocations = {}
             for i, kiosk_id in enumerate(kiosk_ids):
                 if kiosk_id and i < len(quantities) and quantities[i]:
                     qty = int(quantities[i])
                     if qty > 0:
-                        transfer = StockTransfer(
-                            transfer_number=generate_transfer_number(),
-                            source_location_id=warehouse.id,
-                            destination_location_id=int(kiosk_id),
-                            status='approved',  # Pre-approved by warehouse
-                            priority='normal',
-                            requested_by=current_user.id,
-                            requested_at=datetime.utcnow(),
-                            approved_by=current_user.id,
-                            approved_at=datetime.utcnow(),
-                            request_notes=notes
-                        )
-                        db.session.add(transfer)
-                        db.session.flush()
-
-                        item = StockTransferItem(
-                            transfer_id=transfer.id,
-                            product_id=product_id,
-                            quantity_requested=qty,
-                            quantity_approved=qty
-                        )
-                        db.session.add(item)
-
-                        # Reserve stock
-                        warehouse_stock.reserved_quantity += qty
-                        created += 1
+                        allocations[int(kiosk_id)] = allocations.get(int(kiosk_id), 0) + qty
+
+            total_qty = sum(allocations.values())
+            if total_qty > warehouse_stock.available_quantity:
+                flash(f'Insufficient stock. Available: {warehouse_stock.available_quantity}', 'danger')
+                return redirect(url_for('warehouse.bulk_transfer'))
+
+            # Create transfers for each kiosk and reserve the stock in one go
+            transfers = create_bulk_transfers(warehouse.id, product_id, allocations,
+                                              current_user.id, notes=notes, commit=False)
+            created = len(transfers)
 
             db.session.commit()
+            invalidate_warehouse_metrics(warehouse.id)
             flash(f'Created {created} transfer(s) for {product.name}.', 'success')
             return redirect(url_for('warehouse.requests'))
 
@@ -754,45 +703,14 @@ def dispatch_request(id):
             )
 
             # Deduct stock and mark dispatched
-            for item in transfer.items:
-                qty = item.quantity_approved or item.quantity_requested
-                item.quantity_dispatched = qty
-
-                source_stock = LocationStock.query.filter_by(
-                    location_id=transfer.source_location_id,
-                    product_id=item.product_id
-                ).first()
-
-                if source_stock:
-                    source_stock.quantity -= qty
-                    source_stock.reserved_quantity -= qty
-                    if source_stock.quantity < 0:
-                        source_stock.quantity = 0
-                    if source_stock.reserved_quantity < 0:
-                        source_stock.reserved_quantity = 0
-                    source_stock.last_movement_at = datetime.utcnow()
-
-                # Create stock movement
-                movement = StockMovement(
-                    product_id=item.product_id,
-                    user_id=current_user.id,
-                    movement_type='transfer_out',
-                    quantity=-qty,
-                    reference=transfer.transfer_number,
-                    notes=f'Transfer to {transfer.destination_location.name}',
-                    location_id=transfer.source_location_id,
-                    transfer_id=transfer.id
-                )
-                db.session.add(movement)
-
-            transfer.status = 'dispatched'
-            transfer.dispatched_by = current_user.id
-            transfer.dispatched_at = datetime.utcnow()
-            transfer.dispatch_notes = request.form.get('dispatch_notes', '').strip()
+            dispatch_transfers([transfer], current_user.id,
+                               notes=request.form.get('dispatch_notes', '').strip(),
+                               commit=False)
 
             gate_pass.calculate_totals()
             db.session.add(gate_pass)
             db.session.commit()
+            invalidate_warehouse_metrics(transfer.source_location_id)
 
             flash(f'Transfer dispatched. Gate pass {gate_pass.gate_pass_number} created.', 'success')
             return redirect(url_for('warehouse.print_gate_pass', id=gate_pass.id))
@@ -802,17 +720,17 @@ def dispatch_request(id):
             flash(f'Error dispatching: {str(e)}', 'danger')
 
     # GET - show dispatch form
+    transfer_items = load_transfer_items([transfer.id])
+    source_stock = prefetch_location_stock(
+        (transfer.source_location_id, item.product_id) for item in transfer_items
+    )
     items = []
-    for item in transfer.items:
-        product = Product.query.get(item.product_id)
-        source_stock = LocationStock.query.filter_by(
-            location_id=transfer.source_location_id,
-            product_id=item.product_id
-        ).first()
+    for item in transfer_items:
+        stock = source_stock.get((transfer.source_location_id, item.product_id))
         items.append({
             'item': item,
-            'product': product,
-            'available': source_stock.available_quantity if source_stock else 0
+            'product': item.product,
+            'available': stock.available_quantity if stock else 0
         })
 
     return render_template('warehouse/dispatch_form.html',
@@ -852,37 +770,19 @@ def reorders_by_store():
     total_pending = 0
     total_approved = 0
 
+    kiosk_metrics = get_warehouse_metrics(warehouse, kiosks=kiosks)['kiosks']
+
     for kiosk in kiosks:
-        # Count pending (requested) transfers
-        pending = StockTransfer.query.filter_by(
-            destination_location_id=kiosk.id,
-            status='requested'
-        ).count()
-
-        # Count approved (ready to dispatch)
-        approved = StockTransfer.query.filter_by(
-            destination_location_id=kiosk.id,
-            status='approved'
-        ).count()
-
-        # Count dispatched (in transit)
-        dispatched = StockTransfer.query.filter_by(
-            destination_location_id=kiosk.id,
-            status='dispatched'
-        ).count()
-
-        # Get low stock count for this kiosk
-        low_stock = LocationStock.query.filter(
-            LocationStock.location_id == kiosk.id,
-            LocationStock.quantity <= LocationStock.reorder_level
-        ).count()
+        metrics = kiosk_metrics[kiosk.id]
+        pending = metrics['requested_count']
+        approved = metrics['approved_count']
 
         store_reorders.append({
             'kiosk': kiosk,
             'pending_count': pending,
             'approved_count': approved,
-            'dispatched_count': dispatched,
-            'low_stock_count': low_stock
+            'dispatched_count': metrics['dispatched_count'],
+            'low_stock_count': metrics['low_stock']
         })
 
         total_pending += pending
@@ -1060,19 +960,4 @@ def review_draft_po(po_id):
 @permission_required(Permissions.WAREHOUSE_VIEW)
 def api_draft_pos_stats():
     """API: Get draft PO statistics for dashboard"""
-    from app.models import PurchaseOrder
-    from app.services.reorder_service import get_low_stock_by_supplier
-
-    draft_count = PurchaseOrder.query.filter_by(status='draft').count()
-    ordered_count = PurchaseOrder.query.filter_by(status='ordered').count()
-
-    # Low stock items not in any draft
-    low_stock_data = get_low_stock_by_supplier()
-    low_stock_count = sum(len(data['products']) for data in low_stock_data.values())
-
-    return jsonify({
-        'draft_pos': draft_count,
-        'ordered_pos': ordered_count,
-        'low_stock_items': low_stock_count,
-        'suppliers_with_low_stock': len(low_stock_data)
-    })
+    return jsonify(get_purchase_order_stats())
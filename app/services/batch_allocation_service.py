@@ -0,0 +1,465 @@
+"""
+Batch Allocation Service
+Allocates stock across ProductBatch rows in FEFO order (first expiry, first
+out) for sales, returns and transfers, keeping batch quantities in step with
+LocationStock
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_, func, case
+
+from app.models import db, ProductBatch, BatchMovement, LocationStock
+
+
+# Re-plans after losing a race for a batch before giving up on a line
+MAX_ALLOCATION_ATTEMPTS = 5
+
+_batch_table = ProductBatch.__table__
+_ZERO = Decimal('0')
+
+
+def _quantity(value):
+    """Normalise a quantity to the 4 decimal places batches are stored with"""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value or 0))
+    return value.quantize(Decimal('0.0001'))
+
+
+def _fefo_order():
+    """Expiry first (undated batches last), then oldest receipt"""
+    return (
+        ProductBatch.product_id,
+        ProductBatch.expiry_date.is_(None),
+        ProductBatch.expiry_date.asc(),
+        ProductBatch.received_date.asc(),
+        ProductBatch.id.asc()
+    )
+
+
+def _load_available_batches(product_ids, location_id, on_date=None):
+    """Load sellable batches for many products at a location in one query"""
+    on_date = on_date or date.today()
+    return db.session.query(
+        ProductBatch.id, ProductBatch.product_id, ProductBatch.batch_number,
+        ProductBatch.expiry_date, ProductBatch.unit_cost,
+        ProductBatch.current_quantity, ProductBatch.reserved_quantity
+    ).filter(
+        ProductBatch.product_id.in_(list(product_ids)),
+        ProductBatch.location_id == location_id,
+        ProductBatch.status == 'active',
+        ProductBatch.current_quantity > func.coalesce(ProductBatch.reserved_quantity, 0),
+        or_(
+            ProductBatch.expiry_date.is_(None),
+            ProductBatch.expiry_date >= on_date
+        )
+    ).order_by(*_fefo_order()).all()
+
+
+def _compare_and_set(batch_id, before, after, now):
+    """
+    Move a batch from one quantity to another only if nobody changed it since
+    it was read. Returns True when this caller won the update.
+    """
+    if after <= 0:
+        status = 'depleted'
+    else:
+        status = case((_batch_table.c.status == 'depleted', 'active'), else_=_batch_table.c.status)
+
+    result = db.session.execute(
+        _batch_table.update().where(and_(
+            _batch_table.c.id == batch_id,
+            _batch_table.c.current_quantity == before
+        )).values(current_quantity=after, status=status, updated_at=now)
+    )
+    return result.rowcount == 1
+
+
+def _expire_batches(batch_ids):
+    """Expire ProductBatch objects already in the session so they reload"""
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, ProductBatch) and obj.id in batch_ids:
+            db.session.expire(obj)
+
+
+def plan_fefo_allocation(lines, location_id, on_date=None):
+    """
+    Plan a FEFO allocation for a whole cart without changing anything.
+
+    Args:
+        lines: {product_id: quantity}
+        location_id: Location the stock is taken from
+        on_date: Expired batches before this date are skipped (default: today)
+
+    Returns:
+        tuple: ({product_id: [allocation dict]}, {product_id: unallocated qty})
+    """
+    remaining = {pid: _quantity(qty) for pid, qty in lines.items() if qty and _quantity(qty) > 0}
+    allocations = defaultdict(list)
+    if not remaining:
+        return {}, {}
+
+    for batch in _load_available_batches(remaining, location_id, on_date):
+        need = remaining.get(batch.product_id, _ZERO)
+        if need <= 0:
+            continue
+        available = _quantity(batch.current_quantity) - _quantity(batch.reserved_quantity)
+        take = min(available, need)
+        allocations[batch.product_id].append({
+            'batch_id': batch.id,
+            'batch_number': batch.batch_number,
+            'quantity': take,
+            'expiry_date': batch.expiry_date,
+            'unit_cost': batch.unit_cost
+        })
+        remaining[batch.product_id] = need - take
+
+    unallocated = {pid: qty for pid, qty in remaining.items() if qty > 0}
+    return dict(allocations), unallocated
+
+
+def allocate_fefo(lines, location_id, user_id, reference_type, reference_id=None,
+                  movement_type='sale', reason=None, on_date=None):
+    """
+    Deduct a whole cart from batches in FEFO order.
+
+    Batches for every line are read in one query. Each touched batch is then
+    decremented with a compare-and-set update, so two checkouts racing for
+    the same batch can never take more than it holds; the loser re-plans
+    from fresh quantities. BatchMovement rows are written in bulk.
+
+    Products without batches at the location are left untouched and
+    reported as unallocated. Batch-tracked products that could not be fully
+    allocated are also reported as a shortfall, which callers should treat
+    as an error: LocationStock stays the caller's job, and deducting it
+    without the batches is exactly the drift this service exists to stop.
+
+    Args:
+        lines: {product_id: quantity}
+        location_id: Location the stock is taken from
+        user_id: User recorded on the batch movements
+        reference_type: 'sale', 'transfer', ...
+        reference_id: ID of the sale, transfer, ...
+        movement_type: BatchMovement type
+        reason: Reason recorded on the batch movements
+        on_date: Expired batches before this date are skipped (default: today)
+
+    Returns:
+        dict: {'allocations': {product_id: [allocation dict]},
+               'unallocated': {product_id: quantity},
+               'shortfall': {product_id: quantity}}
+    """
+    now = datetime.utcnow()
+    remaining = {pid: _quantity(qty) for pid, qty in lines.items() if qty and _quantity(qty) > 0}
+    allocations = defaultdict(list)
+    movements = []
+    touched = set()
+
+    for _ in range(MAX_ALLOCATION_ATTEMPTS):
+        if not remaining:
+            break
+
+        # Products that lost a race this pass; their later batches wait for
+        # the re-plan so the earliest-expiring batch is always tried first
+        lost_race = set()
+        for batch in _load_available_batches(remaining, location_id, on_date):
+            need = remaining.get(batch.product_id, _ZERO)
+            if need <= 0 or batch.product_id in lost_race:
+                continue
+
+            before = _quantity(batch.current_quantity)
+            take = min(before - _quantity(batch.reserved_quantity), need)
+            after = before - take
+
+            if not _compare_and_set(batch.id, before, after, now):
+                lost_race.add(batch.product_id)
+                continue
+
+            touched.add(batch.id)
+            allocations[batch.product_id].append({
+                'batch_id': batch.id,
+                'batch_number': batch.batch_number,
+                'quantity': take,
+                'expiry_date': batch.expiry_date,
+                'unit_cost': batch.unit_cost
+            })
+            movements.append({
+                'batch_id': batch.id,
+                'movement_type': movement_type,
+                'quantity': -take,
+                'quantity_before': before,
+                'quantity_after': after,
+                'reference_type': reference_type,
+                'reference_id': reference_id,
+                'user_id': user_id,
+                'reason': reason,
+                'created_at': now
+            })
+            remaining[batch.product_id] = need - take
+
+        remaining = {pid: qty for pid, qty in remaining.items() if qty > 0}
+        if not lost_race:
+            break
+
+    if movements:
+        db.session.bulk_insert_mappings(BatchMovement, movements)
+    _expire_batches(touched)
+
+    # Unallocated units of products that do have batches here are a real
+    # shortfall (expired stock, untracked receipts, or too much contention)
+    shortfall = {}
+    if remaining:
+        tracked = {pid for (pid,) in db.session.query(ProductBatch.product_id).filter(
+            ProductBatch.product_id.in_(list(remaining)),
+            ProductBatch.location_id == location_id
+        ).distinct()}
+        shortfall = {pid: qty for pid, qty in remaining.items() if pid in tracked}
+
+    return {'allocations': dict(allocations), 'unallocated': remaining, 'shortfall': shortfall}
+
+
+def _restock_batch(batch_id, quantity, now):
+    """Add quantity to one batch, retrying on concurrent changes; returns (before, after)"""
+    for _ in range(MAX_ALLOCATION_ATTEMPTS):
+        before = _quantity(db.session.query(ProductBatch.current_quantity).filter(
+            ProductBatch.id == batch_id
+        ).scalar())
+        after = before + quantity
+        if _compare_and_set(batch_id, before, after, now):
+            return before, after
+    raise RuntimeError(f'Could not restock batch {batch_id}: too many concurrent updates')
+
+
+def restock_sale_batches(sale_id, lines, user_id, reference_id=None, reason=None):
+    """
+    Put returned units back into the batches a sale drew them from.
+
+    Latest-expiring batches are refilled first, and never beyond what the sale
+    took from each batch minus earlier returns against the same sale.
+
+    Args:
+        sale_id: Sale the units were sold on
+        lines: {product_id: quantity returned}
+        user_id: User recorded on the batch movements
+        reference_id: Return ID recorded in the movement notes
+        reason: Reason recorded on the batch movements
+
+    Returns:
+        dict: {product_id: quantity that could not be matched to a batch}
+    """
+    now = datetime.utcnow()
+    remaining = {pid: _quantity(qty) for pid, qty in lines.items() if qty and _quantity(qty) > 0}
+    if not remaining:
+        return {}
+
+    # Net units per batch still out with the customer, in one grouped query
+    # Sale movements are negative and returns positive, so the negated sum
+    # is what the customer still holds from each batch
+    net_sold = func.sum(-BatchMovement.quantity)
+    rows = db.session.query(
+        BatchMovement.batch_id, ProductBatch.product_id, net_sold
+    ).join(
+        ProductBatch, ProductBatch.id == BatchMovement.batch_id
+    ).filter(
+        BatchMovement.reference_type.in_(['sale', 'sale_return']),
+        BatchMovement.reference_id == sale_id,
+        ProductBatch.product_id.in_(list(remaining))
+    ).group_by(
+        BatchMovement.batch_id, ProductBatch.product_id,
+        ProductBatch.expiry_date, ProductBatch.received_date
+    ).order_by(
+        ProductBatch.expiry_date.is_(None).desc(),
+        ProductBatch.expiry_date.desc(),
+        ProductBatch.received_date.desc()
+    ).all()
+
+    movements = []
+    touched = set()
+    for batch_id, product_id, outstanding in rows:
+        need = remaining.get(product_id, _ZERO)
+        outstanding = _quantity(outstanding)
+        if need <= 0 or outstanding <= 0:
+            continue
+
+        put_back = min(need, outstanding)
+        before, after = _restock_batch(batch_id, put_back, now)
+        touched.add(batch_id)
+        movements.append({
+            'batch_id': batch_id,
+            'movement_type': 'return',
+            'quantity': put_back,
+            'quantity_before': before,
+            'quantity_after': after,
+            'reference_type': 'sale_return',
+            'reference_id': sale_id,
+            'user_id': user_id,
+            'reason': reason,
+            'notes': f'Return #{reference_id}' if reference_id else None,
+            'created_at': now
+        })
+        remaining[product_id] = need - put_back
+
+    if movements:
+        db.session.bulk_insert_mappings(BatchMovement, movements)
+    _expire_batches(touched)
+
+    return {pid: qty for pid, qty in remaining.items() if qty > 0}
+
+
+def receive_transfer_batches(transfer, received_quantities, user_id):
+    """
+    Recreate the batches a transfer shipped at its destination.
+
+    Batches dispatched from the source (BatchMovement rows with
+    reference_type 'transfer') are matched FEFO against the received
+    quantity of each product; destination batches with the same batch number
+    are topped up, missing ones are inserted.
+
+    Args:
+        transfer: StockTransfer being received
+        received_quantities: {product_id: quantity received}
+        user_id: User recorded on the batch movements
+
+    Returns:
+        dict: {product_id: received quantity that had no dispatched batch}
+    """
+    now = datetime.utcnow()
+    remaining = {pid: _quantity(qty) for pid, qty in received_quantities.items()
+                 if qty and _quantity(qty) > 0}
+    if not remaining:
+        return {}
+
+    shipped = db.session.query(
+        ProductBatch.product_id, ProductBatch.batch_number, ProductBatch.expiry_date,
+        ProductBatch.manufacture_date, ProductBatch.received_date, ProductBatch.unit_cost,
+        ProductBatch.supplier_id, func.sum(-BatchMovement.quantity)
+    ).join(
+        BatchMovement, BatchMovement.batch_id == ProductBatch.id
+    ).filter(
+        BatchMovement.reference_type == 'transfer',
+        BatchMovement.reference_id == transfer.id,
+        BatchMovement.movement_type == 'transfer_out',
+        ProductBatch.product_id.in_(list(remaining))
+    ).group_by(
+        ProductBatch.product_id, ProductBatch.batch_number, ProductBatch.expiry_date,
+        ProductBatch.manufacture_date, ProductBatch.received_date, ProductBatch.unit_cost,
+        ProductBatch.supplier_id
+    ).order_by(
+        ProductBatch.expiry_date.is_(None), ProductBatch.expiry_date.asc(),
+        ProductBatch.received_date.asc()
+    ).all()
+    if not shipped:
+        return remaining
+
+    existing = {
+        (row.product_id, row.batch_number): row.id
+        for row in db.session.query(
+            ProductBatch.id, ProductBatch.product_id, ProductBatch.batch_number
+        ).filter(
+            ProductBatch.location_id == transfer.destination_location_id,
+            ProductBatch.product_id.in_(list(remaining)),
+            ProductBatch.batch_number.in_({row.batch_number for row in shipped})
+        )
+    }
+
+    movements = []
+    touched = set()
+    for row in shipped:
+        need = remaining.get(row.product_id, _ZERO)
+        if need <= 0:
+            continue
+        qty = min(need, _quantity(row[-1]))
+        if qty <= 0:
+            continue
+
+        batch_id = existing.get((row.product_id, row.batch_number))
+        if batch_id is None:
+            batch = ProductBatch(
+                product_id=row.product_id,
+                location_id=transfer.destination_location_id,
+                batch_number=row.batch_number,
+                manufacture_date=row.manufacture_date,
+                expiry_date=row.expiry_date,
+                initial_quantity=qty,
+                current_quantity=qty,
+                unit_cost=row.unit_cost,
+                total_cost=(qty * row.unit_cost).quantize(Decimal('0.01')) if row.unit_cost else None,
+                supplier_id=row.supplier_id,
+                received_date=now.date(),
+                received_by=user_id,
+                notes=f'Received on transfer {transfer.transfer_number}'
+            )
+            db.session.add(batch)
+            db.session.flush()
+            batch_id = batch.id
+            before, after = _ZERO, qty
+        else:
+            before, after = _restock_batch(batch_id, qty, now)
+            touched.add(batch_id)
+
+        movements.append({
+            'batch_id': batch_id,
+            'movement_type': 'transfer_in',
+            'quantity': qty,
+            'quantity_before': before,
+            'quantity_after': after,
+            'reference_type': 'transfer',
+            'reference_id': transfer.id,
+            'user_id': user_id,
+            'reason': f'Transfer {transfer.transfer_number}',
+            'created_at': now
+        })
+        remaining[row.product_id] = need - qty
+
+    if movements:
+        db.session.bulk_insert_mappings(BatchMovement, movements)
+    _expire_batches(touched)
+
+    return {pid: qty for pid, qty in remaining.items() if qty > 0}
+
+
+def batch_stock_discrepancies(location_id=None):
+    """
+    Compare batch totals with LocationStock for batch-tracked products.
+
+    Args:
+        location_id: Limit the check to one location
+
+    Returns:
+        list: dicts with location_id, product_id, batch_quantity and
+              location_quantity for every pair that disagrees
+    """
+    batch_totals = db.session.query(
+        ProductBatch.location_id,
+        ProductBatch.product_id,
+        func.sum(ProductBatch.current_quantity).label('batch_quantity')
+    ).filter(
+        ProductBatch.status.in_(['active', 'depleted'])
+    )
+    if location_id is not None:
+        batch_totals = batch_totals.filter(ProductBatch.location_id == location_id)
+    batch_totals = batch_totals.group_by(
+        ProductBatch.location_id, ProductBatch.product_id
+    ).subquery()
+
+    rows = db.session.query(
+        batch_totals.c.location_id,
+        batch_totals.c.product_id,
+        batch_totals.c.batch_quantity,
+        func.coalesce(LocationStock.quantity, 0)
+    ).outerjoin(
+        LocationStock, and_(
+            LocationStock.location_id == batch_totals.c.location_id,
+            LocationStock.product_id == batch_totals.c.product_id
+        )
+    ).all()
+
+    return [{
+        'location_id': loc_id,
+        'product_id': product_id,
+        'batch_quantity': _quantity(batch_qty),
+        'location_quantity': int(location_qty)
+    } for loc_id, product_id, batch_qty, location_qty in rows
+        if _quantity(batch_qty) != _quantity(location_qty)]
@@ -0,0 +1,248 @@
+"""
+POS Catalog Service
+Builds the compact product/price/stock snapshot kiosks cache for offline
+search and barcode scanning, plus the cheap change feed they poll for deltas
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from app.models import db, Category, LocationStock, Product
+
+
+# Seconds a location's catalog version is reused before it is re-read;
+# bounds change-feed queries no matter how many terminals poll
+VERSION_TTL_SECONDS = 2
+
+# Deltas overlap the previous version by this much so rows written by a
+# transaction that committed after the version was read are not missed
+DELTA_OVERLAP_SECONDS = 30
+
+# Column order of each product row in snapshot and delta payloads
+CATALOG_FIELDS = (
+    'id', 'code', 'barcode', 'name', 'brand', 'size', 'category_id',
+    'selling_price', 'tax_rate', 'quantity', 'reorder_level', 'is_low_stock',
+    'is_made_to_order', 'image_url', 'is_active'
+)
+
+_lock = threading.Lock()
+_versions = weakref.WeakKeyDictionary()   # engine -> {location_id: (read_at, version)}
+_snapshots = weakref.WeakKeyDictionary()  # engine -> {location_id: CatalogSnapshot}
+
+
+class CatalogSnapshot:
+    """Serialized catalog for one location at one version"""
+
+    def __init__(self, location_id, version, body):
+        self.location_id = location_id
+        self.version = version
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.etag = hashlib.sha1(f'{location_id}:{version}'.encode()).hexdigest()
+
+
+# ============================================================
+# VERSIONS
+# ============================================================
+
+def _format_version(moment):
+    return moment.strftime('%Y%m%dT%H%M%S.%f') if moment else '0'
+
+
+def parse_version(version):
+    """
+    Turn a version stamp back into the moment it stands for.
+
+    Returns:
+        datetime or None: None for a missing or malformed stamp
+    """
+    if not version:
+        return None
+    if version == '0':
+        return datetime.min
+    try:
+        return datetime.strptime(version, '%Y%m%dT%H%M%S.%f')
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_version(location_id):
+    """Latest product or stock change visible to a location (three index lookups)"""
+    stamps = [db.session.query(func.max(Product.updated_at)).scalar()]
+    if location_id:
+        stamps.extend(db.session.query(
+            func.max(LocationStock.updated_at),
+            func.max(LocationStock.last_movement_at)
+        ).filter(LocationStock.location_id == location_id).one())
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return _format_version(max(stamps) if stamps else None)
+
+
+def catalog_version(location_id, max_age=VERSION_TTL_SECONDS):
+    """
+    Current catalog version for a location.
+
+    Args:
+        location_id: Kiosk/warehouse ID, or None for company-wide stock
+        max_age: Seconds a previously read version may be reused
+
+    Returns:
+        str: Opaque, ordered version stamp
+    """
+    engine = db.engine
+    with _lock:
+        cached = _versions.get(engine, {}).get(location_id)
+        if cached and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+
+    version = _read_version(location_id)
+    with _lock:
+        _versions.setdefault(engine, {})[location_id] = (time.monotonic(), version)
+    return version
+
+
+def invalidate_catalog(location_id=None):
+    """
+    Forget cached versions so the next poll re-reads them.
+
+    Args:
+        location_id: Only this location (None for all)
+    """
+    with _lock:
+        for versions in _versions.values():
+            if location_id is None:
+                versions.clear()
+            else:
+                versions.pop(location_id, None)
+
+
+# ============================================================
+# ROWS
+# ============================================================
+
+def _catalog_query(location_id):
+    if location_id:
+        return db.session.query(Product, LocationStock).outerjoin(
+            LocationStock,
+            db.and_(LocationStock.product_id == Product.id,
+                    LocationStock.location_id == location_id)
+        )
+    return db.session.query(Product, db.null())
+
+
+def _row(product, stock, location_id):
+    if not location_id:
+        # No location: company-wide stock on the product itself
+        quantity = product.quantity or 0
+        reorder_level = product.reorder_level
+        is_low = product.is_low_stock
+    elif stock is not None:
+        quantity = stock.available_quantity
+        reorder_level = stock.reorder_level
+        is_low = stock.is_low_stock
+    else:
+        quantity = 0
+        reorder_level = product.reorder_level
+        is_low = True
+
+    return [
+        product.id, product.code, product.barcode, product.name, product.brand,
+        product.size, product.category_id, float(product.selling_price or 0),
+        float(product.tax_rate or 0), quantity, reorder_level, bool(is_low),
+        bool(product.is_made_to_order), product.image_url, bool(product.is_active)
+    ]
+
+
+def _rows(query, location_id):
+    return [_row(product, stock, location_id)
+            for product, stock in query.order_by(Product.id).all()]
+
+
+def _categories():
+    return {category.id: category.name for category in Category.query.all()}
+
+
+# ============================================================
+# SNAPSHOT AND DELTAS
+# ============================================================
+
+def catalog_snapshot(location_id):
+    """
+    Serialized snapshot of every active product with its price and stock
+    at the location, rebuilt only when the catalog version moves.
+
+    Args:
+        location_id: Kiosk/warehouse ID, or None for company-wide stock
+
+    Returns:
+        CatalogSnapshot
+    """
+    engine = db.engine
+    version = catalog_version(location_id)
+    with _lock:
+        cached = _snapshots.get(engine, {}).get(location_id)
+    if cached and cached.version == version:
+        return cached
+
+    products = _rows(_catalog_query(location_id).filter(Product.is_active == True), location_id)
+    body = json.dumps({
+        'version': version,
+        'location_id': location_id,
+        'fields': CATALOG_FIELDS,
+        'categories': _categories(),
+        'products': products
+    }, separators=(',', ':')).encode('utf-8')
+
+    snapshot = CatalogSnapshot(location_id, version, body)
+    with _lock:
+        _snapshots.setdefault(engine, {})[location_id] = snapshot
+    return snapshot
+
+
+def catalog_changes(location_id, since):
+    """
+    Products whose details, price or stock at the location changed since a
+    version. Deactivated products are included with is_active false so the
+    client can drop them.
+
+    Args:
+        location_id: Kiosk/warehouse ID, or None for company-wide stock
+        since: Version stamp the client holds
+
+    Returns:
+        dict or None: {'version', 'fields', 'products', 'categories'};
+                      None when `since` is not a valid version (reload)
+    """
+    moment = parse_version(since)
+    if moment is None:
+        return None
+
+    version = catalog_version(location_id)
+    payload = {'version': version, 'fields': CATALOG_FIELDS, 'products': []}
+    if version == since:
+        return payload
+
+    if moment > datetime.min + timedelta(seconds=DELTA_OVERLAP_SECONDS):
+        moment -= timedelta(seconds=DELTA_OVERLAP_SECONDS)
+
+    changed = [Product.updated_at >= moment]
+    if location_id:
+        changed += [LocationStock.updated_at >= moment, LocationStock.last_movement_at >= moment]
+
+    payload['products'] = _rows(_catalog_query(location_id).filter(or_(*changed)), location_id)
+    payload['categories'] = _categories()
+    return payload
+
+
+def clear_catalog_cache():
+    """Forget all cached versions and snapshots"""
+    with _lock:
+        _versions.clear()
+        _snapshots.clear()
@@ -0,0 +1,640 @@
+"""
+Checkout Service
+Turns a POS cart into a sale (stock, batches, payments, ledger, loyalty) and
+replays queued offline sales idempotently, one transaction per batch
+"""
+
+import json
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.models import (db, Product, Sale, SaleItem, Customer, StockMovement, Payment,
+                        SyncQueue, LocationStock, Recipe, RawMaterialStock)
+from app.utils.helpers import generate_sale_number
+from app.services.batch_allocation_service import allocate_fefo
+from app.services.customer_service import invalidate_customer_profile
+from app.services.shift_ledger_service import record_sale
+
+
+# Longest accepted client idempotency key
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+# Most queued sales accepted in one replay request
+REPLAY_BATCH_LIMIT = 250
+
+# Offline sales older than this are refused on replay
+OFFLINE_SALE_MAX_AGE = timedelta(days=3)
+
+# Attempts at drawing an unused sale number
+SALE_NUMBER_ATTEMPTS = 20
+
+
+class CheckoutError(ValueError):
+    """A sale that cannot be completed as submitted"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# ============================================================
+# MADE-TO-ORDER PRODUCTS
+# ============================================================
+
+def deduct_raw_materials_for_sale(product, quantity, location_id, sale_id, sale_number, user_id):
+    """
+    Deduct raw materials from location-specific stock for a made-to-order sale.
+    Returns: {'success': bool, 'message': str, 'deductions': list}
+    """
+    from app.models import RawMaterialMovement
+
+    recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
+    if not recipe:
+        return {'success': False, 'message': f'No recipe found for {product.name}', 'deductions': []}
+
+    output_ml = float(recipe.output_size_ml or 0)
+    deductions = []
+
+    for ingredient in recipe.ingredients:
+        raw_material = ingredient.raw_material
+        if not raw_material:
+            continue
+
+        if ingredient.is_packaging:
+            # Bottle: 1 per unit produced
+            required_qty = quantity
+        else:
+            # Oil: calculate based on percentage and output size
+            percentage = float(ingredient.percentage or 100) / 100
+            required_qty = output_ml * percentage * quantity
+
+        # Get location-specific stock
+        stock = RawMaterialStock.query.filter_by(
+            raw_material_id=raw_material.id,
+            location_id=location_id
+        ).first()
+
+        if not stock:
+            return {
+                'success': False,
+                'message': f'No stock record for {raw_material.name} at this location',
+                'deductions': []
+            }
+
+        available = float(stock.available_quantity)
+        if available < required_qty:
+            return {
+                'success': False,
+                'message': f'Insufficient {raw_material.name}: need {required_qty:.2f}, have {available:.2f}',
+                'deductions': []
+            }
+
+        # Deduct from location stock
+        stock.quantity = Decimal(str(stock.quantity)) - Decimal(str(required_qty))
+        stock.last_movement_at = datetime.utcnow()
+
+        # Create movement record
+        movement = RawMaterialMovement(
+            raw_material_id=raw_material.id,
+            location_id=location_id,
+            user_id=user_id,
+            movement_type='pos_consumption',
+            quantity=-required_qty,
+            reference=sale_number,
+            notes=f'Made-to-order sale: {product.name} x{quantity}'
+        )
+        db.session.add(movement)
+
+        deductions.append({
+            'material_id': raw_material.id,
+            'material_name': raw_material.name,
+            'quantity': required_qty,
+            'unit': 'pcs' if ingredient.is_packaging else 'ml'
+        })
+
+    return {'success': True, 'message': 'Raw materials deducted', 'deductions': deductions}
+
+
+def get_attar_oil_availability(product, location_id):
+    """
+    Check oil availability for made-to-order attar products.
+    Returns dict with oil availability info or None if not made-to-order.
+    """
+    if not product.is_made_to_order:
+        return None
+
+    # Get the recipe for this product
+    recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
+    if not recipe:
+        return None
+
+    # Check if recipe can be produced at kiosk
+    if not recipe.can_produce_at_kiosk:
+        return None
+
+    # Get oil ingredients (non-packaging)
+    oil_ingredients = [ing for ing in recipe.ingredients if not ing.is_packaging]
+    if not oil_ingredients:
+        return None
+
+    # Calculate oil requirement per unit
+    output_ml = float(recipe.output_size_ml or 0)
+    # For attars oil_percentage is 100%, for perfumes it's a fraction (e.g. 35%)
+    oil_percentage = float(recipe.oil_percentage or 100) / 100
+    oil_required_per_unit = output_ml * oil_percentage
+
+    # Check oil availability at location
+    oil_info = []
+    min_can_produce = float('inf')
+
+    for ingredient in oil_ingredients:
+        raw_material = ingredient.raw_material
+        if not raw_material:
+            continue
+
+        # Get stock at this location
+        stock = RawMaterialStock.query.filter_by(
+            raw_material_id=raw_material.id,
+            location_id=location_id
+        ).first()
+
+        available_ml = float(stock.available_quantity) if stock else 0
+
+        # For single oil: full output_ml per unit
+        # For blended: percentage of output_ml
+        # For perfume: percentage of (output_ml * oil_percentage)
+        percentage = float(ingredient.percentage or 100) / 100
+        required_per_unit = output_ml * oil_percentage * percentage
+
+        # How many units can be made with this oil
+        can_produce = int(available_ml / required_per_unit) if required_per_unit > 0 else 0
+        min_can_produce = min(min_can_produce, can_produce)
+
+        oil_info.append({
+            'oil_id': raw_material.id,
+            'oil_code': raw_material.code,
+            'oil_name': raw_material.name,
+            'available_ml': round(available_ml, 2),
+            'required_per_unit': round(required_per_unit, 2),
+            'can_produce': can_produce
+        })
+
+    if min_can_produce == float('inf'):
+        min_can_produce = 0
+
+    # Return primary oil info (first oil for display)
+    primary_oil = oil_info[0] if oil_info else None
+
+    return {
+        'is_made_to_order': True,
+        'recipe_type': recipe.recipe_type,
+        'output_size_ml': output_ml,
+        'oil_name': primary_oil['oil_name'] if primary_oil else 'Unknown',
+        'oil_code': primary_oil['oil_code'] if primary_oil else '',
+        'oil_available_ml': primary_oil['available_ml'] if primary_oil else 0,
+        'oil_required_per_unit': oil_required_per_unit,
+        'max_can_produce': min_can_produce,
+        'oils': oil_info
+    }
+
+
+# ============================================================
+# IDEMPOTENCY
+# ============================================================
+
+def normalize_idempotency_key(key):
+    """
+    Validate a client idempotency key.
+
+    Returns:
+        str or None: Stripped key, None when absent
+
+    Raises:
+        CheckoutError: Key is too long
+    """
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise CheckoutError(f'Idempotency key longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+    return key
+
+
+def find_sale_by_key(key):
+    """Sale previously completed under an idempotency key, if any"""
+    if not key:
+        return None
+    return Sale.query.filter_by(idempotency_key=key).first()
+
+
+def sale_result(sale, loyalty=None, replayed=False):
+    """The complete-sale response body for a sale"""
+    result = {
+        'success': True,
+        'sale_id': sale.id,
+        'sale_number': sale.sale_number,
+        'total': float(sale.total),
+        'change': float(sale.amount_paid - sale.total),
+        'loyalty': loyalty
+    }
+    if replayed:
+        result['replayed'] = True
+    return result
+
+
+def _unused_sale_number():
+    for _ in range(SALE_NUMBER_ATTEMPTS):
+        number = generate_sale_number()
+        if not db.session.query(Sale.id).filter_by(sale_number=number).first():
+            return number
+    raise CheckoutError('Could not allocate a sale number, please retry', 503)
+
+
+# ============================================================
+# CHECKOUT
+# ============================================================
+
+def checkout(data, user, location, idempotency_key=None, sold_at=None):
+    """
+    Record one sale: items, stock and batch deductions, payments, ledger,
+    sync queue and loyalty. Flushes but does not commit.
+
+    Args:
+        data: complete-sale payload (items, totals, payments, customer)
+        user: User making the sale
+        location: Location the sale happens at (None for legacy stock)
+        idempotency_key: Client key stored on the sale
+        sold_at: When an offline sale actually happened
+
+    Returns:
+        dict: complete-sale response body
+
+    Raises:
+        CheckoutError: The cart cannot be sold (stock, permissions, data)
+    """
+    items = data.get('items', [])
+    if not items:
+        raise CheckoutError('No items in cart')
+
+    # Handle backdate sales (admin/manager only)
+    sale_date = sold_at
+    backdate_str = data.get('sale_date')
+    if backdate_str:
+        # Check if user has permission to backdate
+        if user.role not in ['admin', 'manager']:
+            raise CheckoutError('Only admin/manager can backdate sales', 403)
+        try:
+            sale_date = datetime.strptime(backdate_str, '%Y-%m-%d')
+        except ValueError:
+            raise CheckoutError('Invalid date format. Use YYYY-MM-DD')
+        # Don't allow future dates
+        if sale_date.date() > date.today():
+            raise CheckoutError('Cannot create sales with future dates')
+
+    # Create sale
+    sale = Sale(
+        sale_number=_unused_sale_number(),
+        idempotency_key=idempotency_key,
+        user_id=user.id,
+        customer_id=data.get('customer_id'),
+        location_id=location.id if location else None,  # Multi-kiosk support
+        subtotal=Decimal(str(data.get('subtotal', 0))),
+        discount=Decimal(str(data.get('discount', 0))),
+        discount_type=data.get('discount_type', 'amount'),
+        tax=Decimal(str(data.get('tax', 0))),
+        total=Decimal(str(data.get('total', 0))),
+        payment_method=data.get('payment_method', 'cash'),
+        amount_paid=Decimal(str(data.get('amount_paid', 0))),
+        notes=data.get('notes', '')
+    )
+
+    # Set sale date if backdating
+    if sale_date:
+        sale.sale_date = sale_date
+
+    # Calculate amount due
+    sale.amount_due = sale.total - sale.amount_paid
+    if sale.amount_due > 0:
+        sale.payment_status = 'partial'
+    else:
+        sale.payment_status = 'paid'
+
+    db.session.add(sale)
+    db.session.flush()  # Get sale ID
+
+    # Add sale items and update stock
+    batch_lines = {}
+    for item_data in items:
+        product = Product.query.get(item_data['product_id'])
+        if not product:
+            raise CheckoutError(f'Product {item_data["product_id"]} not found', 404)
+
+        quantity = int(item_data['quantity'])
+
+        # For made-to-order products, check oil availability instead of product stock
+        if product.is_made_to_order and location:
+            oil_info = get_attar_oil_availability(product, location.id)
+            if oil_info:
+                if oil_info['max_can_produce'] < quantity:
+                    raise CheckoutError(
+                        f'Insufficient oil for {product.name}. Can only make {oil_info["max_can_produce"]} units (need {oil_info["oil_required_per_unit"]}ml per unit, have {oil_info["oil_available_ml"]}ml of {oil_info["oil_name"]})'
+                    )
+                # Skip regular stock check for made-to-order products
+                location_stock = None
+            else:
+                # No recipe found - treat as regular product
+                location_stock = LocationStock.query.filter_by(
+                    location_id=location.id,
+                    product_id=product.id
+                ).first()
+                available_qty = location_stock.available_quantity if location_stock else 0
+                if available_qty < quantity:
+                    raise CheckoutError(
+                        f'Insufficient stock for {product.name} at this location. Available: {available_qty}'
+                    )
+        elif location:
+            # Regular product - check LocationStock for multi-kiosk
+            location_stock = LocationStock.query.filter_by(
+                location_id=location.id,
+                product_id=product.id
+            ).first()
+            available_qty = location_stock.available_quantity if location_stock else 0
+
+            if available_qty < quantity:
+                raise CheckoutError(
+                    f'Insufficient stock for {product.name} at this location. Available: {available_qty}'
+                )
+        else:
+            # Fallback: use product.quantity
+            location_stock = None
+            if product.quantity < quantity:
+                raise CheckoutError(f'Insufficient stock for {product.name}. Available: {product.quantity}')
+
+        # Create sale item
+        sale_item = SaleItem(
+            sale_id=sale.id,
+            product_id=product.id,
+            quantity=quantity,
+            unit_price=Decimal(str(item_data['unit_price'])),
+            discount=Decimal(str(item_data.get('discount', 0))),
+            subtotal=Decimal(str(item_data['subtotal']))
+        )
+        db.session.add(sale_item)
+
+        # Update stock - location-aware
+        # For made-to-order products, don't deduct from product stock (raw materials are deducted instead)
+        if product.is_made_to_order:
+            # Auto-deduct raw materials for made-to-order products
+            recipe = Recipe.query.filter_by(product_id=product.id, is_active=True).first()
+            if recipe:
+                # Deduct from location-specific raw material stock
+                deduction_result = deduct_raw_materials_for_sale(
+                    product, quantity, location.id if location else None, sale.id, sale.sale_number, user.id
+                )
+                if not deduction_result['success']:
+                    raise CheckoutError(deduction_result['message'])
+
+            # Create stock movement record (for tracking, even though no physical stock deducted)
+            stock_movement = StockMovement(
+                product_id=product.id,
+                user_id=user.id,
+                movement_type='sale',
+                quantity=-quantity,
+                reference=sale.sale_number,
+                notes=f'Made-to-order sale {sale.sale_number}',
+                location_id=location.id if location else None
+            )
+            db.session.add(stock_movement)
+        else:
+            # Regular product - deduct from stock
+            if location and location_stock:
+                # Update LocationStock
+                location_stock.quantity -= quantity
+                location_stock.last_movement_at = datetime.utcnow()
+                batch_lines[product.id] = batch_lines.get(product.id, 0) + quantity
+            elif not location:
+                # Fallback: update product.quantity
+                product.quantity -= quantity
+
+            # Create stock movement record with location
+            stock_movement = StockMovement(
+                product_id=product.id,
+                user_id=user.id,
+                movement_type='sale',
+                quantity=-quantity,
+                reference=sale.sale_number,
+                notes=f'Sale {sale.sale_number}',
+                location_id=location.id if location else None
+            )
+            db.session.add(stock_movement)
+
+    # Draw batch-tracked products from batches (FEFO) alongside LocationStock
+    if batch_lines:
+        batch_result = allocate_fefo(batch_lines, location.id, user.id, 'sale', sale.id,
+                                     reason=f'Sale {sale.sale_number}')
+        if batch_result['shortfall']:
+            product_id, short_qty = next(iter(batch_result['shortfall'].items()))
+            product = Product.query.get(product_id)
+            current_app.logger.warning(
+                f"Batch shortfall at location {location.id}: {batch_result['shortfall']}"
+            )
+            raise CheckoutError(
+                f'Insufficient batch stock for {product.name}. '
+                f'{float(short_qty):g} unit(s) not covered by unexpired batches'
+            )
+
+    # Handle split payments
+    payments_data = data.get('payments', [])
+    is_split = len(payments_data) > 1
+
+    if is_split:
+        # Multiple payment methods
+        sale.is_split_payment = True
+        sale.payment_method = 'split'  # Indicate split payment
+
+        total_paid = Decimal('0')
+        for idx, pmt in enumerate(payments_data, 1):
+            pmt_amount = Decimal(str(pmt.get('amount', 0)))
+            total_paid += pmt_amount
+            payment = Payment(
+                sale_id=sale.id,
+                amount=pmt_amount,
+                payment_method=pmt.get('method', 'cash'),
+                reference_number=pmt.get('reference', ''),
+                notes=pmt.get('notes', ''),
+                payment_order=idx
+            )
+            db.session.add(payment)
+
+        # Recalculate amount_paid from actual payments
+        sale.amount_paid = total_paid
+        sale.amount_due = sale.total - total_paid
+        sale.payment_status = 'paid' if sale.amount_due <= 0 else 'partial'
+
+    elif sale.amount_paid > 0:
+        # Single payment (existing logic)
+        payment = Payment(
+            sale_id=sale.id,
+            amount=sale.amount_paid,
+            payment_method=sale.payment_method,
+            reference_number=data.get('reference_number', ''),
+            notes=data.get('payment_notes', ''),
+            payment_order=1
+        )
+        db.session.add(payment)
+
+    # Add the sale to the location's running day totals
+    record_sale(sale, payments=[
+        (pmt.get('method', 'cash'), Decimal(str(pmt.get('amount', 0)))) for pmt in payments_data
+    ] if is_split else None)
+
+    # Queue for sync
+    sync_item = SyncQueue(
+        table_name='sales',
+        operation='insert',
+        record_id=sale.id,
+        data_json=json.dumps({
+            'sale_id': sale.id,
+            'sale_number': sale.sale_number
+        })
+    )
+    db.session.add(sync_item)
+
+    # Award loyalty points if customer is selected
+    customer_info = None
+    if sale.customer_id:
+        customer = Customer.query.get(sale.customer_id)
+        if customer:
+            # Award 1 point per Rs. 100 spent
+            points_earned = customer.add_loyalty_points(float(sale.total))
+
+            # Check and award badges (gamified loyalty)
+            new_badges = []
+            completed_challenges = []
+            try:
+                from app.routes.loyalty import check_and_award_badges, update_challenge_progress
+                new_badges = check_and_award_badges(sale.customer_id, sale)
+                completed_challenges = update_challenge_progress(sale.customer_id, sale)
+            except Exception as badge_error:
+                current_app.logger.error(f"Badge checking error: {badge_error}")
+
+            customer_info = {
+                'points_earned': points_earned,
+                'total_points': customer.loyalty_points,
+                'loyalty_tier': customer.loyalty_tier,
+                'points_value': customer.points_value_pkr,
+                'new_badges': new_badges,
+                'completed_challenges': completed_challenges
+            }
+
+    db.session.flush()
+    return sale_result(sale, loyalty=customer_info)
+
+
+# ============================================================
+# OFFLINE REPLAY
+# ============================================================
+
+def _offline_sale_time(value, now):
+    """Parse the time a queued sale was rung up; None if not given"""
+    if not value:
+        return None
+    try:
+        sold_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise CheckoutError('Invalid sold_at timestamp')
+    if sold_at.tzinfo is not None:
+        sold_at = sold_at.astimezone().replace(tzinfo=None)
+    if sold_at > now + timedelta(minutes=5):
+        raise CheckoutError('Cannot replay a sale from the future')
+    if now - sold_at > OFFLINE_SALE_MAX_AGE:
+        raise CheckoutError('Offline sale is too old to replay; enter it manually')
+    return sold_at
+
+
+def replay_offline_sales(queued_sales, user, location):
+    """
+    Replay sales a terminal queued while offline, in one transaction.
+
+    Each sale runs in its own savepoint: a sale that fails (for example
+    insufficient stock) is rolled back and reported while the rest of the
+    batch is kept. Sales already recorded under their idempotency key are
+    reported as duplicates with their original result. Commits once.
+
+    Args:
+        queued_sales: complete-sale payloads, each with an idempotency_key
+                      and optionally sold_at (ISO timestamp)
+        user: User replaying the queue
+        location: Terminal's location
+
+    Returns:
+        list: One {'idempotency_key', 'status', ...} per queued sale, in order;
+              status is 'created', 'duplicate' or 'rejected'
+    """
+    if len(queued_sales) > REPLAY_BATCH_LIMIT:
+        raise CheckoutError(f'At most {REPLAY_BATCH_LIMIT} sales per replay batch')
+
+    keys = []
+    for data in queued_sales:
+        try:
+            keys.append(normalize_idempotency_key(data.get('idempotency_key')))
+        except CheckoutError:
+            keys.append(None)
+
+    # One lookup for every key already recorded
+    existing = {
+        sale.idempotency_key: sale
+        for sale in Sale.query.filter(Sale.idempotency_key.in_([k for k in keys if k])).all()
+    } if any(keys) else {}
+
+    now = datetime.now()
+    results = []
+    customer_ids = set()
+    for data, key in zip(queued_sales, keys):
+        if not key:
+            results.append({'idempotency_key': data.get('idempotency_key'), 'status': 'rejected',
+                            'error': 'Missing or invalid idempotency key'})
+            continue
+        if key in existing:
+            results.append({'idempotency_key': key, 'status': 'duplicate',
+                            **sale_result(existing[key], replayed=True)})
+            continue
+
+        savepoint = db.session.begin_nested()
+        try:
+            result = checkout(data, user, location, idempotency_key=key,
+                              sold_at=_offline_sale_time(data.get('sold_at'), now))
+            savepoint.commit()
+        except CheckoutError as e:
+            savepoint.rollback()
+            results.append({'idempotency_key': key, 'status': 'rejected', 'error': e.message})
+            continue
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            # Malformed queued payload
+            savepoint.rollback()
+            results.append({'idempotency_key': key, 'status': 'rejected',
+                            'error': f'Invalid sale data: {e}'})
+            continue
+        except IntegrityError:
+            # The key was recorded by a concurrent replay of the same queue
+            savepoint.rollback()
+            duplicate = find_sale_by_key(key)
+            if duplicate is None:
+                raise
+            results.append({'idempotency_key': key, 'status': 'duplicate',
+                            **sale_result(duplicate, replayed=True)})
+            continue
+
+        existing[key] = Sale.query.get(result['sale_id'])
+        customer_ids.add(existing[key].customer_id)
+        results.append({'idempotency_key': key, 'status': 'created', **result})
+
+    db.session.commit()
+    invalidate_customer_profile(*customer_ids)
+    return results
@@ -0,0 +1,312 @@
+"""
+Cost Matrix Service
+Computes location-specific product costs for every (product, location) pair
+in one pass and keeps an in-memory lookup for POS and profit reports
+"""
+
+import threading
+import time
+import weakref
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from app.models import db, Product, Location
+from app.models_extended import LocationProductCost, ProductCostHistory
+
+
+DEFAULT_MARGIN_PERCENTAGE = Decimal('30')
+MATRIX_TTL_SECONDS = 300
+
+_CENT = Decimal('0.01')
+_ZERO = Decimal('0')
+
+CostEntry = namedtuple('CostEntry', [
+    'landed_cost', 'kiosk_charge', 'final_cost',
+    'suggested_selling_price', 'margin_percentage'
+])
+
+
+def _money(value):
+    """Round a cost value to the 2 decimal places stored in the database"""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value or 0))
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def compute_cost_entry(landed_cost, charge_type, charge_rate, margin_percentage=DEFAULT_MARGIN_PERCENTAGE):
+    """
+    Compute kiosk charge, final cost and suggested price for one pair.
+
+    Args:
+        landed_cost: Product landed cost
+        charge_type: Location kiosk_charge_type ('percentage' or 'fixed')
+        charge_rate: Location kiosk_charge_rate
+        margin_percentage: Margin used for the suggested selling price
+
+    Returns:
+        CostEntry with all values rounded to cents
+    """
+    landed = _money(landed_cost)
+    rate = Decimal(str(charge_rate or 0))
+    margin = Decimal(str(margin_percentage or 0))
+
+    if charge_type == 'percentage':
+        kiosk_charge = landed * rate / 100
+    else:  # fixed
+        kiosk_charge = rate
+
+    kiosk_charge = _money(kiosk_charge)
+    final_cost = landed + kiosk_charge
+    suggested = _money(final_cost * (1 + margin / 100))
+
+    return CostEntry(landed, kiosk_charge, final_cost, suggested, _money(margin))
+
+
+def _load_landed_costs(product_ids=None):
+    """
+    Load {product_id: (landed_cost, cost components)} for active products in one query.
+
+    Like Location.get_final_cost_for_product, products without a cost
+    breakdown fall back to their cost_price.
+    """
+    query = db.session.query(
+        Product.id, Product.base_cost, Product.packaging_cost,
+        Product.delivery_cost, Product.bottle_cost, Product.kiosk_cost,
+        Product.cost_price
+    ).filter(Product.is_active == True)
+
+    if product_ids is not None:
+        query = query.filter(Product.id.in_(product_ids))
+
+    landed = {}
+    for row in query:
+        components = (row.base_cost, row.packaging_cost, row.delivery_cost, row.bottle_cost)
+        total = sum((c or _ZERO) for c in components) + (row.kiosk_cost or _ZERO)
+        if not total:
+            total = row.cost_price or _ZERO
+        landed[row.id] = (_money(total), components)
+    return landed
+
+
+def _load_location_charges(location_ids=None):
+    """Load {location_id: (charge_type, charge_rate)} in one query"""
+    query = db.session.query(Location.id, Location.kiosk_charge_type, Location.kiosk_charge_rate)
+
+    if location_ids is not None:
+        query = query.filter(Location.id.in_(location_ids))
+    else:
+        query = query.filter(Location.is_active == True)
+
+    return {row.id: (row.kiosk_charge_type, row.kiosk_charge_rate) for row in query}
+
+
+def compute_cost_matrix(landed_costs, location_charges, margin_percentage=DEFAULT_MARGIN_PERCENTAGE):
+    """
+    Compute cost entries for every (product, location) pair.
+
+    Args:
+        landed_costs: {product_id: landed_cost}
+        location_charges: {location_id: (charge_type, charge_rate)}
+        margin_percentage: Margin used for suggested selling prices
+
+    Returns:
+        dict: {(product_id, location_id): CostEntry}
+    """
+    matrix = {}
+    for location_id, (charge_type, charge_rate) in location_charges.items():
+        for product_id, landed in landed_costs.items():
+            matrix[(product_id, location_id)] = compute_cost_entry(
+                landed, charge_type, charge_rate, margin_percentage
+            )
+    return matrix
+
+
+def rebuild_location_costs(location_ids=None, product_ids=None, user_id=None,
+                           reason=None, margin_percentage=DEFAULT_MARGIN_PERCENTAGE,
+                           commit=True):
+    """
+    Recompute and upsert LocationProductCost rows in bulk.
+
+    Existing rows are read in one query, only changed rows are written, and a
+    ProductCostHistory row is recorded once per product whose landed cost moved.
+
+    Args:
+        location_ids: Locations to rebuild (None = all active locations)
+        product_ids: Products to rebuild (None = all active products)
+        user_id: User recorded on cost history rows
+        reason: Change reason recorded on cost history rows
+        margin_percentage: Margin used for suggested selling prices
+        commit: Commit the session when done
+
+    Returns:
+        dict: Counts of pairs, inserted, updated, unchanged and history rows
+    """
+    result = {'pairs': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'history_recorded': 0}
+
+    location_charges = _load_location_charges(location_ids)
+    products = _load_landed_costs(product_ids)
+    if not location_charges or not products:
+        return result
+
+    matrix = compute_cost_matrix(
+        {pid: landed for pid, (landed, _) in products.items()},
+        location_charges,
+        margin_percentage
+    )
+    result['pairs'] = len(matrix)
+
+    existing_query = db.session.query(
+        LocationProductCost.id, LocationProductCost.location_id, LocationProductCost.product_id,
+        LocationProductCost.landed_cost, LocationProductCost.kiosk_charge,
+        LocationProductCost.final_cost, LocationProductCost.suggested_selling_price,
+        LocationProductCost.margin_percentage
+    ).filter(LocationProductCost.location_id.in_(list(location_charges)))
+    if product_ids is not None:
+        existing_query = existing_query.filter(LocationProductCost.product_id.in_(list(products)))
+
+    existing = {(row.product_id, row.location_id): row for row in existing_query}
+
+    now = datetime.utcnow()
+    inserts = []
+    updates = []
+    cost_changed_products = set()
+
+    for (product_id, location_id), entry in matrix.items():
+        row = existing.get((product_id, location_id))
+        values = entry._asdict()
+
+        if row is None:
+            inserts.append(dict(values, location_id=location_id, product_id=product_id, last_updated=now))
+            continue
+
+        stored = CostEntry(
+            _money(row.landed_cost), _money(row.kiosk_charge), _money(row.final_cost),
+            _money(row.suggested_selling_price), _money(row.margin_percentage)
+        )
+        if stored == entry:
+            result['unchanged'] += 1
+            continue
+
+        if stored.landed_cost != entry.landed_cost:
+            cost_changed_products.add(product_id)
+        updates.append(dict(values, id=row.id, last_updated=now))
+
+    if inserts:
+        db.session.bulk_insert_mappings(LocationProductCost, inserts)
+    if updates:
+        db.session.bulk_update_mappings(LocationProductCost, updates)
+
+    if cost_changed_products:
+        history = []
+        for product_id in sorted(cost_changed_products):
+            landed, (base, packaging, delivery, bottle) = products[product_id]
+            history.append({
+                'product_id': product_id,
+                'base_cost': base,
+                'packaging_cost': packaging,
+                'delivery_cost': delivery,
+                'bottle_cost': bottle,
+                'landed_cost': landed,
+                'effective_date': now,
+                'changed_by': user_id,
+                'change_reason': reason or 'Location cost recalculation'
+            })
+        db.session.bulk_insert_mappings(ProductCostHistory, history)
+        result['history_recorded'] = len(history)
+
+    result['inserted'] = len(inserts)
+    result['updated'] = len(updates)
+
+    if commit:
+        db.session.commit()
+    invalidate_cost_matrix()
+
+    return result
+
+
+# ============================================================
+# IN-MEMORY LOOKUP
+# ============================================================
+
+class CostMatrix:
+    """Read-only snapshot of LocationProductCost rows keyed by (product_id, location_id)"""
+
+    def __init__(self, entries, location_charges, built_at=None):
+        self._entries = entries
+        self._location_charges = location_charges
+        self.built_at = built_at or time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, product_id, location_id):
+        """Return the stored CostEntry for a pair, or None"""
+        return self._entries.get((product_id, location_id))
+
+    def final_cost(self, product, location_id):
+        """
+        Final cost of a product at a location without touching the database.
+
+        Falls back to computing from the product's landed cost and the
+        location's cached charge when no stored row exists yet.
+        """
+        product_id = getattr(product, 'id', product)
+        entry = self._entries.get((product_id, location_id))
+        if entry is not None:
+            return entry.final_cost
+
+        if not hasattr(product, 'landed_cost'):
+            return None
+
+        charge_type, charge_rate = self._location_charges.get(location_id, ('percentage', 0))
+        landed = product.landed_cost or getattr(product, 'cost_price', None)
+        return compute_cost_entry(landed, charge_type, charge_rate).final_cost
+
+
+_matrix_lock = threading.Lock()
+_matrix_cache = weakref.WeakKeyDictionary()  # engine -> CostMatrix
+
+
+def _build_cost_matrix():
+    """Load every LocationProductCost row and location charge in two queries"""
+    entries = {}
+    rows = db.session.query(
+        LocationProductCost.product_id, LocationProductCost.location_id,
+        LocationProductCost.landed_cost, LocationProductCost.kiosk_charge,
+        LocationProductCost.final_cost, LocationProductCost.suggested_selling_price,
+        LocationProductCost.margin_percentage
+    )
+    for row in rows:
+        entries[(row.product_id, row.location_id)] = CostEntry(
+            _money(row.landed_cost), _money(row.kiosk_charge), _money(row.final_cost),
+            _money(row.suggested_selling_price), _money(row.margin_percentage)
+        )
+
+    return CostMatrix(entries, _load_location_charges())
+
+
+def get_cost_matrix(max_age=MATRIX_TTL_SECONDS):
+    """
+    Get the process-wide cost matrix, rebuilding it when stale.
+
+    Args:
+        max_age: Seconds before a cached matrix is reloaded (other processes
+                 may have rebuilt costs in the meantime)
+
+    Returns:
+        CostMatrix
+    """
+    engine = db.engine
+    with _matrix_lock:
+        matrix = _matrix_cache.get(engine)
+        if matrix is None or time.monotonic() - matrix.built_at > max_age:
+            matrix = _build_cost_matrix()
+            _matrix_cache[engine] = matrix
+        return matrix
+
+
+def invalidate_cost_matrix():
+    """Drop the cached matrix so the next lookup reloads it"""
+    with _matrix_lock:
+        _matrix_cache.clear()
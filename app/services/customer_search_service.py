@@ -0,0 +1,170 @@
+"""
+Customer Search Service
+Indexed customer lookups by phone (any format, or its last digits), name
+word prefix and email, replacing leading-wildcard ilike scans
+"""
+
+from sqlalchemy import and_, func, or_, select
+
+from app.models import db, Customer, CustomerSearchToken
+from app.utils.helpers import DEFAULT_COUNTRY_CODE, normalize_phone, search_tokens
+
+
+# Fewest digits that count as a phone search ("last 4 digits")
+MIN_PHONE_DIGITS = 4
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _prefix_range(column, prefix):
+    """Index-friendly `column LIKE 'prefix%'` on any backend or collation"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+def _phone_prefix(raw, digits):
+    """E.164 prefix a partially typed number stands for, if it carries a country or trunk prefix"""
+    if raw.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if digits.startswith('0'):
+        return '+' + DEFAULT_COUNTRY_CODE + digits[1:]
+    if digits.startswith(DEFAULT_COUNTRY_CODE):
+        return '+' + digits
+    return None
+
+
+def _phone_condition(query):
+    raw = query.strip()
+    digits = ''.join(filter(str.isdigit, raw))
+    if len(digits) < MIN_PHONE_DIGITS or len(digits) < len(raw.replace(' ', '').replace('-', '')) - 1:
+        return None
+
+    # Typed digits may be the number's tail, its start, or all of it in another format
+    conditions = [_prefix_range(Customer.phone_reversed, digits[::-1])]
+    prefix = _phone_prefix(raw, digits)
+    if prefix and len(prefix) > 1:
+        conditions.append(_prefix_range(Customer.phone_e164, prefix))
+    full = normalize_phone(raw)
+    if full:
+        conditions.append(Customer.phone_e164 == full)
+    return or_(*conditions)
+
+
+def _token_condition(query):
+    if '@' in query:
+        # The whole address is a token; its words would also match other domains
+        tokens = [query.strip().lower()[:64]]
+    else:
+        tokens = sorted(search_tokens(query), key=len, reverse=True)
+    if not tokens:
+        return None
+
+    # The longest (most selective) word drives the lookup; the rest are
+    # checked per candidate on the (customer_id, token) index
+    condition = Customer.id.in_(select(CustomerSearchToken.customer_id)
+                                .where(_prefix_range(CustomerSearchToken.token, tokens[0])))
+    others = [
+        select(CustomerSearchToken.customer_id).where(
+            CustomerSearchToken.customer_id == Customer.id,
+            _prefix_range(CustomerSearchToken.token, token)
+        ).exists()
+        for token in tokens[1:]
+    ]
+    return and_(condition, *others)
+
+
+def customer_search_filter(query, active_only=False):
+    """
+    Filter matching customers by phone, name word prefix or email.
+
+    Phone searches match any stored format of the full number, its last
+    digits ("4567"), or a typed prefix ("0300", "+92300"). Words match the
+    start of any word in the name or email ("jo do" finds John Doe).
+
+    Args:
+        query: Search box text
+        active_only: Only active customers
+
+    Returns:
+        SQLAlchemy criterion on Customer (false() when nothing can match)
+    """
+    query = (query or '').strip()
+    conditions = [condition for condition in (_phone_condition(query), _token_condition(query))
+                  if condition is not None]
+    if not conditions:
+        return db.false()
+
+    criterion = or_(*conditions)
+    if active_only:
+        # Written so the planner cannot pick the (is_active, name) index and
+        # walk every active customer in name order instead of the search indexes
+        criterion = and_(criterion, func.coalesce(Customer.is_active, False) == True)
+    return criterion
+
+
+def search_customers(query, limit=10, active_only=True):
+    """
+    Customers matching a search, by name.
+
+    Returns:
+        list: Customer rows
+    """
+    return Customer.query.filter(customer_search_filter(query, active_only=active_only))\
+        .order_by(Customer.name, Customer.id).limit(limit).all()
+
+
+def find_customer_by_phone(phone):
+    """
+    Customer with this phone number in whatever format it was stored or typed.
+
+    Returns:
+        Customer or None
+    """
+    if not phone:
+        return None
+    customer = Customer.query.filter_by(phone=phone).first()
+    normalized = normalize_phone(phone)
+    if customer or not normalized:
+        return customer
+    return Customer.query.filter(Customer.phone_e164 == normalized)\
+        .order_by(Customer.is_active.desc(), Customer.id).first()
+
+
+# ============================================================
+# MAINTENANCE
+# ============================================================
+
+def rebuild_customer_search_index(batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute normalized phones and search tokens for every customer
+    (after bulk imports or raw SQL updates that bypass the model).
+
+    Returns:
+        int: Customers indexed
+    """
+    table = CustomerSearchToken.__table__
+    db.session.execute(table.delete())
+
+    indexed = 0
+    last_id = 0
+    while True:
+        customers = Customer.query.filter(Customer.id > last_id)\
+            .order_by(Customer.id).limit(batch_size).all()
+        if not customers:
+            break
+        rows = []
+        for customer in customers:
+            customer.validate_phone('phone', customer.phone)
+            rows.extend({'token': token, 'customer_id': customer.id}
+                        for token in customer.search_tokens)
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.flush()
+        indexed += len(customers)
+        last_id = customers[-1].id
+        db.session.expunge_all()
+
+    db.session.commit()
+    return indexed
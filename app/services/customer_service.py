@@ -0,0 +1,385 @@
+"""
+Customer Service
+Builds the customer 360 profile shown at the POS phone lookup from a handful
+of grouped queries and caches the sales-derived part until the next sale
+"""
+
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+from app.models import db, Product, Sale, SaleItem
+from app.services.customer_search_service import find_customer_by_phone
+
+
+# Seconds a cached profile is served; sales, refunds and returns invalidate sooner
+PROFILE_TTL_SECONDS = 300
+
+# Seconds the store-wide product popularity ranking is reused
+POPULARITY_TTL_SECONDS = 300
+
+# Products kept in the popularity ranking recommendations are picked from
+POPULARITY_RANKING_SIZE = 100
+
+TOP_PRODUCTS_LIMIT = 5
+RECOMMENDATIONS_LIMIT = 5
+
+_lock = threading.Lock()
+_profiles = weakref.WeakKeyDictionary()     # engine -> {customer_id: (stored_at, generation, history)}
+_generations = weakref.WeakKeyDictionary()  # engine -> {customer_id: int}
+_popularity = weakref.WeakKeyDictionary()   # engine -> (stored_at, [(id, name, price, image, popularity)])
+
+_executor = None
+_executor_workers = 0
+
+
+# ============================================================
+# CACHE
+# ============================================================
+
+def _generation(engine, customer_id):
+    return _generations.get(engine, {}).get(customer_id, 0)
+
+
+def invalidate_customer_profile(*customer_ids):
+    """
+    Drop cached profiles after a sale, refund, edit or return.
+
+    Args:
+        customer_ids: Customers whose purchase history changed (None ignored)
+    """
+    engine = db.engine
+    with _lock:
+        profiles = _profiles.get(engine, {})
+        generations = _generations.setdefault(engine, {})
+        for customer_id in customer_ids:
+            if customer_id is None:
+                continue
+            profiles.pop(customer_id, None)
+            generations[customer_id] = generations.get(customer_id, 0) + 1
+
+
+def clear_customer_cache():
+    """Forget all cached profiles and the popularity ranking"""
+    with _lock:
+        _profiles.clear()
+        _generations.clear()
+        _popularity.clear()
+
+
+# ============================================================
+# SUB-QUERIES
+# ============================================================
+
+def _order_stats(customer_id):
+    """Order count and lifetime spend in one aggregate"""
+    count, total = db.session.query(
+        func.count(Sale.id), func.coalesce(func.sum(Sale.total), 0)
+    ).filter(Sale.customer_id == customer_id).one()
+    return count, float(total or 0)
+
+
+def _preferred_payment(customer_id):
+    row = db.session.query(
+        Sale.payment_method, func.count(Sale.id).label('count')
+    ).filter(Sale.customer_id == customer_id)\
+     .group_by(Sale.payment_method)\
+     .order_by(db.desc('count')).first()
+    return row[0] if row else 'cash'
+
+
+def _last_order(customer_id):
+    """Most recent sale with its items and product names in one query"""
+    last_id = db.session.query(Sale.id)\
+        .filter(Sale.customer_id == customer_id)\
+        .order_by(Sale.sale_date.desc(), Sale.id.desc())\
+        .limit(1).scalar_subquery()
+
+    rows = db.session.query(
+        Sale.sale_number, Sale.sale_date, Sale.total, Sale.payment_method,
+        SaleItem.quantity, SaleItem.unit_price, SaleItem.subtotal, Product.name
+    ).select_from(Sale)\
+     .outerjoin(SaleItem, SaleItem.sale_id == Sale.id)\
+     .outerjoin(Product, Product.id == SaleItem.product_id)\
+     .filter(Sale.id == last_id)\
+     .order_by(SaleItem.id).all()
+
+    if not rows:
+        return None
+    first = rows[0]
+    return {
+        'sale_number': first.sale_number,
+        'sale_date': first.sale_date,
+        'total': float(first.total),
+        'payment_method': first.payment_method,
+        'items': [
+            {
+                'product_name': row.name or 'Unknown',
+                'quantity': row.quantity,
+                'unit_price': float(row.unit_price),
+                'subtotal': float(row.subtotal)
+            }
+            for row in rows if row.quantity is not None
+        ]
+    }
+
+
+def _purchased_products(customer_id):
+    """Every product the customer bought with purchase count and quantity, most bought first"""
+    rows = db.session.query(
+        Product.id,
+        Product.name,
+        Product.image_url,
+        func.count(SaleItem.id).label('purchase_count'),
+        func.sum(SaleItem.quantity).label('total_quantity')
+    ).select_from(Product)\
+     .join(SaleItem, SaleItem.product_id == Product.id)\
+     .join(Sale, Sale.id == SaleItem.sale_id)\
+     .filter(Sale.customer_id == customer_id)\
+     .group_by(Product.id, Product.name, Product.image_url).all()
+
+    return sorted(
+        ({
+            'product_id': row.id,
+            'product_name': row.name,
+            'image_url': row.image_url,
+            'purchase_count': row.purchase_count,
+            'total_quantity': row.total_quantity
+        } for row in rows),
+        key=lambda product: (-product['purchase_count'], product['product_id'])
+    )
+
+
+def _popularity_query(exclude_customer_id=None, exclude_products=(), limit=POPULARITY_RANKING_SIZE):
+    query = db.session.query(
+        Product.id,
+        Product.name,
+        Product.selling_price,
+        Product.image_url,
+        func.count(Sale.id).label('popularity')
+    ).select_from(Product)\
+     .join(SaleItem, SaleItem.product_id == Product.id)\
+     .join(Sale, Sale.id == SaleItem.sale_id)\
+     .filter(Product.is_active == True, Sale.customer_id.isnot(None))
+    if exclude_customer_id is not None:
+        query = query.filter(Sale.customer_id != exclude_customer_id)
+    if exclude_products:
+        query = query.filter(Product.id.notin_(list(exclude_products)))
+    return query.group_by(Product.id, Product.name, Product.selling_price, Product.image_url)\
+        .order_by(db.desc('popularity'), Product.id)\
+        .limit(limit).all()
+
+
+def _popularity_ranking():
+    engine = db.engine
+    with _lock:
+        cached = _popularity.get(engine)
+    if cached and time.monotonic() - cached[0] <= POPULARITY_TTL_SECONDS:
+        return cached[1]
+
+    ranking = [tuple(row) for row in _popularity_query()]
+    with _lock:
+        _popularity[engine] = (time.monotonic(), ranking)
+    return ranking
+
+
+def get_product_recommendations(customer_id, limit=RECOMMENDATIONS_LIMIT, purchased=None):
+    """
+    Popular products with other customers that this customer has not bought.
+
+    Args:
+        customer_id: Customer to recommend for
+        limit: Number of products
+        purchased: Product IDs the customer already bought (queried when None)
+
+    Returns:
+        list: Product dicts, most popular first
+    """
+    try:
+        if purchased is None:
+            purchased = {product['product_id'] for product in _purchased_products(customer_id)}
+
+        # Popularity counted over every customer equals popularity among the
+        # others once the customer's own products are excluded
+        ranking = _popularity_ranking()
+        picked = [row for row in ranking if row[0] not in purchased][:limit]
+        if len(picked) < limit and len(ranking) >= POPULARITY_RANKING_SIZE:
+            picked = _popularity_query(customer_id, purchased, limit)
+
+        return [
+            {
+                'product_id': row[0],
+                'product_name': row[1],
+                'selling_price': float(row[2]),
+                'image_url': row[3],
+                'popularity': row[4]
+            }
+            for row in picked
+        ]
+    except Exception:
+        # Return empty list if recommendations fail
+        return []
+
+
+# ============================================================
+# PROFILE
+# ============================================================
+
+def _parallel_workers():
+    """Thread pool size for independent sub-queries (0 runs them in sequence)"""
+    workers = current_app.config.get('CUSTOMER_PROFILE_WORKERS', 0)
+    # One shared connection (in-memory SQLite) cannot serve queries concurrently
+    if isinstance(db.engine.pool, (StaticPool, SingletonThreadPool)):
+        return 0
+    return workers
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='customer-profile')
+            _executor_workers = workers
+        return _executor
+
+
+def _in_app_context(app, task, *args):
+    # A fresh app context gets its own scoped session and connection
+    with app.app_context():
+        return task(*args)
+
+
+def run_parallel(tasks, workers):
+    """
+    Run independent (callable, args) tasks, each on its own session.
+
+    Args:
+        tasks: List of (callable, args tuple)
+        workers: Thread pool size; 0 or 1 runs them in sequence on this session
+
+    Returns:
+        list: Task results in order
+    """
+    if workers <= 1:
+        return [task(*args) for task, args in tasks]
+
+    app = current_app._get_current_object()
+    executor = _get_executor(workers)
+    futures = [executor.submit(_in_app_context, app, task, *args) for task, args in tasks]
+    return [future.result() for future in futures]
+
+
+def _purchase_history(customer_id):
+    """Sales-derived part of the profile, cached until the customer's next sale"""
+    engine = db.engine
+    with _lock:
+        generation = _generation(engine, customer_id)
+        cached = _profiles.get(engine, {}).get(customer_id)
+    if cached and cached[1] == generation and time.monotonic() - cached[0] <= PROFILE_TTL_SECONDS:
+        return cached[2]
+
+    (total_orders, total_spent), preferred_payment, last_order, purchased = run_parallel([
+        (_order_stats, (customer_id,)),
+        (_preferred_payment, (customer_id,)),
+        (_last_order, (customer_id,)),
+        (_purchased_products, (customer_id,)),
+    ], _parallel_workers())
+
+    history = {
+        'total_orders': total_orders,
+        'total_spent': total_spent,
+        'preferred_payment': preferred_payment,
+        'last_order': last_order,
+        'frequently_purchased': purchased[:TOP_PRODUCTS_LIMIT],
+        'recommendations': get_product_recommendations(
+            customer_id, purchased={product['product_id'] for product in purchased})
+    }
+
+    with _lock:
+        # A sale committed while this was built bumped the generation; don't cache stale data
+        if _generation(engine, customer_id) == generation:
+            _profiles.setdefault(engine, {})[customer_id] = (time.monotonic(), generation, history)
+    return history
+
+
+def customer_profile(customer, now=None):
+    """
+    Customer 360 view for the POS lookup.
+
+    Args:
+        customer: Customer row (always read fresh; loyalty points change outside sales)
+        now: Reference time for days-ago and birthday checks
+
+    Returns:
+        dict: {'customer', 'stats', 'last_order', 'frequently_purchased', 'recommendations'}
+    """
+    now = now or datetime.utcnow()
+    history = _purchase_history(customer.id)
+
+    is_birthday = False
+    birthday_str = None
+    if customer.birthday:
+        today = datetime.now().date()
+        is_birthday = (customer.birthday.month == today.month and customer.birthday.day == today.day)
+        birthday_str = customer.birthday.strftime('%d %b')
+
+    last_order = None
+    if history['last_order']:
+        last_order = dict(history['last_order'])
+        sale_date = last_order['sale_date']
+        last_order['sale_date'] = sale_date.strftime('%d %b %Y %H:%M')
+        last_order['days_ago'] = (now - sale_date).days
+
+    total_orders = history['total_orders']
+    avg_order_value = history['total_spent'] / total_orders if total_orders > 0 else 0
+
+    return {
+        'customer': {
+            'id': customer.id,
+            'name': customer.name,
+            'phone': customer.phone,
+            'email': customer.email,
+            'address': customer.address,
+            'loyalty_points': customer.loyalty_points,
+            'loyalty_tier': customer.loyalty_tier,
+            'loyalty_tier_color': customer.loyalty_tier_color,
+            'points_value_pkr': customer.points_value_pkr,
+            'points_to_next_tier': customer.points_to_next_tier,
+            'total_purchases': history['total_spent'],
+            'customer_type': customer.customer_type,
+            'account_balance': float(customer.account_balance or 0),
+            'notes': customer.notes,
+            'birthday': birthday_str,
+            'is_birthday': is_birthday
+        },
+        'stats': {
+            'total_orders': total_orders,
+            'avg_order_value': round(avg_order_value, 2),
+            'preferred_payment': history['preferred_payment'],
+            'member_since': customer.created_at.strftime('%b %Y') if customer.created_at else None
+        },
+        'last_order': last_order,
+        'frequently_purchased': history['frequently_purchased'],
+        'recommendations': history['recommendations']
+    }
+
+
+def lookup_customer_profile(phone):
+    """
+    Find a customer by phone and build their profile.
+
+    Returns:
+        dict or None: customer_profile() result, None when no customer has the phone
+    """
+    customer = find_customer_by_phone(phone)
+    if not customer:
+        return None
+    return customer_profile(customer)
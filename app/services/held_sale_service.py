@@ -0,0 +1,232 @@
+"""
+Held Sale Service
+Server-side parked carts keyed by location and user, with expiry and a small
+per-process LRU of cart payloads in front of the held_sales table
+"""
+
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+
+from app.models import db, HeldSale
+
+
+# Parked carts older than this are discarded
+HELD_SALE_TTL = timedelta(hours=24)
+
+# Cart payloads kept in memory per process (HELD_SALES_LRU_SIZE overrides; 0 disables)
+DEFAULT_LRU_SIZE = 256
+
+_lru_lock = threading.Lock()
+_lru = weakref.WeakKeyDictionary()  # engine -> OrderedDict(held sale id -> decoded payload)
+
+
+def _lru_size():
+    return current_app.config.get('HELD_SALES_LRU_SIZE', DEFAULT_LRU_SIZE)
+
+
+def _lru_for_engine():
+    return _lru.setdefault(db.engine, OrderedDict())
+
+
+def _lru_get(held_id):
+    with _lru_lock:
+        cache = _lru_for_engine()
+        payload = cache.get(held_id)
+        if payload is not None:
+            cache.move_to_end(held_id)
+        return payload
+
+
+def _lru_put(held_id, payload):
+    size = _lru_size()
+    if size <= 0:
+        return
+    with _lru_lock:
+        cache = _lru_for_engine()
+        cache[held_id] = payload
+        cache.move_to_end(held_id)
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+
+def _lru_discard(held_ids):
+    with _lru_lock:
+        cache = _lru_for_engine()
+        for held_id in held_ids:
+            cache.pop(held_id, None)
+
+
+def clear_held_sale_cache():
+    """Forget all cached cart payloads"""
+    with _lru_lock:
+        _lru.clear()
+
+
+# ============================================================
+# STORE
+# ============================================================
+
+def _scope(query, location_id, user_id):
+    query = query.filter(HeldSale.location_id == location_id)
+    if user_id is not None:
+        query = query.filter(HeldSale.user_id == user_id)
+    return query
+
+
+def purge_expired(now=None):
+    """
+    Delete parked carts past their expiry.
+
+    Returns:
+        int: Number of carts removed
+    """
+    now = now or datetime.utcnow()
+    expired = [held_id for (held_id,) in
+               db.session.query(HeldSale.id).filter(HeldSale.expires_at <= now)]
+    if not expired:
+        return 0
+    HeldSale.query.filter(HeldSale.id.in_(expired)).delete(synchronize_session=False)
+    _lru_discard(expired)
+    return len(expired)
+
+
+def hold_sale(user_id, location_id, data, ttl=HELD_SALE_TTL):
+    """
+    Park a cart.
+
+    Args:
+        user_id: Cashier parking the cart
+        location_id: Location the cart belongs to (None without one)
+        data: hold-sale payload - items, customer_id, notes and optionally
+              the terminal's own cart/customer display state
+        ttl: How long the cart is kept
+
+    Returns:
+        HeldSale: The new (flushed) row
+    """
+    items = data.get('items') or []
+    payload = {
+        'items': items,
+        'cart': data.get('cart'),
+        'customer': data.get('customer')
+    }
+
+    total = Decimal('0')
+    item_count = 0
+    for item in items:
+        quantity = item.get('quantity') or 0
+        item_count += int(quantity)
+        if item.get('subtotal') is not None:
+            total += Decimal(str(item['subtotal']))
+        elif item.get('unit_price') is not None:
+            total += Decimal(str(item['unit_price'])) * int(quantity)
+
+    now = datetime.utcnow()
+    purge_expired(now)
+
+    held = HeldSale(
+        location_id=location_id,
+        user_id=user_id,
+        customer_id=data.get('customer_id'),
+        notes=data.get('notes', ''),
+        item_count=item_count,
+        total=total,
+        payload=json.dumps(payload, separators=(',', ':')),
+        created_at=now,
+        expires_at=now + ttl
+    )
+    db.session.add(held)
+    db.session.flush()
+    _lru_put(held.id, payload)
+    return held
+
+
+def list_held_sales(location_id, user_id=None, now=None):
+    """
+    Parked carts at a location, oldest first.
+
+    Args:
+        location_id: Location to list
+        user_id: Only this cashier's carts (None for everyone's)
+
+    Returns:
+        list: HeldSale rows that have not expired
+    """
+    now = now or datetime.utcnow()
+    return _scope(HeldSale.query, location_id, user_id).filter(
+        HeldSale.expires_at > now
+    ).order_by(HeldSale.created_at, HeldSale.id).all()
+
+
+def get_held_sale(location_id, user_id=None, held_id=None, index=None, now=None):
+    """
+    Look up one parked cart by ID or by its position in list_held_sales().
+
+    Returns:
+        HeldSale or None
+    """
+    now = now or datetime.utcnow()
+    query = _scope(HeldSale.query, location_id, user_id).filter(HeldSale.expires_at > now)
+    if held_id is not None:
+        return query.filter(HeldSale.id == held_id).first()
+    if index is not None and index >= 0:
+        return query.order_by(HeldSale.created_at, HeldSale.id).offset(index).first()
+    return None
+
+
+def held_sale_payload(held):
+    """Decoded cart payload of a parked cart (served from the LRU when cached)"""
+    payload = _lru_get(held.id)
+    if payload is None:
+        payload = json.loads(held.payload or '{}')
+        _lru_put(held.id, payload)
+    return payload
+
+
+def delete_held_sale(held):
+    """Remove a parked cart (flushes)"""
+    _lru_discard([held.id])
+    db.session.delete(held)
+    db.session.flush()
+
+
+def serialize_held_sale(held, index=None):
+    """JSON-ready view of a parked cart"""
+    payload = held_sale_payload(held)
+    return {
+        'id': held.id,
+        'index': index,
+        'timestamp': held.created_at.isoformat() if held.created_at else None,
+        'expires_at': held.expires_at.isoformat() if held.expires_at else None,
+        'user_id': held.user_id,
+        'user_name': held.user.full_name if held.user else None,
+        'location_id': held.location_id,
+        'customer_id': held.customer_id,
+        'notes': held.notes,
+        'item_count': held.item_count,
+        'total': float(held.total or 0),
+        'items': payload.get('items', []),
+        'cart': payload.get('cart'),
+        'customer': payload.get('customer')
+    }
+
+
+def import_session_holds(session, user_id, location_id):
+    """
+    Move carts parked in the old cookie session into the store.
+
+    Returns:
+        int: Number of carts moved
+    """
+    legacy = session.pop('held_sales', None)
+    if not legacy:
+        return 0
+    for entry in legacy:
+        hold_sale(user_id, location_id, entry)
+    return len(legacy)
@@ -0,0 +1,448 @@
+"""
+Search Service
+Full-text index over products, customers, suppliers, purchase orders, sales
+and transfers (FTS5 on SQLite, tsvector + GIN on PostgreSQL) kept in sync by
+triggers, with BM25-ranked lookups shared by every search box
+"""
+
+import re
+import threading
+import weakref
+from collections import namedtuple
+
+from sqlalchemy import event, inspect, or_, text
+from sqlalchemy.exc import OperationalError
+
+from app.models import (db, Customer, Product, PurchaseOrder, Sale, StockTransfer,
+                        Supplier)
+
+
+INDEX_TABLE = 'search_documents'
+
+# Document ids pack the source row id and kind: ref_id * KIND_SLOTS + kind code
+KIND_SLOTS = 8
+
+# Title matches weigh this much more than body matches in the ranking
+TITLE_WEIGHT = 10.0
+
+MAX_QUERY_TERMS = 8
+
+# A search source: the indexed table, its title/body SQL (`{row}` is the row
+# alias, NEW in triggers), the rows indexed, the columns whose changes
+# re-index a row, the model columns the LIKE fallback scans, and the
+# (table, foreign key) rows whose documents embed this one's name
+SearchSource = namedtuple('SearchSource', [
+    'kind', 'code', 'model', 'title', 'body', 'condition', 'watched', 'like_columns', 'dependents'
+])
+
+SOURCES = [
+    SearchSource(
+        'product', 1, Product,
+        "{row}.name",
+        "coalesce({row}.code, '') || ' ' || coalesce({row}.barcode, '') || ' ' || coalesce({row}.brand, '')",
+        "{row}.is_active", ('name', 'code', 'barcode', 'brand', 'is_active'),
+        ('name', 'code', 'barcode', 'brand'), ()
+    ),
+    SearchSource(
+        'customer', 2, Customer,
+        "{row}.name",
+        "coalesce({row}.phone, '') || ' ' || coalesce({row}.email, '')",
+        None, ('name', 'phone', 'email'),
+        ('name', 'phone', 'email'), ()
+    ),
+    SearchSource(
+        'supplier', 3, Supplier,
+        "{row}.name",
+        "coalesce({row}.contact_person, '') || ' ' || coalesce({row}.phone, '') || ' ' || coalesce({row}.email, '')",
+        "{row}.is_active", ('name', 'contact_person', 'phone', 'email', 'is_active'),
+        ('name', 'contact_person'), (('purchase_orders', 'supplier_id'),)
+    ),
+    SearchSource(
+        'purchase_order', 4, PurchaseOrder,
+        "{row}.po_number",
+        "coalesce((SELECT name FROM suppliers WHERE suppliers.id = {row}.supplier_id), '')",
+        None, ('po_number', 'supplier_id'),
+        ('po_number',), ()
+    ),
+    SearchSource(
+        'sale', 5, Sale,
+        "{row}.sale_number", "''",
+        None, ('sale_number',),
+        ('sale_number',), ()
+    ),
+    SearchSource(
+        'transfer', 6, StockTransfer,
+        "{row}.transfer_number", "coalesce({row}.request_notes, '')",
+        None, ('transfer_number', 'request_notes'),
+        ('transfer_number',), ()
+    ),
+]
+
+SOURCES_BY_KIND = {source.kind: source for source in SOURCES}
+
+_lock = threading.Lock()
+_backends = weakref.WeakKeyDictionary()  # engine -> backend
+
+
+def _touch_dependents(source, row):
+    """Statements that re-fire the triggers of rows embedding this row's name"""
+    return [f"UPDATE {table} SET {column} = {column} WHERE {column} = {row}.id"
+            for table, column in source.dependents]
+
+
+def query_terms(query):
+    """Lowercase words of a search, as the index tokenizes them"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_QUERY_TERMS]
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class SQLiteFTSBackend:
+    """FTS5 virtual table; the document id is the rowid"""
+
+    name = 'sqlite-fts5'
+
+    def available(self, connection):
+        """Whether this SQLite build has FTS5"""
+        try:
+            connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)"))
+        except OperationalError:
+            return False
+        connection.execute(text("DROP TABLE temp.fts5_probe"))
+        return True
+
+    def install(self, connection):
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            f"title, body, tokenize='unicode61', prefix='2 3')"
+        ))
+        for source in SOURCES:
+            table = source.model.__tablename__
+            doc_id = f'NEW.id * {KIND_SLOTS} + {source.code}'
+            row = {'row': 'NEW'}
+            insert = (f"INSERT INTO {INDEX_TABLE}(rowid, title, body) "
+                      f"SELECT {doc_id}, {source.title.format(**row)}, {source.body.format(**row)}")
+            if source.condition:
+                insert += f" WHERE {source.condition.format(**row)}"
+            delete = f"DELETE FROM {INDEX_TABLE} WHERE rowid = OLD.id * {KIND_SLOTS} + {source.code}"
+
+            update = ''.join(f'{statement}; ' for statement in
+                             [delete, insert] + _touch_dependents(source, 'NEW'))
+            for suffix, statement in (
+                ('ai', f"AFTER INSERT ON {table} BEGIN {insert}; END"),
+                ('au', f"AFTER UPDATE OF {', '.join(source.watched)} ON {table} "
+                       f"BEGIN {update}END"),
+                ('ad', f"AFTER DELETE ON {table} BEGIN {delete}; END"),
+            ):
+                connection.execute(text(f"DROP TRIGGER IF EXISTS search_{source.kind}_{suffix}"))
+                connection.execute(text(f"CREATE TRIGGER search_{source.kind}_{suffix} {statement}"))
+
+    def uninstall(self, connection):
+        for source in SOURCES:
+            for suffix in ('ai', 'au', 'ad'):
+                connection.execute(text(f"DROP TRIGGER IF EXISTS search_{source.kind}_{suffix}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+
+    def match_expression(self, terms):
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def ranked_sql(self):
+        return (
+            f"SELECT doc_id FROM ("
+            f"  SELECT rowid AS doc_id, row_number() OVER ("
+            f"    PARTITION BY rowid % {KIND_SLOTS} ORDER BY bm25({INDEX_TABLE}, {TITLE_WEIGHT}, 1.0)"
+            f"  ) AS position"
+            f"  FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :match AND rowid % {KIND_SLOTS} IN :codes"
+            f") WHERE position <= :limit ORDER BY doc_id % {KIND_SLOTS}, position"
+        )
+
+    def ids_sql(self):
+        return (f"SELECT rowid / {KIND_SLOTS} AS ref_id FROM {INDEX_TABLE} "
+                f"WHERE {INDEX_TABLE} MATCH :match AND rowid % {KIND_SLOTS} = :code")
+
+
+class PostgresFTSBackend:
+    """tsvector column with a GIN index; the document id is the primary key"""
+
+    name = 'postgres-tsvector'
+
+    def install(self, connection):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+            f" doc_id BIGINT PRIMARY KEY, title TEXT, body TEXT,"
+            f" tsv TSVECTOR GENERATED ALWAYS AS ("
+            f"  setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||"
+            f"  setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED)"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{INDEX_TABLE}_tsv ON {INDEX_TABLE} USING GIN (tsv)"
+        ))
+        for source in SOURCES:
+            table = source.model.__tablename__
+            row = {'row': 'NEW'}
+            condition = source.condition.format(**row) if source.condition else 'TRUE'
+            touch = ''.join(f" IF TG_OP = 'UPDATE' THEN {statement}; END IF; "
+                            for statement in _touch_dependents(source, 'NEW'))
+            connection.execute(text(
+                f"CREATE OR REPLACE FUNCTION search_sync_{source.kind}() RETURNS trigger AS $$ "
+                f"BEGIN "
+                f" IF TG_OP <> 'INSERT' THEN "
+                f"  DELETE FROM {INDEX_TABLE} WHERE doc_id = OLD.id * {KIND_SLOTS} + {source.code}; "
+                f" END IF; "
+                f" IF TG_OP <> 'DELETE' AND {condition} THEN "
+                f"  INSERT INTO {INDEX_TABLE}(doc_id, title, body) VALUES ("
+                f"   NEW.id * {KIND_SLOTS} + {source.code}, {source.title.format(**row)}, "
+                f"   {source.body.format(**row)}); "
+                f" END IF; "
+                f"{touch}"
+                f" RETURN NULL; "
+                f"END $$ LANGUAGE plpgsql"
+            ))
+            connection.execute(text(f"DROP TRIGGER IF EXISTS search_{source.kind} ON {table}"))
+            connection.execute(text(
+                f"CREATE TRIGGER search_{source.kind} "
+                f"AFTER INSERT OR DELETE OR UPDATE OF {', '.join(source.watched)} ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION search_sync_{source.kind}()"
+            ))
+
+    def uninstall(self, connection):
+        for source in SOURCES:
+            connection.execute(text(
+                f"DROP TRIGGER IF EXISTS search_{source.kind} ON {source.model.__tablename__}"
+            ))
+            connection.execute(text(f"DROP FUNCTION IF EXISTS search_sync_{source.kind}()"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+
+    def match_expression(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def ranked_sql(self):
+        return (
+            f"SELECT doc_id FROM ("
+            f"  SELECT doc_id, row_number() OVER ("
+            f"    PARTITION BY doc_id % {KIND_SLOTS}"
+            f"    ORDER BY ts_rank(tsv, to_tsquery('simple', :match)) DESC"
+            f"  ) AS position"
+            f"  FROM {INDEX_TABLE} WHERE tsv @@ to_tsquery('simple', :match)"
+            f"  AND doc_id % {KIND_SLOTS} IN :codes"
+            f") ranked WHERE position <= :limit ORDER BY doc_id % {KIND_SLOTS}, position"
+        )
+
+    def ids_sql(self):
+        return (f"SELECT doc_id / {KIND_SLOTS} AS ref_id FROM {INDEX_TABLE} "
+                f"WHERE tsv @@ to_tsquery('simple', :match) AND doc_id % {KIND_SLOTS} = :code")
+
+
+class LikeBackend:
+    """No full-text support (or index not installed): substring scans"""
+
+    name = 'like'
+
+    def install(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+
+def _backend_for_dialect(dialect_name):
+    if dialect_name == 'sqlite':
+        return SQLiteFTSBackend()
+    if dialect_name == 'postgresql':
+        return PostgresFTSBackend()
+    return LikeBackend()
+
+
+def get_backend(engine=None):
+    """
+    Search backend for an engine: the dialect's full-text backend when its
+    index is installed, otherwise the LIKE fallback.
+    """
+    engine = engine or db.engine
+    with _lock:
+        backend = _backends.get(engine)
+    if backend is not None:
+        return backend
+
+    backend = _backend_for_dialect(engine.dialect.name)
+    if not isinstance(backend, LikeBackend) and not inspect(engine).has_table(INDEX_TABLE):
+        backend = LikeBackend()
+    with _lock:
+        _backends[engine] = backend
+    return backend
+
+
+def install_search_index(connection):
+    """
+    Create the index table and sync triggers (idempotent).
+
+    Args:
+        connection: Connection to install on (dialect picks the backend)
+
+    Returns:
+        str: Backend name, or 'like' when the dialect has no full-text support
+    """
+    backend = _backend_for_dialect(connection.dialect.name)
+    if isinstance(backend, SQLiteFTSBackend) and not backend.available(connection):
+        backend = LikeBackend()
+    backend.install(connection)
+    with _lock:
+        _backends.pop(connection.engine, None)
+    return backend.name
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _install_after_create(target, connection, **kw):
+    """New databases (db.create_all) get the index and triggers straight away"""
+    install_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _uninstall_before_drop(target, connection, **kw):
+    _backend_for_dialect(connection.dialect.name).uninstall(connection)
+    with _lock:
+        _backends.pop(connection.engine, None)
+
+
+# ============================================================
+# QUERIES
+# ============================================================
+
+def _like_condition(source, terms):
+    model = source.model
+    condition = db.and_(*[
+        or_(*[getattr(model, column).ilike(f'%{term}%') for column in source.like_columns])
+        for term in terms
+    ])
+    if source.condition:
+        condition = db.and_(condition, model.is_active == True)
+    return condition
+
+
+def search(query, kinds=None, limit=5):
+    """
+    Best matches per kind, ranked by BM25 (SQLite) or ts_rank (PostgreSQL).
+
+    Every word must match the start of a word in the document, so
+    "oud roy" finds "Royal Oud".
+
+    Args:
+        query: Search box text
+        kinds: Kinds to search (default all; see SOURCES)
+        limit: Matches per kind
+
+    Returns:
+        dict: kind -> list of row ids, best first
+    """
+    kinds = list(kinds or SOURCES_BY_KIND)
+    results = {kind: [] for kind in kinds}
+    terms = query_terms(query)
+    if not terms:
+        return results
+
+    backend = get_backend()
+    if isinstance(backend, LikeBackend):
+        for kind in kinds:
+            source = SOURCES_BY_KIND[kind]
+            rows = db.session.query(source.model.id)\
+                .filter(_like_condition(source, terms)).limit(limit).all()
+            results[kind] = [row[0] for row in rows]
+        return results
+
+    statement = text(backend.ranked_sql()).bindparams(db.bindparam('codes', expanding=True))
+    rows = db.session.execute(statement, {
+        'match': backend.match_expression(terms),
+        'codes': [SOURCES_BY_KIND[kind].code for kind in kinds],
+        'limit': limit
+    })
+    kind_by_code = {source.code: source.kind for source in SOURCES}
+    for (doc_id,) in rows:
+        results[kind_by_code[doc_id % KIND_SLOTS]].append(doc_id // KIND_SLOTS)
+    return results
+
+
+def search_filter(kind, query):
+    """
+    Criterion selecting rows of a kind that match a search, for list pages
+    that add their own filters, ordering and pagination.
+
+    Args:
+        kind: Source kind ('product', 'supplier', ...)
+        query: Search box text
+
+    Returns:
+        SQLAlchemy criterion on the kind's model
+    """
+    source = SOURCES_BY_KIND[kind]
+    terms = query_terms(query)
+    if not terms:
+        return db.true()
+
+    backend = get_backend()
+    if isinstance(backend, LikeBackend):
+        return _like_condition(source, terms)
+
+    ids = text(backend.ids_sql()).bindparams(
+        match=backend.match_expression(terms), code=source.code
+    ).columns(ref_id=db.Integer)
+    return source.model.id.in_(ids)
+
+
+def load_ranked(model, ids):
+    """Rows for ranked ids, in rank order"""
+    if not ids:
+        return []
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids)).all()}
+    return [rows[row_id] for row_id in ids if row_id in rows]
+
+
+# ============================================================
+# MAINTENANCE
+# ============================================================
+
+def populate_search_index(connection):
+    """
+    Install the index and re-create every document from the source tables
+    in one set-based pass per kind.
+
+    Args:
+        connection: Connection to run on (also used by migrations)
+
+    Returns:
+        dict: kind -> documents indexed (empty for the LIKE fallback)
+    """
+    backend_name = install_search_index(connection)
+    counts = {}
+    if backend_name == LikeBackend.name:
+        return counts
+
+    id_column = 'rowid' if backend_name == SQLiteFTSBackend.name else 'doc_id'
+    connection.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+    for source in SOURCES:
+        row = {'row': 'src'}
+        statement = (
+            f"INSERT INTO {INDEX_TABLE}({id_column}, title, body) "
+            f"SELECT src.id * {KIND_SLOTS} + {source.code}, {source.title.format(**row)}, "
+            f"{source.body.format(**row)} FROM {source.model.__tablename__} src"
+        )
+        if source.condition:
+            statement += f" WHERE {source.condition.format(**row)}"
+        counts[source.kind] = connection.execute(text(statement)).rowcount
+    if backend_name == SQLiteFTSBackend.name:
+        connection.execute(text(f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}) VALUES ('optimize')"))
+    return counts
+
+
+def rebuild_search_index():
+    """
+    Rebuild the index (after restores, bulk imports or raw SQL that
+    skipped the triggers).
+
+    Returns:
+        dict: kind -> documents indexed
+    """
+    counts = populate_search_index(db.session.connection())
+    db.session.commit()
+    return counts
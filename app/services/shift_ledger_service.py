@@ -0,0 +1,477 @@
+"""
+Shift Ledger Service
+Keeps running per-location, per-day sales totals up to date as sales, refunds
+and returns happen, freezes Z-report snapshots and reconciles the ledger
+against raw sales
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+from datetime import datetime, date
+from decimal import Decimal
+
+from sqlalchemy import and_, or_, func, extract
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Sale, SaleItem, Payment, Product, ShiftLedger
+from app.models_extended import Return
+
+
+# Sale statuses whose takings stay in the day's sales totals
+COUNTED_SALE_STATUSES = ('completed', 'partial_return')
+
+# Payment method -> ledger column; anything else is booked as "other"
+PAYMENT_METHOD_COLUMNS = {
+    'cash': 'total_cash',
+    'card': 'total_card',
+    'easypaisa': 'total_easypaisa',
+    'jazzcash': 'total_jazzcash',
+    'bank_transfer': 'total_bank_transfer',
+    'credit': 'total_credit',
+}
+
+COUNT_FIELDS = ('sale_count', 'refund_count')
+AMOUNT_FIELDS = (
+    'gross_sales', 'total_discounts', 'total_tax', 'net_sales', 'total_refunds',
+    'total_cash', 'total_card', 'total_easypaisa', 'total_jazzcash',
+    'total_bank_transfer', 'total_credit', 'total_other'
+)
+LEDGER_FIELDS = COUNT_FIELDS + AMOUNT_FIELDS
+
+LedgerEntry = namedtuple('LedgerEntry', ['location_id', 'business_date', 'deltas'])
+
+_ledger_table = ShiftLedger.__table__
+
+
+def _money(value):
+    """Quantize a numeric value to 2 decimal places"""
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def _as_date(value):
+    """func.date() returns a string on SQLite and a date elsewhere"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _method_column(method):
+    return PAYMENT_METHOD_COLUMNS.get(method, 'total_other')
+
+
+def empty_totals():
+    """Zero value for every ledger field"""
+    totals = {field: 0 for field in COUNT_FIELDS}
+    totals.update({field: Decimal('0.00') for field in AMOUNT_FIELDS})
+    return totals
+
+
+# ============================================================
+# LEDGER ENTRIES
+# ============================================================
+
+def ledger_entry(sale, payments=None):
+    """
+    Ledger deltas a sale contributes to its location and business day.
+
+    Split sales are spread over the methods of their Payment rows; any part
+    of the total not covered by payments is booked as "other".
+
+    Args:
+        sale: Sale object
+        payments: Optional list of (payment_method, amount) for a split sale
+                  whose Payment rows are not flushed yet
+
+    Returns:
+        LedgerEntry: deltas are empty when the sale does not count
+    """
+    business_date = sale.sale_date.date() if sale.sale_date else date.today()
+    if not sale.location_id or sale.status not in COUNTED_SALE_STATUSES:
+        return LedgerEntry(sale.location_id, business_date, {})
+
+    total = _money(sale.total)
+    deltas = {
+        'sale_count': 1,
+        'gross_sales': _money(sale.subtotal),
+        'total_discounts': _money(sale.discount),
+        'total_tax': _money(sale.tax),
+        'net_sales': total,
+    }
+
+    if sale.is_split_payment:
+        if payments is None:
+            payments = db.session.query(Payment.payment_method, Payment.amount).filter(
+                Payment.sale_id == sale.id
+            ).all()
+        paid = Decimal('0.00')
+        for method, amount in payments:
+            column = _method_column(method)
+            deltas[column] = deltas.get(column, Decimal('0.00')) + _money(amount)
+            paid += _money(amount)
+        if total != paid:
+            deltas['total_other'] = deltas.get('total_other', Decimal('0.00')) + total - paid
+    else:
+        column = _method_column(sale.payment_method)
+        deltas[column] = deltas.get(column, Decimal('0.00')) + total
+
+    return LedgerEntry(sale.location_id, business_date, deltas)
+
+
+def post_entry(entry, sign=1):
+    """
+    Add (or with sign=-1, subtract) a ledger entry with an atomic UPDATE.
+
+    The row for the location and day is created on first use; if another
+    request creates it first the increment is simply retried.
+    """
+    if entry is None or not entry.location_id or not entry.deltas:
+        return
+
+    deltas = {field: value * sign for field, value in entry.deltas.items() if value}
+    if not deltas:
+        return
+
+    key = and_(
+        _ledger_table.c.location_id == entry.location_id,
+        _ledger_table.c.business_date == entry.business_date
+    )
+    increment = _ledger_table.update().where(key).values(
+        updated_at=datetime.utcnow(),
+        **{field: _ledger_table.c[field] + delta for field, delta in deltas.items()}
+    )
+
+    if db.session.execute(increment).rowcount == 0:
+        row = empty_totals()
+        row.update(deltas)
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.execute(_ledger_table.insert().values(
+                location_id=entry.location_id,
+                business_date=entry.business_date,
+                updated_at=datetime.utcnow(),
+                **row
+            ))
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+            db.session.execute(increment)
+
+    for obj in list(db.session.identity_map.values()):
+        if (isinstance(obj, ShiftLedger) and obj.location_id == entry.location_id
+                and obj.business_date == entry.business_date):
+            db.session.expire(obj)
+
+
+def record_sale(sale, payments=None):
+    """Add a completed sale to its day's ledger"""
+    post_entry(ledger_entry(sale, payments))
+
+
+def record_sale_edit(before, sale):
+    """
+    Move a sale's ledger contribution after it was edited.
+
+    Args:
+        before: ledger_entry(sale) taken before the edit
+        sale: The edited Sale
+    """
+    post_entry(before, -1)
+    post_entry(ledger_entry(sale))
+
+
+def record_refund(sale):
+    """
+    Book a full refund. Call before the sale's status is changed.
+
+    The sale leaves the day's sales totals and its total is added to the
+    day's refunds, like the day close has always reported it.
+    """
+    entry = ledger_entry(sale)
+    post_entry(entry, -1)
+    post_entry(LedgerEntry(sale.location_id, entry.business_date, {
+        'refund_count': 1,
+        'total_refunds': _money(sale.total)
+    }))
+
+
+def record_return(ret):
+    """
+    Book the money paid back for a completed return.
+
+    The refund is paid out of the drawer on the day of the return, so it
+    is added to that day's refunds and taken off its cash.
+    """
+    amount = _money(ret.refund_amount)
+    if amount <= 0:
+        return
+
+    location_id = ret.location_id or (ret.sale.location_id if ret.sale else None)
+    returned_at = ret.completed_at or ret.return_date or datetime.utcnow()
+    post_entry(LedgerEntry(location_id, returned_at.date(), {
+        'refund_count': 1,
+        'total_refunds': amount,
+        'total_cash': -amount
+    }))
+
+
+# ============================================================
+# READS
+# ============================================================
+
+def ledger_totals(location_id, business_date):
+    """
+    Running totals for a location and day with a single-row read.
+
+    Returns:
+        dict: Every ledger field, zero when nothing was sold
+    """
+    row = db.session.query(*[_ledger_table.c[field] for field in LEDGER_FIELDS]).filter(
+        _ledger_table.c.location_id == location_id,
+        _ledger_table.c.business_date == business_date
+    ).first()
+
+    totals = empty_totals()
+    if row:
+        for field, value in zip(LEDGER_FIELDS, row):
+            totals[field] = int(value or 0) if field in COUNT_FIELDS else _money(value)
+    return totals
+
+
+def compute_z_report_sections(location_id, business_date):
+    """
+    Hourly breakdown and top products for a day with two grouped queries.
+
+    Returns:
+        dict: {'hourly_sales': {hour: {'count', 'total'}}, 'top_products': [...]}
+    """
+    day_filter = and_(
+        func.date(Sale.sale_date) == business_date,
+        Sale.location_id == location_id,
+        Sale.status == 'completed'
+    )
+
+    hour = extract('hour', Sale.sale_date)
+    hourly_sales = {
+        int(h): {'count': int(count), 'total': float(_money(total))}
+        for h, count, total in db.session.query(
+            hour, func.count(Sale.id), func.sum(Sale.total)
+        ).filter(day_filter).group_by(hour)
+    }
+
+    top_products = [{
+        'product_id': product_id,
+        'code': code,
+        'name': name,
+        'qty': int(qty or 0),
+        'total': float(_money(total))
+    } for product_id, code, name, qty, total in db.session.query(
+        SaleItem.product_id, Product.code, Product.name,
+        func.sum(SaleItem.quantity), func.sum(SaleItem.subtotal)
+    ).join(Sale, SaleItem.sale_id == Sale.id).join(
+        Product, SaleItem.product_id == Product.id
+    ).filter(day_filter).group_by(
+        SaleItem.product_id, Product.code, Product.name
+    ).order_by(func.sum(SaleItem.subtotal).desc()).limit(10)]
+
+    return {'hourly_sales': hourly_sales, 'top_products': top_products}
+
+
+def build_z_report_snapshot(location_id, business_date, totals):
+    """
+    Serialize the Z-report for a closed day.
+
+    Args:
+        location_id: Location being closed
+        business_date: Day being closed
+        totals: ledger_totals() for that day
+
+    Returns:
+        tuple: (json_text, sha256_hex)
+    """
+    snapshot = {
+        'location_id': location_id,
+        'business_date': business_date.isoformat(),
+        'totals': {field: str(value) for field, value in totals.items()},
+        'generated_at': datetime.utcnow().isoformat()
+    }
+    snapshot.update(compute_z_report_sections(location_id, business_date))
+
+    data = json.dumps(snapshot, sort_keys=True)
+    return data, hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def load_z_report_snapshot(day_close):
+    """
+    Load a day close's frozen Z-report.
+
+    Returns:
+        dict or None: None if the close predates snapshots
+
+    Raises:
+        ValueError: If the stored snapshot no longer matches its checksum
+    """
+    if not day_close.z_report_data:
+        return None
+
+    digest = hashlib.sha256(day_close.z_report_data.encode('utf-8')).hexdigest()
+    if day_close.z_report_checksum and digest != day_close.z_report_checksum:
+        raise ValueError(f'Z-report {day_close.z_report_number} failed its checksum')
+
+    snapshot = json.loads(day_close.z_report_data)
+    snapshot['hourly_sales'] = {int(h): v for h, v in snapshot.get('hourly_sales', {}).items()}
+    return snapshot
+
+
+# ============================================================
+# RECONCILIATION
+# ============================================================
+
+def _date_filters(column, start_date, end_date):
+    filters = []
+    if start_date:
+        filters.append(column >= start_date)
+    if end_date:
+        filters.append(column <= end_date)
+    return filters
+
+
+def compute_raw_totals(location_id=None, start_date=None, end_date=None):
+    """
+    Recompute ledger totals from raw sales, payments and returns.
+
+    Uses a fixed number of grouped queries regardless of how many sales or
+    days are covered.
+
+    Returns:
+        dict: {(location_id, business_date): totals}
+    """
+    results = {}
+
+    def bucket(loc, day):
+        return results.setdefault((loc, _as_date(day)), empty_totals())
+
+    sale_day = func.date(Sale.sale_date)
+    base = [Sale.location_id.isnot(None)] + _date_filters(sale_day, start_date, end_date)
+    if location_id:
+        base.append(Sale.location_id == location_id)
+    counted = base + [Sale.status.in_(COUNTED_SALE_STATUSES)]
+    not_split = or_(Sale.is_split_payment == False, Sale.is_split_payment.is_(None))
+
+    for loc, day, count, gross, discounts, tax, net in db.session.query(
+        Sale.location_id, sale_day, func.count(Sale.id), func.sum(Sale.subtotal),
+        func.sum(Sale.discount), func.sum(Sale.tax), func.sum(Sale.total)
+    ).filter(*counted).group_by(Sale.location_id, sale_day):
+        totals = bucket(loc, day)
+        totals['sale_count'] += int(count)
+        totals['gross_sales'] += _money(gross)
+        totals['total_discounts'] += _money(discounts)
+        totals['total_tax'] += _money(tax)
+        totals['net_sales'] += _money(net)
+
+    # Single-method sales: the whole total goes to the sale's method
+    for loc, day, method, amount in db.session.query(
+        Sale.location_id, sale_day, Sale.payment_method, func.sum(Sale.total)
+    ).filter(*counted, not_split).group_by(Sale.location_id, sale_day, Sale.payment_method):
+        bucket(loc, day)[_method_column(method)] += _money(amount)
+
+    # Split sales: each payment to its method, the uncovered rest to "other"
+    for loc, day, amount in db.session.query(
+        Sale.location_id, sale_day, func.sum(Sale.total)
+    ).filter(*counted, Sale.is_split_payment == True).group_by(Sale.location_id, sale_day):
+        bucket(loc, day)['total_other'] += _money(amount)
+
+    for loc, day, method, amount in db.session.query(
+        Sale.location_id, sale_day, Payment.payment_method, func.sum(Payment.amount)
+    ).join(Payment, Payment.sale_id == Sale.id).filter(
+        *counted, Sale.is_split_payment == True
+    ).group_by(Sale.location_id, sale_day, Payment.payment_method):
+        totals = bucket(loc, day)
+        totals[_method_column(method)] += _money(amount)
+        totals['total_other'] -= _money(amount)
+
+    for loc, day, count, amount in db.session.query(
+        Sale.location_id, sale_day, func.count(Sale.id), func.sum(Sale.total)
+    ).filter(*base, Sale.status == 'refunded').group_by(Sale.location_id, sale_day):
+        totals = bucket(loc, day)
+        totals['refund_count'] += int(count)
+        totals['total_refunds'] += _money(amount)
+
+    return_location = func.coalesce(Return.location_id, Sale.location_id)
+    return_day = func.date(func.coalesce(Return.completed_at, Return.return_date))
+    return_filters = [
+        Return.status == 'completed',
+        Return.refund_amount > 0,
+        return_location.isnot(None)
+    ] + _date_filters(return_day, start_date, end_date)
+    if location_id:
+        return_filters.append(return_location == location_id)
+
+    for loc, day, count, amount in db.session.query(
+        return_location, return_day, func.count(Return.id), func.sum(Return.refund_amount)
+    ).join(Sale, Return.sale_id == Sale.id).filter(*return_filters).group_by(return_location, return_day):
+        totals = bucket(loc, day)
+        totals['refund_count'] += int(count)
+        totals['total_refunds'] += _money(amount)
+        totals['total_cash'] -= _money(amount)
+
+    return results
+
+
+def reconcile_ledgers(location_id=None, start_date=None, end_date=None, repair=False):
+    """
+    Verify the running ledger against raw sales.
+
+    Args:
+        location_id: Limit to one location
+        start_date: First business day to check
+        end_date: Last business day to check
+        repair: Overwrite drifted or missing ledger rows with the raw totals
+
+    Returns:
+        list: One dict per mismatched (location, day) with ledger/raw values
+              of the fields that differ
+    """
+    raw = compute_raw_totals(location_id, start_date, end_date)
+
+    query = db.session.query(
+        _ledger_table.c.id, _ledger_table.c.location_id, _ledger_table.c.business_date,
+        *[_ledger_table.c[field] for field in LEDGER_FIELDS]
+    ).filter(*_date_filters(_ledger_table.c.business_date, start_date, end_date))
+    if location_id:
+        query = query.filter(_ledger_table.c.location_id == location_id)
+
+    ledger = {}
+    for row in query:
+        values = row._mapping
+        totals = {field: int(values[field] or 0) if field in COUNT_FIELDS else _money(values[field])
+                  for field in LEDGER_FIELDS}
+        ledger[(row.location_id, _as_date(row.business_date))] = (row.id, totals)
+
+    discrepancies = []
+    inserts = []
+    updates = []
+    for key in sorted(set(raw) | set(ledger), key=lambda k: (k[0], k[1])):
+        expected = raw.get(key, empty_totals())
+        row_id, actual = ledger.get(key, (None, empty_totals()))
+        diff = {field: {'ledger': actual[field], 'raw': expected[field]}
+                for field in LEDGER_FIELDS if actual[field] != expected[field]}
+        if not diff:
+            continue
+
+        discrepancies.append({'location_id': key[0], 'business_date': key[1], 'fields': diff})
+        if row_id is None:
+            inserts.append(dict(expected, location_id=key[0], business_date=key[1]))
+        else:
+            updates.append(dict(expected, id=row_id))
+
+    if repair and (inserts or updates):
+        if inserts:
+            db.session.bulk_insert_mappings(ShiftLedger, inserts)
+        if updates:
+            db.session.bulk_update_mappings(ShiftLedger, updates)
+        db.session.commit()
+
+    return discrepancies
@@ -0,0 +1,374 @@
+"""
+Transfer Service
+Executes stock transfer dispatch and receipt for one or many transfers with
+set-based stock updates and bulk-inserted stock movements
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from app.models import (db, LocationStock, StockTransfer, StockTransferItem,
+                        StockMovement)
+from app.utils.location_context import generate_transfer_numbers
+from app.services.batch_allocation_service import allocate_fefo, receive_transfer_batches
+
+
+# Attempts at allocating a block of transfer numbers before giving up
+TRANSFER_NUMBER_RETRIES = 3
+
+_stock_table = LocationStock.__table__
+
+# One statement per batch of stock rows (executemany): adjust quantity and
+# reservation in the database so concurrent writers never overwrite each other
+_apply_stock_delta = _stock_table.update().where(and_(
+    _stock_table.c.location_id == bindparam('b_location_id'),
+    _stock_table.c.product_id == bindparam('b_product_id')
+)).values(
+    quantity=case(
+        (_stock_table.c.quantity + bindparam('b_quantity') < 0, 0),
+        else_=_stock_table.c.quantity + bindparam('b_quantity')
+    ),
+    reserved_quantity=case(
+        (_stock_table.c.reserved_quantity + bindparam('b_reserved') < 0, 0),
+        else_=_stock_table.c.reserved_quantity + bindparam('b_reserved')
+    ),
+    last_movement_at=bindparam('b_moved_at'),
+    updated_at=bindparam('b_moved_at')
+)
+
+
+def load_transfer_items(transfer_ids):
+    """
+    Load the items of one or more transfers with their products in one query.
+
+    Args:
+        transfer_ids: StockTransfer IDs
+
+    Returns:
+        list: StockTransferItem objects ordered by transfer and item ID
+    """
+    if not transfer_ids:
+        return []
+
+    return StockTransferItem.query.options(
+        joinedload(StockTransferItem.product)
+    ).filter(
+        StockTransferItem.transfer_id.in_(list(transfer_ids))
+    ).order_by(StockTransferItem.transfer_id, StockTransferItem.id).all()
+
+
+def prefetch_location_stock(pairs):
+    """
+    Load LocationStock rows for many (location_id, product_id) pairs in one query.
+
+    Args:
+        pairs: Iterable of (location_id, product_id)
+
+    Returns:
+        dict: {(location_id, product_id): LocationStock}
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+
+    location_ids = {location_id for location_id, _ in pairs}
+    product_ids = {product_id for _, product_id in pairs}
+
+    rows = LocationStock.query.filter(
+        LocationStock.location_id.in_(location_ids),
+        LocationStock.product_id.in_(product_ids)
+    ).all()
+
+    return {(row.location_id, row.product_id): row for row in rows
+            if (row.location_id, row.product_id) in pairs}
+
+
+def _apply_stock_deltas(deltas, moved_at):
+    """
+    Apply {(location_id, product_id): (quantity_delta, reserved_delta)} in bulk.
+
+    Quantities are clamped at zero like the per-row code this replaces. Any
+    LocationStock objects already in the session are expired so they reload.
+    """
+    if not deltas:
+        return
+
+    params = [{
+        'b_location_id': location_id,
+        'b_product_id': product_id,
+        'b_quantity': quantity_delta,
+        'b_reserved': reserved_delta,
+        'b_moved_at': moved_at
+    } for (location_id, product_id), (quantity_delta, reserved_delta) in deltas.items()]
+
+    db.session.execute(_apply_stock_delta, params)
+
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, LocationStock) and (obj.location_id, obj.product_id) in deltas:
+            db.session.expire(obj)
+
+
+def _create_missing_stock(pairs, reorder_levels, created_at):
+    """Bulk insert zero-quantity LocationStock rows for pairs that have none"""
+    existing = db.session.query(
+        LocationStock.location_id, LocationStock.product_id
+    ).filter(
+        LocationStock.location_id.in_({location_id for location_id, _ in pairs}),
+        LocationStock.product_id.in_({product_id for _, product_id in pairs})
+    ).all()
+
+    missing = set(pairs) - set(existing)
+    if missing:
+        db.session.bulk_insert_mappings(LocationStock, [{
+            'location_id': location_id,
+            'product_id': product_id,
+            'quantity': 0,
+            'reserved_quantity': 0,
+            'reorder_level': reorder_levels.get(product_id, 10),
+            'created_at': created_at,
+            'updated_at': created_at
+        } for location_id, product_id in sorted(missing)])
+
+    return len(missing)
+
+
+def dispatch_transfers(transfers, user_id, notes=None, commit=True):
+    """
+    Dispatch approved transfers: deduct source stock and release reservations.
+
+    Args:
+        transfers: StockTransfer objects in 'approved' status
+        user_id: Dispatching user
+        notes: Dispatch notes recorded on every transfer
+        commit: Commit the session when done
+
+    Returns:
+        dict: Counts of transfers, lines and units dispatched
+    """
+    now = datetime.utcnow()
+    by_id = {transfer.id: transfer for transfer in transfers}
+    items = load_transfer_items(by_id)
+
+    deltas = {}
+    movements = []
+    batch_lines = {}
+    units = 0
+
+    for item in items:
+        transfer = by_id[item.transfer_id]
+        qty = item.quantity_approved or item.quantity_requested
+        item.quantity_dispatched = qty
+        units += qty
+
+        lines = batch_lines.setdefault(transfer.id, {})
+        lines[item.product_id] = lines.get(item.product_id, 0) + qty
+
+        key = (transfer.source_location_id, item.product_id)
+        quantity_delta, reserved_delta = deltas.get(key, (0, 0))
+        deltas[key] = (quantity_delta - qty, reserved_delta - qty)
+
+        movements.append({
+            'product_id': item.product_id,
+            'user_id': user_id,
+            'movement_type': 'transfer_out',
+            'quantity': -qty,
+            'reference': transfer.transfer_number,
+            'notes': f'Transfer to {transfer.destination_location.name}',
+            'location_id': transfer.source_location_id,
+            'transfer_id': transfer.id,
+            'timestamp': now
+        })
+
+    _apply_stock_deltas(deltas, now)
+    if movements:
+        db.session.bulk_insert_mappings(StockMovement, movements)
+
+    # Ship batch-tracked products from the source batches, FEFO
+    for transfer_id, lines in batch_lines.items():
+        transfer = by_id[transfer_id]
+        allocate_fefo(lines, transfer.source_location_id, user_id, 'transfer', transfer_id,
+                      movement_type='transfer_out', reason=f'Transfer {transfer.transfer_number}')
+
+    for transfer in by_id.values():
+        transfer.status = 'dispatched'
+        transfer.dispatched_by = user_id
+        transfer.dispatched_at = now
+        transfer.dispatch_notes = notes
+
+    if commit:
+        db.session.commit()
+
+    return {'transfers': len(by_id), 'lines': len(items), 'units': units}
+
+
+def receive_transfers(transfers, user_id, received_quantities=None, notes=None, commit=True):
+    """
+    Receive dispatched transfers into destination stock.
+
+    Destination stock rows that do not exist yet are bulk inserted first so
+    every increment is a single set-based update.
+
+    Args:
+        transfers: StockTransfer objects in 'dispatched' status
+        user_id: Receiving user
+        received_quantities: {item_id: quantity}; missing items default to
+                             the dispatched quantity
+        notes: Receive notes recorded on every transfer
+        commit: Commit the session when done
+
+    Returns:
+        dict: Counts of transfers, lines, units received and stock rows created
+    """
+    now = datetime.utcnow()
+    received_quantities = received_quantities or {}
+    by_id = {transfer.id: transfer for transfer in transfers}
+    items = load_transfer_items(by_id)
+
+    deltas = {}
+    reorder_levels = {}
+    movements = []
+    batch_lines = {}
+    units = 0
+
+    for item in items:
+        transfer = by_id[item.transfer_id]
+        received_qty = received_quantities.get(item.id)
+        if received_qty is None:
+            received_qty = item.quantity_dispatched or 0
+        item.quantity_received = received_qty
+
+        if received_qty <= 0:
+            continue
+
+        units += received_qty
+        lines = batch_lines.setdefault(transfer.id, {})
+        lines[item.product_id] = lines.get(item.product_id, 0) + received_qty
+
+        key = (transfer.destination_location_id, item.product_id)
+        quantity_delta, _ = deltas.get(key, (0, 0))
+        deltas[key] = (quantity_delta + received_qty, 0)
+        reorder_levels[item.product_id] = item.product.reorder_level if item.product else 10
+
+        movements.append({
+            'product_id': item.product_id,
+            'user_id': user_id,
+            'movement_type': 'transfer_in',
+            'quantity': received_qty,
+            'reference': transfer.transfer_number,
+            'notes': f'Transfer from {transfer.source_location.name}',
+            'location_id': transfer.destination_location_id,
+            'transfer_id': transfer.id,
+            'timestamp': now
+        })
+
+    created = _create_missing_stock(deltas, reorder_levels, now) if deltas else 0
+    _apply_stock_deltas(deltas, now)
+    if movements:
+        db.session.bulk_insert_mappings(StockMovement, movements)
+
+    # Recreate the shipped batches at the destination
+    for transfer_id, lines in batch_lines.items():
+        receive_transfer_batches(by_id[transfer_id], lines, user_id)
+
+    for transfer in by_id.values():
+        transfer.status = 'received'
+        transfer.received_by = user_id
+        transfer.received_at = now
+        transfer.receive_notes = notes
+
+    if commit:
+        db.session.commit()
+
+    return {'transfers': len(by_id), 'lines': len(items), 'units': units,
+            'stock_rows_created': created}
+
+
+def create_bulk_transfers(source_location_id, product_id, allocations, user_id,
+                          notes=None, commit=True):
+    """
+    Create pre-approved transfers of one product to many destinations.
+
+    The whole block of transfer numbers is allocated at once and retried if
+    another request took the same numbers first. Source stock is reserved
+    with a single conditional update, so two concurrent bulk transfers can
+    never reserve more than is available.
+
+    Args:
+        source_location_id: Warehouse sending the stock
+        product_id: Product being sent
+        allocations: {destination_location_id: quantity}
+        user_id: User creating and approving the transfers
+        notes: Request notes recorded on every transfer
+        commit: Commit the session when done
+
+    Returns:
+        list: Created StockTransfer objects
+
+    Raises:
+        ValueError: If the source does not have enough available stock
+    """
+    allocations = {int(dest): int(qty) for dest, qty in allocations.items() if qty and int(qty) > 0}
+    if not allocations:
+        return []
+
+    total_qty = sum(allocations.values())
+
+    reserved = db.session.execute(
+        _stock_table.update().where(and_(
+            _stock_table.c.location_id == source_location_id,
+            _stock_table.c.product_id == product_id,
+            _stock_table.c.quantity - _stock_table.c.reserved_quantity >= total_qty
+        )).values(reserved_quantity=_stock_table.c.reserved_quantity + total_qty)
+    )
+    if reserved.rowcount != 1:
+        raise ValueError('Insufficient stock at source location')
+
+    for obj in list(db.session.identity_map.values()):
+        if (isinstance(obj, LocationStock) and obj.location_id == source_location_id
+                and obj.product_id == product_id):
+            db.session.expire(obj)
+
+    now = datetime.utcnow()
+    destinations = sorted(allocations)
+
+    for attempt in range(TRANSFER_NUMBER_RETRIES):
+        numbers = generate_transfer_numbers(len(destinations))
+        transfers = [StockTransfer(
+            transfer_number=number,
+            source_location_id=source_location_id,
+            destination_location_id=destination_id,
+            status='approved',  # Pre-approved by warehouse
+            priority='normal',
+            requested_by=user_id,
+            requested_at=now,
+            approved_by=user_id,
+            approved_at=now,
+            request_notes=notes
+        ) for number, destination_id in zip(numbers, destinations)]
+
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.add_all(transfers)
+            db.session.flush()
+            savepoint.commit()
+            break
+        except IntegrityError:
+            savepoint.rollback()
+            if attempt == TRANSFER_NUMBER_RETRIES - 1:
+                raise
+
+    db.session.bulk_insert_mappings(StockTransferItem, [{
+        'transfer_id': transfer.id,
+        'product_id': product_id,
+        'quantity_requested': allocations[transfer.destination_location_id],
+        'quantity_approved': allocations[transfer.destination_location_id],
+        'created_at': now
+    } for transfer in transfers])
+
+    if commit:
+        db.session.commit()
+
+    return transfers
@@ -0,0 +1,211 @@
+"""
+Warehouse Metrics Service
+Computes warehouse and kiosk KPIs with one grouped query per metric family
+(GROUP BY location) and keeps a short-lived per-warehouse cache
+"""
+
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case
+
+from app.models import (db, Location, LocationStock, Product, Sale, StockTransfer,
+                        PurchaseOrder)
+
+
+METRICS_TTL_SECONDS = 60
+SALES_WINDOW_DAYS = 30
+OPEN_TRANSFER_STATUSES = ('requested', 'approved', 'dispatched')
+
+_cache_lock = threading.Lock()
+_cache = weakref.WeakKeyDictionary()  # engine -> {(warehouse_id, kiosk_ids): (built_at, metrics)}
+
+
+def _empty_kiosk_metrics():
+    """Metrics for a kiosk with no stock, sales or open transfers"""
+    return {
+        'total_stock': 0,
+        'low_stock': 0,
+        'sales_count': 0,
+        'sales_revenue': 0.0,
+        'pending_transfers': 0,
+        'requested_count': 0,
+        'approved_count': 0,
+        'dispatched_count': 0
+    }
+
+
+def compute_kiosk_metrics(kiosk_ids, since=None):
+    """
+    Compute KPIs for many kiosks with three grouped queries.
+
+    Args:
+        kiosk_ids: Location IDs to compute metrics for
+        since: Start of the sales window (default: last 30 days)
+
+    Returns:
+        dict: {kiosk_id: metrics dict}
+    """
+    metrics = {kiosk_id: _empty_kiosk_metrics() for kiosk_id in kiosk_ids}
+    if not metrics:
+        return metrics
+
+    if since is None:
+        since = datetime.utcnow() - timedelta(days=SALES_WINDOW_DAYS)
+
+    # Stock levels and low-stock counts
+    stock_rows = db.session.query(
+        LocationStock.location_id,
+        func.coalesce(func.sum(LocationStock.quantity), 0),
+        func.sum(case((LocationStock.quantity <= LocationStock.reorder_level, 1), else_=0))
+    ).filter(
+        LocationStock.location_id.in_(kiosk_ids)
+    ).group_by(LocationStock.location_id).all()
+
+    for location_id, total_stock, low_stock in stock_rows:
+        metrics[location_id]['total_stock'] = int(total_stock or 0)
+        metrics[location_id]['low_stock'] = int(low_stock or 0)
+
+    # Sales in the window
+    sales_rows = db.session.query(
+        Sale.location_id,
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.total), 0)
+    ).filter(
+        Sale.location_id.in_(kiosk_ids),
+        Sale.sale_date >= since
+    ).group_by(Sale.location_id).all()
+
+    for location_id, sales_count, revenue in sales_rows:
+        metrics[location_id]['sales_count'] = int(sales_count or 0)
+        metrics[location_id]['sales_revenue'] = float(revenue or 0)
+
+    # Open inbound transfers by status
+    transfer_rows = db.session.query(
+        StockTransfer.destination_location_id,
+        StockTransfer.status,
+        func.count(StockTransfer.id)
+    ).filter(
+        StockTransfer.destination_location_id.in_(kiosk_ids),
+        StockTransfer.status.in_(OPEN_TRANSFER_STATUSES)
+    ).group_by(StockTransfer.destination_location_id, StockTransfer.status).all()
+
+    for location_id, status, count in transfer_rows:
+        metrics[location_id][f'{status}_count'] = int(count)
+        metrics[location_id]['pending_transfers'] += int(count)
+
+    return metrics
+
+
+def compute_warehouse_summary(warehouse_id):
+    """
+    Compute the warehouse's own stock summary in two queries.
+
+    Returns:
+        dict: total_products, low_stock_count, stock_value, pending_requests
+    """
+    total_products, low_stock_count, stock_value = db.session.query(
+        func.count(LocationStock.id),
+        func.sum(case((LocationStock.quantity <= LocationStock.reorder_level, 1), else_=0)),
+        func.sum(LocationStock.quantity * Product.cost_price)
+    ).join(
+        Product, LocationStock.product_id == Product.id
+    ).filter(LocationStock.location_id == warehouse_id).one()
+
+    pending_requests = db.session.query(func.count(StockTransfer.id)).filter(
+        StockTransfer.source_location_id == warehouse_id,
+        StockTransfer.status == 'requested'
+    ).scalar()
+
+    return {
+        'total_products': int(total_products or 0),
+        'low_stock_count': int(low_stock_count or 0),
+        'stock_value': stock_value or 0,
+        'pending_requests': int(pending_requests or 0)
+    }
+
+
+def get_warehouse_metrics(warehouse, kiosks=None, use_cache=True, max_age=METRICS_TTL_SECONDS):
+    """
+    Get warehouse summary and per-kiosk metrics, cached per warehouse.
+
+    Args:
+        warehouse: Warehouse Location (None for a kiosk-only view)
+        kiosks: Kiosk locations (default: active child kiosks of the warehouse)
+        use_cache: Serve from the short-lived cache when fresh
+        max_age: Cache lifetime in seconds
+
+    Returns:
+        dict: {'summary': dict or None, 'kiosks': {kiosk_id: metrics}}
+    """
+    if kiosks is None:
+        kiosks = Location.query.filter_by(
+            parent_warehouse_id=warehouse.id,
+            is_active=True
+        ).all() if warehouse else []
+
+    warehouse_id = warehouse.id if warehouse else None
+    kiosk_ids = tuple(sorted(k.id for k in kiosks))
+    key = (warehouse_id, kiosk_ids)
+    engine = db.engine
+
+    if use_cache:
+        with _cache_lock:
+            cached = _cache.get(engine, {}).get(key)
+            if cached and time.monotonic() - cached[0] <= max_age:
+                return cached[1]
+
+    metrics = {
+        'summary': compute_warehouse_summary(warehouse_id) if warehouse_id else None,
+        'kiosks': compute_kiosk_metrics(list(kiosk_ids))
+    }
+
+    with _cache_lock:
+        _cache.setdefault(engine, {})[key] = (time.monotonic(), metrics)
+
+    return metrics
+
+
+def invalidate_warehouse_metrics(warehouse_id=None):
+    """Drop cached metrics for one warehouse, or all warehouses"""
+    with _cache_lock:
+        for entries in _cache.values():
+            if warehouse_id is None:
+                entries.clear()
+                continue
+            for key in [k for k in entries if k[0] == warehouse_id]:
+                del entries[key]
+
+
+def get_purchase_order_stats():
+    """
+    Draft-PO dashboard stats with one grouped query per family.
+
+    Returns:
+        dict: draft_pos, ordered_pos, low_stock_items, suppliers_with_low_stock
+    """
+    status_counts = dict(db.session.query(
+        PurchaseOrder.status, func.count(PurchaseOrder.id)
+    ).filter(
+        PurchaseOrder.status.in_(['draft', 'ordered'])
+    ).group_by(PurchaseOrder.status).all())
+
+    # Same criteria as reorder_service.detect_low_stock
+    low_stock_items, suppliers = db.session.query(
+        func.count(Product.id),
+        func.count(func.distinct(Product.supplier_id))
+    ).filter(
+        Product.is_active == True,
+        Product.supplier_id.isnot(None),
+        Product.can_be_reordered == True,
+        Product.quantity <= Product.reorder_level
+    ).one()
+
+    return {
+        'draft_pos': status_counts.get('draft', 0),
+        'ordered_pos': status_counts.get('ordered', 0),
+        'low_stock_items': int(low_stock_items or 0),
+        'suppliers_with_low_stock': int(suppliers or 0)
+    }
@@ -9,7 +9,7 @@ from datetime import datetime, date
 from decimal import Decimal
 
 from app.models import db, Product, Location, Supplier, PurchaseOrder
-from app.models_extended import LocationProductCost, ProductCostHistory
+from app.models_extended import ProductCostHistory
 
 
 def calculate_landed_cost(base_cost, packaging_cost=0, delivery_cost=0, bottle_cost=0):
@@ -59,63 +59,33 @@ def calculate_final_cost_for_location(landed_cost, location):
     return landed + kiosk_charge
 
 
-def recalculate_location_costs(location_id, products=None):
+def recalculate_location_costs(location_id, products=None, user_id=None):
     """
     Recalculate all product costs for a location based on kiosk charge rate.
 
+    Delegates to the cost matrix engine, which upserts LocationProductCost
+    rows in bulk instead of querying per product.
+
     Args:
         location_id: Location ID
         products: Optional list of products (if None, all products are recalculated)
+        user_id: User recorded on any cost history rows
 
     Returns:
         int: Number of products updated
     """
-    location = Location.query.get(location_id)
-    if not location:
-        return 0
+    from app.services.cost_matrix_service import rebuild_location_costs
 
-    if products is None:
-        products = Product.query.filter_by(is_active=True).all()
-
-    count = 0
-    for product in products:
-        landed_cost = product.landed_cost
-        final_cost = calculate_final_cost_for_location(landed_cost, location)
-
-        # Calculate kiosk charge amount
-        if location.kiosk_charge_type == 'percentage':
-            kiosk_charge = float(landed_cost) * float(location.kiosk_charge_rate or 0) / 100
-        else:
-            kiosk_charge = float(location.kiosk_charge_rate or 0)
-
-        # Calculate suggested selling price (e.g., 30% margin)
-        margin_percentage = Decimal('30')
-        suggested_price = final_cost * (1 + margin_percentage / 100)
-
-        # Update or create LocationProductCost record
-        lpc = LocationProductCost.query.filter_by(
-            location_id=location_id,
-            product_id=product.id
-        ).first()
-
-        if not lpc:
-            lpc = LocationProductCost(
-                location_id=location_id,
-                product_id=product.id
-            )
-            db.session.add(lpc)
-
-        lpc.landed_cost = landed_cost
-        lpc.kiosk_charge = kiosk_charge
-        lpc.final_cost = final_cost
-        lpc.suggested_selling_price = suggested_price
-        lpc.margin_percentage = margin_percentage
-        lpc.last_updated = datetime.utcnow()
-
-        count += 1
+    if not Location.query.get(location_id):
+        return 0
 
-    db.session.commit()
-    return count
+    product_ids = [p.id for p in products] if products is not None else None
+    result = rebuild_location_costs(
+        location_ids=[location_id],
+        product_ids=product_ids,
+        user_id=user_id
+    )
+    return result['pairs']
 
 
 def update_product_cost_history(product_id, user_id=None, po_id=None, reason=None):
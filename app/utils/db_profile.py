@@ -0,0 +1,183 @@
+"""
+Database Engine Profile
+Backend-specific pool sizing and connection pragmas, pool metrics, and the
+optional read-replica engine
+"""
+
+import threading
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from app.models import db
+
+
+REPLICA_BIND = 'replica'
+
+# Pool settings only make sense for pooled (file or server) databases
+POOL_OPTION_KEYS = {
+    'pool_size': 'DB_POOL_SIZE',
+    'max_overflow': 'DB_MAX_OVERFLOW',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+}
+
+_metrics = weakref.WeakKeyDictionary()  # engine -> counters
+_metrics_lock = threading.Lock()
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, config):
+    """
+    Engine options for a database URL under the configured profile.
+
+    SQLite files get a thread-sized pool and a busy timeout so writers wait
+    for the lock instead of failing; server databases also recycle and
+    pre-ping connections so ones dropped by the server are never handed out.
+
+    Args:
+        uri: Database URL
+        config: App config (DB_* and SQLITE_* settings)
+
+    Returns:
+        dict: create_engine() keyword arguments
+    """
+    url = make_url(uri)
+    if _is_memory_sqlite(url):
+        # Flask-SQLAlchemy already shares one connection (StaticPool)
+        return {}
+
+    options = {key: int(config[name]) for key, name in POOL_OPTION_KEYS.items()
+               if config.get(name) is not None}
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': int(config.get('SQLITE_BUSY_TIMEOUT_MS', 15000)) / 1000}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = int(config.get('DB_POOL_RECYCLE', 1800))
+        # Reuse the most recently returned connection; idle extras time out server-side
+        options['pool_use_lifo'] = True
+    return options
+
+
+def sqlite_pragmas(config, memory=False):
+    """PRAGMA statements run on every new SQLite connection"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', 15000))}",
+        f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KB', 65536))}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if not memory:
+        pragmas += [
+            # WAL lets report queries read while checkouts write
+            f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+            f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 268435456))}",
+        ]
+    return pragmas
+
+
+def configure_engine_options(app):
+    """
+    Fill SQLALCHEMY_ENGINE_OPTIONS (and the replica bind) from the profile.
+    Call before db.init_app(); options set explicitly in config win.
+    """
+    config = app.config
+    profile = engine_options(config['SQLALCHEMY_DATABASE_URI'], config)
+    profile.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = profile
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **engine_options(replica_url, config)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def attach_engine_listeners(engine, config):
+    """
+    Apply pragmas on connect (SQLite) and start collecting pool metrics.
+
+    Args:
+        engine: Engine to instrument
+        config: App config
+    """
+    with _metrics_lock:
+        if engine in _metrics:
+            return
+        counters = _metrics[engine] = {
+            'connects': 0, 'checkouts': 0, 'invalidations': 0,
+            'peak_checked_out': 0, 'checked_out': 0
+        }
+
+    if engine.dialect.name == 'sqlite':
+        pragmas = sqlite_pragmas(config, memory=_is_memory_sqlite(engine.url))
+
+        @event.listens_for(engine, 'connect')
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    @event.listens_for(engine, 'connect')
+    def _count_connect(dbapi_connection, connection_record):
+        with _metrics_lock:
+            counters['connects'] += 1
+
+    @event.listens_for(engine, 'checkout')
+    def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _metrics_lock:
+            counters['checkouts'] += 1
+            counters['checked_out'] += 1
+            counters['peak_checked_out'] = max(counters['peak_checked_out'], counters['checked_out'])
+
+    @event.listens_for(engine, 'checkin')
+    def _count_checkin(dbapi_connection, connection_record):
+        with _metrics_lock:
+            counters['checked_out'] = max(counters['checked_out'] - 1, 0)
+
+    @event.listens_for(engine, 'invalidate')
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        with _metrics_lock:
+            counters['invalidations'] += 1
+
+
+def init_engine_profile(app):
+    """Instrument every engine of the app (call after db.init_app())"""
+    with app.app_context():
+        for engine in db.engines.values():
+            attach_engine_listeners(engine, app.config)
+
+
+def pool_metrics(engine=None):
+    """
+    Pool state and counters for an engine.
+
+    Returns:
+        dict: pool class, size, checked in/out, overflow and event counters
+    """
+    engine = engine or db.engine
+    pool = engine.pool
+    with _metrics_lock:
+        counters = dict(_metrics.get(engine, {}))
+    metrics = {
+        'backend': engine.dialect.name,
+        'pool': type(pool).__name__,
+        'status': pool.status(),
+        **counters
+    }
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            metrics[name] = method()
+    return metrics
+
+
+def replica_engine():
+    """Read-replica engine when DATABASE_REPLICA_URL is set, else None"""
+    return db.engines.get(REPLICA_BIND)
@@ -307,3 +307,66 @@ def sanitize_filename(filename):
         str: Safe filename
     """
     return secure_filename(filename)
+
+
+# Country code assumed for numbers entered without one (Pakistan)
+DEFAULT_COUNTRY_CODE = '92'
+
+
+def normalize_phone(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalize a phone number to E.164 (+923001234567)
+
+    Accepts the forms numbers arrive in at the counter and from WhatsApp:
+    03001234567, 3001234567, 923001234567, +92 300 1234567, 0092300...
+
+    Args:
+        phone: Phone number as entered
+        country_code: Country code for national-format numbers
+
+    Returns:
+        str or None: E.164 number, None when it cannot be normalized
+    """
+    if not phone:
+        return None
+    raw = str(phone).strip()
+    digits = ''.join(filter(str.isdigit, raw))
+
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_code + digits[1:]
+    elif digits.startswith(country_code) and len(digits) > 10:
+        pass
+    elif len(digits) == 10:
+        digits = country_code + digits
+    else:
+        return None
+
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def search_tokens(*texts):
+    """
+    Lowercase words of the given texts for prefix search
+
+    Emails contribute the whole address and its local part.
+
+    Returns:
+        set: Tokens (at most 64 characters each)
+    """
+    tokens = set()
+    for text in texts:
+        if not text:
+            continue
+        text = str(text).lower()
+        if '@' in text:
+            tokens.add(text[:64])
+            text = text.split('@', 1)[0]
+        for word in ''.join(ch if ch.isalnum() else ' ' for ch in text).split():
+            tokens.add(word[:64])
+    return tokens
@@ -334,24 +334,35 @@ def generate_transfer_number():
     Returns:
         String like "TRF-20231215-001"
     """
-    from app.models import StockTransfer
+    return generate_transfer_numbers(1)[0]
+
+
+def generate_transfer_numbers(count):
+    """
+    Generate a block of consecutive transfer numbers with a single lookup.
+
+    Callers creating several transfers at once should allocate the whole
+    block up front instead of calling generate_transfer_number() per row.
+
+    Args:
+        count: Number of transfer numbers to allocate
+
+    Returns:
+        List of strings like "TRF-20231215-001"
+    """
+    from app.models import db, StockTransfer
     from datetime import datetime
+    from sqlalchemy import func, cast, Integer
 
     today = datetime.utcnow().strftime('%Y%m%d')
     prefix = f"TRF-{today}-"
 
-    # Find the last transfer number for today
-    last_transfer = StockTransfer.query.filter(
+    # Take the max of the numeric suffix in SQL: as text "TRF-...-1000"
+    # sorts before "TRF-...-999"
+    last_num = db.session.query(
+        func.max(cast(func.substr(StockTransfer.transfer_number, len(prefix) + 1), Integer))
+    ).filter(
         StockTransfer.transfer_number.like(f"{prefix}%")
-    ).order_by(StockTransfer.transfer_number.desc()).first()
-
-    if last_transfer:
-        try:
-            last_num = int(last_transfer.transfer_number.split('-')[-1])
-            new_num = last_num + 1
-        except (ValueError, IndexError):
-            new_num = 1
-    else:
-        new_num = 1
+    ).scalar() or 0
 
-    return f"{prefix}{new_num:03d}"
+    return [f"{prefix}{last_num + i:03d}" for i in range(1, count + 1)]
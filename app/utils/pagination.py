@@ -0,0 +1,313 @@
+"""
+Keyset Pagination Utilities
+Seek-based paging over indexed sort keys with opaque cursors and cached,
+approximate row counts
+"""
+
+import threading
+import time
+import weakref
+from datetime import datetime, date
+from decimal import Decimal
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_, false, func, text
+
+from app.models import db
+
+
+# Seconds a filtered row count is reused before it is recounted
+COUNT_TTL_SECONDS = 300
+
+_CURSOR_SALT = 'keyset-cursor'
+
+
+# ============================================================
+# CURSORS
+# ============================================================
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['dec', str(value)]
+    return ['v', value]
+
+
+def _load_value(item):
+    kind, value = item
+    if kind == 'dt':
+        return datetime.fromisoformat(value)
+    if kind == 'd':
+        return date.fromisoformat(value)
+    if kind == 'dec':
+        return Decimal(value)
+    return value
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=_CURSOR_SALT)
+
+
+def encode_cursor(values, direction, page):
+    """
+    Encode a position in a listing as a signed, URL-safe token.
+
+    Args:
+        values: Sort key values of the boundary row
+        direction: 'next' (rows after it) or 'prev' (rows before it)
+        page: Page number the cursor leads to, for display only
+    """
+    return _serializer().dumps({
+        'k': [_dump_value(v) for v in values],
+        'd': direction,
+        'p': page
+    })
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor from encode_cursor().
+
+    Returns:
+        tuple or None: (values, direction, page); None for a missing,
+                       tampered or malformed cursor (first page)
+    """
+    if not token:
+        return None
+    try:
+        data = _serializer().loads(token)
+        values = [_load_value(item) for item in data['k']]
+        direction = data['d'] if data['d'] in ('next', 'prev') else 'next'
+        return values, direction, max(int(data.get('p', 1)), 1)
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+# ============================================================
+# SEEK PREDICATES
+# ============================================================
+
+def _is_nullable(column):
+    nullable = getattr(column, 'nullable', None)
+    if nullable is None:
+        expression = getattr(column, 'expression', None)
+        nullable = getattr(expression, 'nullable', True)
+    return bool(nullable) and not getattr(column, 'primary_key', False)
+
+
+def _order_clause(column, descending, reverse):
+    """ORDER BY for one key; NULLs always sort after every value"""
+    if reverse:
+        descending = not descending
+    clause = column.desc() if descending else column.asc()
+    if _is_nullable(column):
+        clause = clause.nulls_first() if reverse else clause.nulls_last()
+    return clause
+
+
+def _seek_predicate(keys, values, after):
+    """
+    WHERE clause selecting rows strictly after (or before) a position.
+
+    Expands (a, b) > (x, y) into a > x OR (a = x AND b > y), which works
+    for mixed sort directions and nullable keys on every backend.
+    """
+    predicate = None
+    for (column, descending), value in reversed(list(zip(keys, values))):
+        nullable = _is_nullable(column)
+
+        if value is None:
+            strict = false() if after else column.isnot(None)
+            equal = column.is_(None)
+        else:
+            beyond = (column < value) if descending else (column > value)
+            before = (column > value) if descending else (column < value)
+            if after:
+                strict = or_(beyond, column.is_(None)) if nullable else beyond
+            else:
+                strict = before
+            equal = column == value
+
+        predicate = strict if predicate is None else or_(strict, and_(equal, predicate))
+
+    return predicate
+
+
+# ============================================================
+# APPROXIMATE COUNTS
+# ============================================================
+
+_count_lock = threading.Lock()
+_count_cache = weakref.WeakKeyDictionary()  # engine -> {key: (counted_at, count)}
+
+
+def _table_statistics(table_name):
+    """Row estimate kept by the database's planner statistics, if any"""
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            estimate = db.session.execute(
+                text('SELECT reltuples FROM pg_class WHERE relname = :name'),
+                {'name': table_name}
+            ).scalar()
+            return int(estimate) if estimate and estimate > 0 else None
+        if dialect == 'sqlite':
+            stat = db.session.execute(
+                text('SELECT stat FROM sqlite_stat1 WHERE tbl = :name LIMIT 1'),
+                {'name': table_name}
+            ).scalar()
+            return int(stat.split()[0]) if stat else None
+    except Exception:
+        # Statistics table missing (never ANALYZEd) or not readable
+        db.session.rollback()
+    return None
+
+
+def approximate_count(query, ttl=COUNT_TTL_SECONDS):
+    """
+    Row count for a listing without counting on every page view.
+
+    Unfiltered single-table listings use the planner's statistics when the
+    database keeps them. Otherwise the exact count of the filtered query is
+    computed once and reused for `ttl` seconds.
+
+    Args:
+        query: Filtered (unordered or ordered) ORM query
+        ttl: Seconds a computed count stays valid
+
+    Returns:
+        int
+    """
+    statement = query.statement
+    froms = statement.get_final_froms()
+    if statement.whereclause is None and len(froms) == 1 and hasattr(froms[0], 'name'):
+        estimate = _table_statistics(froms[0].name)
+        if estimate is not None:
+            return estimate
+
+    compiled = statement.compile(db.engine)
+    key = (str(compiled), tuple(sorted((k, repr(v)) for k, v in compiled.params.items())))
+    engine = db.engine
+
+    with _count_lock:
+        cached = _count_cache.get(engine, {}).get(key)
+        if cached and time.monotonic() - cached[0] <= ttl:
+            return cached[1]
+
+    count = query.order_by(None).with_entities(func.count()).scalar() or 0
+
+    with _count_lock:
+        _count_cache.setdefault(engine, {})[key] = (time.monotonic(), count)
+    return count
+
+
+def clear_count_cache():
+    """Forget all cached listing counts"""
+    with _count_lock:
+        _count_cache.clear()
+
+
+# ============================================================
+# PAGINATION
+# ============================================================
+
+class KeysetPage:
+    """One page of a keyset-paginated listing"""
+
+    def __init__(self, items, per_page, page, total, has_prev, has_next,
+                 prev_cursor=None, next_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def pages(self):
+        """Approximate number of pages (at least the pages already seen)"""
+        if not self.per_page:
+            return 0
+        estimate = -(-(self.total or 0) // self.per_page)
+        return max(estimate, self.page + (1 if self.has_next else 0))
+
+    @property
+    def first(self):
+        """1-based position of the first item on the page"""
+        return (self.page - 1) * self.per_page + 1 if self.items else 0
+
+    @property
+    def last(self):
+        """1-based position of the last item on the page"""
+        return self.first + len(self.items) - 1 if self.items else 0
+
+    def __repr__(self):
+        return f'<KeysetPage {self.page} ({len(self.items)} items)>'
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=50, count=True):
+    """
+    Paginate a query by seeking past the last row seen instead of OFFSET.
+
+    Every page costs one indexed range scan of per_page + 1 rows, so deep
+    pages are as fast as the first one.
+
+    Args:
+        query: Filtered ORM query (any existing ORDER BY is replaced)
+        keys: [(column, descending)] - the sort key; must end with a unique
+              column (normally the primary key) so positions are exact
+        cursor: Token from a previous page's prev_cursor/next_cursor
+        per_page: Rows per page
+        count: Include an approximate total (see approximate_count)
+
+    Returns:
+        KeysetPage
+    """
+    per_page = max(int(per_page or 1), 1)
+    position = decode_cursor(cursor)
+    total = approximate_count(query) if count else None
+
+    if position is None or len(position[0]) != len(keys):
+        values, direction, page = None, 'next', 1
+    else:
+        values, direction, page = position
+
+    reverse = direction == 'prev'
+    paged = query.order_by(None).order_by(
+        *[_order_clause(column, descending, reverse) for column, descending in keys]
+    )
+    if values is not None:
+        paged = paged.filter(_seek_predicate(keys, values, after=not reverse))
+
+    rows = paged.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if reverse:
+        rows.reverse()
+
+    if reverse:
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = values is not None, more
+
+    def key_of(row):
+        return [getattr(row, column.key) for column, _ in keys]
+
+    prev_cursor = next_cursor = None
+    if rows and has_prev:
+        prev_cursor = encode_cursor(key_of(rows[0]), 'prev', max(page - 1, 1))
+    if rows and has_next:
+        next_cursor = encode_cursor(key_of(rows[-1]), 'next', page + 1)
+
+    # A stale "prev" cursor can run past the start; fall back to page 1
+    if reverse and not has_prev:
+        page = 1
+
+    return KeysetPage(rows, per_page, page, total, has_prev, has_next,
+                      prev_cursor, next_cursor)
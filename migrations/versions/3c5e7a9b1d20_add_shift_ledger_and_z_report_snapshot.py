@@ -0,0 +1,73 @@
+"""add shift ledger and z-report snapshot
+
+Revision ID: 3c5e7a9b1d20
+Revises: ff4d33dfdc6d
+Create Date: 2026-10-18 09:12:41.503227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e7a9b1d20'
+down_revision = 'ff4d33dfdc6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    existing_tables = inspector.get_table_names()
+
+    if 'shift_ledgers' not in existing_tables:
+        op.create_table('shift_ledgers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('location_id', sa.Integer(), nullable=False),
+    sa.Column('business_date', sa.Date(), nullable=False),
+    sa.Column('sale_count', sa.Integer(), nullable=False),
+    sa.Column('gross_sales', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_discounts', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_tax', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('net_sales', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('refund_count', sa.Integer(), nullable=False),
+    sa.Column('total_refunds', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_cash', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_card', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_easypaisa', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_jazzcash', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_bank_transfer', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_credit', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('total_other', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['location_id'], ['locations.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('location_id', 'business_date', name='uix_shift_ledger_location_date')
+        )
+        with op.batch_alter_table('shift_ledgers', schema=None) as batch_op:
+            batch_op.create_index('ix_shift_ledgers_location_id', ['location_id'], unique=False)
+            batch_op.create_index('ix_shift_ledgers_business_date', ['business_date'], unique=False)
+
+    existing_columns = [c['name'] for c in inspector.get_columns('day_closes')]
+    with op.batch_alter_table('day_closes', schema=None) as batch_op:
+        if 'z_report_data' not in existing_columns:
+            batch_op.add_column(sa.Column('z_report_data', sa.Text(), nullable=True))
+        if 'z_report_checksum' not in existing_columns:
+            batch_op.add_column(sa.Column('z_report_checksum', sa.String(length=64), nullable=True))
+
+    # Ledger rows for sales made before this migration are backfilled with
+    # `flask reconcile-shift-ledger --repair`
+
+
+def downgrade():
+    with op.batch_alter_table('day_closes', schema=None) as batch_op:
+        batch_op.drop_column('z_report_checksum')
+        batch_op.drop_column('z_report_data')
+
+    with op.batch_alter_table('shift_ledgers', schema=None) as batch_op:
+        batch_op.drop_index('ix_shift_ledgers_business_date')
+        batch_op.drop_index('ix_shift_ledgers_location_id')
+
+    op.drop_table('shift_ledgers')
@@ -0,0 +1,46 @@
+"""add keyset pagination indexes
+
+Revision ID: 5d8e2f4a6b31
+Revises: 3c5e7a9b1d20
+Create Date: 2026-10-18 11:04:17.284915
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2f4a6b31'
+down_revision = '3c5e7a9b1d20'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('products', 'ix_products_active_name_id', ['is_active', 'name', 'id']),
+    ('customers', 'ix_customers_active_name_id', ['is_active', 'name', 'id']),
+    ('sales', 'ix_sales_location_date_id', ['location_id', 'sale_date', 'id']),
+    ('activity_logs', 'ix_activity_logs_timestamp_id', ['timestamp', 'id']),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in INDEXES:
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name not in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in reversed(INDEXES):
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
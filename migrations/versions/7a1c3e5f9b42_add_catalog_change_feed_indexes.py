@@ -0,0 +1,45 @@
+"""add catalog change feed indexes
+
+Revision ID: 7a1c3e5f9b42
+Revises: 5d8e2f4a6b31
+Create Date: 2026-10-18 13:22:05.917340
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1c3e5f9b42'
+down_revision = '5d8e2f4a6b31'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('products', 'ix_products_updated_at', ['updated_at']),
+    ('location_stock', 'ix_location_stock_location_updated', ['location_id', 'updated_at']),
+    ('location_stock', 'ix_location_stock_location_moved', ['location_id', 'last_movement_at']),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in INDEXES:
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name not in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in reversed(INDEXES):
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
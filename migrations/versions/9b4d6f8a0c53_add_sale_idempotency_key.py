@@ -0,0 +1,43 @@
+"""add sale idempotency key
+
+Revision ID: 9b4d6f8a0c53
+Revises: 7a1c3e5f9b42
+Create Date: 2026-10-18 15:47:31.662018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4d6f8a0c53'
+down_revision = '7a1c3e5f9b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    existing_columns = [c['name'] for c in inspector.get_columns('sales')]
+    existing_indexes = [ix['name'] for ix in inspector.get_indexes('sales')]
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        if 'idempotency_key' not in existing_columns:
+            batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        if 'ix_sales_idempotency_key' not in existing_indexes:
+            batch_op.create_index('ix_sales_idempotency_key', ['idempotency_key'], unique=True)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+    existing_columns = [c['name'] for c in inspector.get_columns('sales')]
+    existing_indexes = [ix['name'] for ix in inspector.get_indexes('sales')]
+
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        if 'ix_sales_idempotency_key' in existing_indexes:
+            batch_op.drop_index('ix_sales_idempotency_key')
+        if 'idempotency_key' in existing_columns:
+            batch_op.drop_column('idempotency_key')
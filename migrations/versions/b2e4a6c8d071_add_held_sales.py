@@ -0,0 +1,55 @@
+"""add held sales
+
+Revision ID: b2e4a6c8d071
+Revises: 9b4d6f8a0c53
+Create Date: 2026-10-18 17:05:12.880431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e4a6c8d071'
+down_revision = '9b4d6f8a0c53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    if 'held_sales' not in inspector.get_table_names():
+        op.create_table('held_sales',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('location_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('item_count', sa.Integer(), nullable=True),
+    sa.Column('total', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.ForeignKeyConstraint(['location_id'], ['locations.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('held_sales', schema=None) as batch_op:
+            batch_op.create_index('ix_held_sales_expires_at', ['expires_at'], unique=False)
+            batch_op.create_index('ix_held_sales_location_user_created',
+                                  ['location_id', 'user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    if 'held_sales' in inspector.get_table_names():
+        with op.batch_alter_table('held_sales', schema=None) as batch_op:
+            batch_op.drop_index('ix_held_sales_location_user_created')
+            batch_op.drop_index('ix_held_sales_expires_at')
+        op.drop_table('held_sales')
@@ -0,0 +1,44 @@
+"""add customer lookup indexes
+
+Revision ID: d3a5c7e9f182
+Revises: b2e4a6c8d071
+Create Date: 2026-10-18 19:22:41.507316
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a5c7e9f182'
+down_revision = 'b2e4a6c8d071'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('sales', 'ix_sales_customer_date_id', ['customer_id', 'sale_date', 'id']),
+    ('sale_items', 'ix_sale_items_sale_product', ['sale_id', 'product_id']),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in INDEXES:
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name not in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    for table, name, columns in reversed(INDEXES):
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name in existing:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_index(name)
@@ -0,0 +1,94 @@
+"""add customer search index
+
+Revision ID: e5b7d9f1a263
+Revises: d3a5c7e9f182
+Create Date: 2026-10-18 20:41:09.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+from app.utils.helpers import normalize_phone, search_tokens
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7d9f1a263'
+down_revision = 'd3a5c7e9f182'
+branch_labels = None
+depends_on = None
+
+
+customers = sa.table(
+    'customers',
+    sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('phone', sa.String),
+    sa.column('email', sa.String), sa.column('phone_e164', sa.String),
+    sa.column('phone_reversed', sa.String)
+)
+tokens = sa.table('customer_search_tokens', sa.column('token', sa.String),
+                  sa.column('customer_id', sa.Integer))
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    columns = [col['name'] for col in inspector.get_columns('customers')]
+    indexes = [ix['name'] for ix in inspector.get_indexes('customers')]
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        if 'phone_e164' not in columns:
+            batch_op.add_column(sa.Column('phone_e164', sa.String(length=20), nullable=True))
+        if 'phone_reversed' not in columns:
+            batch_op.add_column(sa.Column('phone_reversed', sa.String(length=20), nullable=True))
+        if 'ix_customers_phone_e164' not in indexes:
+            batch_op.create_index('ix_customers_phone_e164', ['phone_e164'], unique=False)
+        if 'ix_customers_phone_reversed' not in indexes:
+            batch_op.create_index('ix_customers_phone_reversed', ['phone_reversed'], unique=False)
+
+    if 'customer_search_tokens' not in inspector.get_table_names():
+        op.create_table('customer_search_tokens',
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('token', 'customer_id')
+        )
+        with op.batch_alter_table('customer_search_tokens', schema=None) as batch_op:
+            batch_op.create_index('ix_customer_search_tokens_customer_token', ['customer_id', 'token'],
+                                  unique=False)
+
+    # Backfill normalized phones and name/email tokens
+    conn.execute(tokens.delete())
+    rows = conn.execute(sa.select(customers.c.id, customers.c.name, customers.c.phone,
+                                  customers.c.email)).fetchall()
+    token_rows = []
+    for customer_id, name, phone, email in rows:
+        e164 = normalize_phone(phone)
+        digits = ''.join(filter(str.isdigit, e164 or phone or ''))
+        conn.execute(customers.update().where(customers.c.id == customer_id).values(
+            phone_e164=e164, phone_reversed=digits[::-1] or None))
+        token_rows.extend({'token': token, 'customer_id': customer_id}
+                          for token in search_tokens(name, email))
+    if token_rows:
+        conn.execute(tokens.insert(), token_rows)
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = inspect(conn)
+
+    if 'customer_search_tokens' in inspector.get_table_names():
+        with op.batch_alter_table('customer_search_tokens', schema=None) as batch_op:
+            batch_op.drop_index('ix_customer_search_tokens_customer_token')
+        op.drop_table('customer_search_tokens')
+
+    columns = [col['name'] for col in inspector.get_columns('customers')]
+    indexes = [ix['name'] for ix in inspector.get_indexes('customers')]
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        if 'ix_customers_phone_reversed' in indexes:
+            batch_op.drop_index('ix_customers_phone_reversed')
+        if 'ix_customers_phone_e164' in indexes:
+            batch_op.drop_index('ix_customers_phone_e164')
+        if 'phone_reversed' in columns:
+            batch_op.drop_column('phone_reversed')
+        if 'phone_e164' in columns:
+            batch_op.drop_column('phone_e164')
@@ -0,0 +1,30 @@
+"""add full-text search documents
+
+Revision ID: f6c8e0a2b374
+Revises: e5b7d9f1a263
+Create Date: 2026-10-19 00:41:27.105834
+
+"""
+from alembic import op
+
+from app.services.search_service import SQLiteFTSBackend, PostgresFTSBackend, populate_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c8e0a2b374'
+down_revision = 'e5b7d9f1a263'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 table / tsvector + GIN with sync triggers, filled from existing rows
+    populate_search_index(op.get_bind())
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        SQLiteFTSBackend().uninstall(bind)
+    elif bind.dialect.name == 'postgresql':
+        PostgresFTSBackend().uninstall(bind)
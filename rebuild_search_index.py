@@ -0,0 +1,32 @@
+"""
+Search Index Rebuild Script
+Run this script to re-create the full-text search index after restoring a
+backup, bulk imports, or raw SQL changes that bypassed the sync triggers
+"""
+
+import time
+
+from app import create_app
+from app.services.search_service import get_backend, rebuild_search_index
+
+
+def rebuild():
+    """Rebuild the global search index and report document counts"""
+    app = create_app()
+
+    with app.app_context():
+        print("Rebuilding search index...")
+        started = time.perf_counter()
+        counts = rebuild_search_index()
+        if not counts:
+            print("✗ Full-text search is not available on this database; searches use LIKE scans")
+            return
+
+        for kind, total in counts.items():
+            print(f"✓ {kind}: {total} documents")
+        print(f"✓ Rebuilt {sum(counts.values())} documents with {get_backend().name} "
+              f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    rebuild()
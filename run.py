@@ -10,6 +10,7 @@ if hasattr(time, 'tzset'):
     time.tzset()  # Unix only. On Windows, set timezone via Settings > Time & language > Pakistan (UTC+05:00).
 
 import logging
+import click
 from app import create_app, db
 from app.services.sync_service import SyncService
 from app.services.email_service import EmailService
@@ -114,6 +115,29 @@ def backup_database():
     logger.info("Backup completed!")
 
 
+@app.cli.command()
+@click.option('--location-id', type=int, default=None, help='Only check one location')
+@click.option('--days', type=int, default=None, help='Only check the last N days')
+@click.option('--repair', is_flag=True, help='Rewrite drifted ledger rows from raw sales')
+def reconcile_shift_ledger(location_id, days, repair):
+    """Verify running day totals against raw sales"""
+    from datetime import date, timedelta
+    from app.services.shift_ledger_service import reconcile_ledgers
+
+    start_date = date.today() - timedelta(days=days) if days else None
+    discrepancies = reconcile_ledgers(location_id=location_id, start_date=start_date, repair=repair)
+
+    for item in discrepancies:
+        fields = ', '.join(f"{name}: ledger={values['ledger']} raw={values['raw']}"
+                           for name, values in item['fields'].items())
+        logger.warning(f"Ledger drift at location {item['location_id']} on {item['business_date']}: {fields}")
+
+    if not discrepancies:
+        logger.info("Shift ledger matches raw sales")
+    elif repair:
+        logger.info(f"Repaired {len(discrepancies)} ledger row(s)")
+
+
 def start_background_services():
     """Start background services for sync, email, and backup"""
     logger.info("Starting background services...")
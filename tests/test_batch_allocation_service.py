@@ -0,0 +1,376 @@
+"""
+Tests for the FEFO batch allocation service.
+
+Covers:
+- FEFO planning across a whole cart in one query
+- Atomic batch decrements with bulk BatchMovement rows
+- Checkout, return and transfer integration keeping batches in step with LocationStock
+- Concurrent allocations against the same batches never oversell
+"""
+
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.models import (db, Location, LocationStock, Product, ProductBatch, BatchMovement,
+                        Sale, StockTransfer, StockTransferItem, User)
+
+
+def _add_batch(product, location, number, quantity, expiry_in_days=None, received_days_ago=0):
+    """Create an active batch."""
+    batch = ProductBatch(
+        product_id=product.id,
+        location_id=location.id,
+        batch_number=number,
+        initial_quantity=Decimal(quantity),
+        current_quantity=Decimal(quantity),
+        expiry_date=date.today() + timedelta(days=expiry_in_days) if expiry_in_days is not None else None,
+        received_date=date.today() - timedelta(days=received_days_ago),
+        unit_cost=Decimal('100')
+    )
+    db.session.add(batch)
+    return batch
+
+
+@pytest.fixture
+def batched_kiosk(fresh_app, init_database):
+    """
+    Give PRD001 four batches at the kiosk (one expired) whose total matches LocationStock.
+
+    Returns (kiosk_id, product_id, {batch_number: batch_id}).
+    """
+    with fresh_app.app_context():
+        kiosk = Location.query.filter_by(code='K-001').first()
+        product = Product.query.filter_by(code='PRD001').first()
+        stock = LocationStock.query.filter_by(location_id=kiosk.id, product_id=product.id).first()
+
+        late = _add_batch(product, kiosk, 'B-LATE', 20, expiry_in_days=200)
+        soon = _add_batch(product, kiosk, 'B-SOON', 5, expiry_in_days=10)
+        undated = _add_batch(product, kiosk, 'B-NODATE', 10)
+        expired = _add_batch(product, kiosk, 'B-EXPIRED', 7, expiry_in_days=-1)
+        stock.quantity = 42
+        db.session.commit()
+
+        return kiosk.id, product.id, {
+            'B-LATE': late.id, 'B-SOON': soon.id,
+            'B-NODATE': undated.id, 'B-EXPIRED': expired.id
+        }
+
+
+class TestFefoPlanning:
+    """Tests for plan_fefo_allocation."""
+
+    def test_plan_takes_earliest_expiry_first(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import plan_fefo_allocation
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            allocations, unallocated = plan_fefo_allocation({product_id: 30}, kiosk_id)
+
+            plan = [(a['batch_number'], a['quantity']) for a in allocations[product_id]]
+            assert plan == [('B-SOON', Decimal('5')), ('B-LATE', Decimal('20')),
+                            ('B-NODATE', Decimal('5'))]
+            assert unallocated == {}
+
+    def test_plan_skips_expired_and_reports_shortfall(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import plan_fefo_allocation
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            allocations, unallocated = plan_fefo_allocation({product_id: 40}, kiosk_id)
+
+            assert batches['B-EXPIRED'] not in {a['batch_id'] for a in allocations[product_id]}
+            assert unallocated == {product_id: Decimal('5')}
+
+    def test_whole_cart_in_one_query(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import plan_fefo_allocation
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            other = Product.query.filter_by(code='PRD002').first()
+            kiosk = Location.query.get(kiosk_id)
+            _add_batch(other, kiosk, 'B-OTHER', 3, expiry_in_days=30)
+            db.session.commit()
+            other_id = other.id
+
+            statements = []
+
+            def count(*args):
+                statements.append(args)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                allocations, _ = plan_fefo_allocation({product_id: 2, other_id: 1}, kiosk_id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+            assert len(statements) == 1
+            assert set(allocations) == {product_id, other_id}
+
+
+class TestAllocateFefo:
+    """Tests for allocate_fefo."""
+
+    def test_decrements_batches_and_records_movements(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import allocate_fefo
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            result = allocate_fefo({product_id: 8}, kiosk_id, user_id=1,
+                                   reference_type='sale', reference_id=99)
+            db.session.commit()
+
+            assert result['unallocated'] == {}
+            soon = ProductBatch.query.get(batches['B-SOON'])
+            late = ProductBatch.query.get(batches['B-LATE'])
+            assert soon.current_quantity == 0
+            assert soon.status == 'depleted'
+            assert late.current_quantity == 17
+
+            movements = BatchMovement.query.filter_by(reference_type='sale', reference_id=99).all()
+            assert sorted(float(m.quantity) for m in movements) == [-5.0, -3.0]
+            late_move = next(m for m in movements if m.batch_id == late.id)
+            assert late_move.quantity_before == 20
+            assert late_move.quantity_after == 17
+
+    def test_lost_race_replans_before_taking_later_batches(self, fresh_app, batched_kiosk, monkeypatch):
+        from app.services import batch_allocation_service as service
+
+        kiosk_id, product_id, batches = batched_kiosk
+        real_cas = service._compare_and_set
+        attempts = []
+
+        def flaky_cas(batch_id, before, after, now):
+            attempts.append(batch_id)
+            if len(attempts) == 1:
+                return False  # Another checkout touched B-SOON first
+            return real_cas(batch_id, before, after, now)
+
+        monkeypatch.setattr(service, '_compare_and_set', flaky_cas)
+
+        with fresh_app.app_context():
+            result = service.allocate_fefo({product_id: 8}, kiosk_id, user_id=1, reference_type='sale')
+
+            # B-LATE is not touched in the pass that lost B-SOON
+            assert attempts == [batches['B-SOON'], batches['B-SOON'], batches['B-LATE']]
+            assert [a['batch_number'] for a in result['allocations'][product_id]] == ['B-SOON', 'B-LATE']
+            assert result['shortfall'] == {}
+
+    def test_shortfall_reported_for_batch_tracked_products(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import allocate_fefo
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            other = Product.query.filter_by(code='PRD003').first()
+
+            result = allocate_fefo({product_id: 40, other.id: 2}, kiosk_id, user_id=1,
+                                   reference_type='sale')
+
+            assert result['unallocated'] == {product_id: Decimal('5'), other.id: Decimal('2')}
+            assert result['shortfall'] == {product_id: Decimal('5')}
+
+    def test_products_without_batches_are_untouched(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import allocate_fefo
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            other = Product.query.filter_by(code='PRD003').first()
+
+            result = allocate_fefo({other.id: 4}, kiosk_id, user_id=1, reference_type='sale')
+
+            assert result['unallocated'] == {other.id: Decimal('4')}
+            assert BatchMovement.query.count() == 0
+
+    def test_discrepancy_check(self, fresh_app, batched_kiosk):
+        from app.services.batch_allocation_service import batch_stock_discrepancies
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            assert batch_stock_discrepancies(kiosk_id) == []
+
+            stock = LocationStock.query.filter_by(location_id=kiosk_id, product_id=product_id).first()
+            stock.quantity = 40
+            db.session.commit()
+
+            drift = batch_stock_discrepancies(kiosk_id)
+            assert len(drift) == 1
+            assert drift[0]['batch_quantity'] == 42
+            assert drift[0]['location_quantity'] == 40
+
+
+class TestCheckoutIntegration:
+    """complete_sale and returns move batches alongside LocationStock."""
+
+    def _sell(self, client, product_id, quantity):
+        product = Product.query.get(product_id)
+        total = float(product.selling_price) * quantity
+        return client.post('/pos/complete-sale', json={
+            'items': [{
+                'product_id': product_id,
+                'quantity': quantity,
+                'unit_price': float(product.selling_price),
+                'subtotal': total
+            }],
+            'subtotal': total,
+            'total': total,
+            'payment_method': 'cash',
+            'amount_paid': total
+        })
+
+    def test_sale_draws_from_batches(self, fresh_app, batched_kiosk, auth_cashier):
+        from app.services.batch_allocation_service import batch_stock_discrepancies
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            response = self._sell(auth_cashier, product_id, 7)
+            assert response.get_json()['success'] is True
+            sale_id = response.get_json()['sale_id']
+
+            assert ProductBatch.query.get(batches['B-SOON']).current_quantity == 0
+            assert ProductBatch.query.get(batches['B-LATE']).current_quantity == 18
+            assert BatchMovement.query.filter_by(reference_type='sale', reference_id=sale_id).count() == 2
+            assert batch_stock_discrepancies(kiosk_id) == []
+
+    def test_sale_fails_when_batches_run_short(self, fresh_app, batched_kiosk, auth_cashier):
+        from app.services.batch_allocation_service import batch_stock_discrepancies
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            # LocationStock holds 42, but only 35 units sit in unexpired batches
+            response = self._sell(auth_cashier, product_id, 40)
+
+            assert response.status_code == 400
+            assert 'batch' in response.get_json()['error']
+            assert Sale.query.count() == 0
+            assert BatchMovement.query.count() == 0
+            assert ProductBatch.query.get(batches['B-SOON']).current_quantity == 5
+            stock = LocationStock.query.filter_by(location_id=kiosk_id, product_id=product_id).first()
+            assert stock.quantity == 42
+            assert batch_stock_discrepancies(kiosk_id) == []
+
+    def test_return_restocks_original_batches(self, fresh_app, batched_kiosk, auth_cashier):
+        from app.services.batch_allocation_service import restock_sale_batches
+
+        kiosk_id, product_id, batches = batched_kiosk
+        with fresh_app.app_context():
+            response = self._sell(auth_cashier, product_id, 7)
+            sale_id = response.get_json()['sale_id']
+
+            # Latest-expiring batch is refilled first, capped at what the sale took
+            unmatched = restock_sale_batches(sale_id, {product_id: 4}, user_id=1)
+            db.session.commit()
+
+            assert unmatched == {}
+            assert ProductBatch.query.get(batches['B-LATE']).current_quantity == 20
+            soon = ProductBatch.query.get(batches['B-SOON'])
+            assert soon.current_quantity == 2
+            assert soon.status == 'active'
+
+            # The remaining 3 units are all that is left to return
+            unmatched = restock_sale_batches(sale_id, {product_id: 5}, user_id=1)
+            assert unmatched == {product_id: Decimal('2')}
+
+
+class TestTransferIntegration:
+    """Dispatch and receive carry batches between locations."""
+
+    def test_batches_follow_the_transfer(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers, receive_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD002').first()
+            _add_batch(product, warehouse, 'W-1', 4, expiry_in_days=15)
+            _add_batch(product, warehouse, 'W-2', 50, expiry_in_days=90)
+            transfer = StockTransfer(transfer_number='TRF-B-1', source_location_id=warehouse.id,
+                                     destination_location_id=kiosk.id, status='approved')
+            db.session.add(transfer)
+            db.session.flush()
+            db.session.add(StockTransferItem(transfer_id=transfer.id, product_id=product.id,
+                                             quantity_requested=10, quantity_approved=10))
+            db.session.commit()
+
+            dispatch_transfers([transfer], user_id=1)
+            item = transfer.items.first()
+            receive_transfers([transfer], user_id=1, received_quantities={item.id: 9})
+
+            source = {b.batch_number: b.current_quantity for b in
+                      ProductBatch.query.filter_by(location_id=warehouse.id, product_id=product.id)}
+            dest = {b.batch_number: b.current_quantity for b in
+                    ProductBatch.query.filter_by(location_id=kiosk.id, product_id=product.id)}
+            assert source == {'W-1': 0, 'W-2': 44}
+            # One unit short on arrival comes off the later-expiring batch
+            assert dest == {'W-1': 4, 'W-2': 5}
+
+
+class TestConcurrentAllocation:
+    """Many checkouts racing for the same batches never oversell."""
+
+    THREADS = 8
+    PER_THREAD = 4
+
+    def test_concurrent_allocations(self, tmp_path, monkeypatch):
+        from config import TestingConfig
+        from app import create_app
+        from app.services.batch_allocation_service import allocate_fefo
+
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI',
+                            f"sqlite:///{tmp_path / 'batches.db'}")
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_ENGINE_OPTIONS',
+                            {'connect_args': {'timeout': 30}}, raising=False)
+        app = create_app('testing')
+
+        with app.app_context():
+            db.create_all()
+            location = Location(code='K-RACE', name='Race Kiosk', location_type='kiosk')
+            product = Product(code='RACE1', name='Race Product', cost_price=10,
+                              selling_price=20, quantity=0)
+            user = User(username='racer', email='racer@test.com', full_name='Racer', role='cashier')
+            user.set_password('racer123')
+            db.session.add_all([location, product, user])
+            db.session.flush()
+            _add_batch(product, location, 'R-1', 7, expiry_in_days=5)
+            _add_batch(product, location, 'R-2', 9, expiry_in_days=50)
+            db.session.commit()
+            location_id, product_id, user_id = location.id, product.id, user.id
+
+        allocated = []
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def checkout():
+            with app.app_context():
+                try:
+                    start.wait()
+                    result = allocate_fefo({product_id: self.PER_THREAD}, location_id,
+                                           user_id, 'sale')
+                    db.session.commit()
+                    allocated.append(sum(a['quantity'] for a in result['allocations'].get(product_id, [])))
+                except Exception as e:  # pragma: no cover - surfaced by the assert below
+                    db.session.rollback()
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=checkout) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        with app.app_context():
+            remaining = sum(b.current_quantity for b in ProductBatch.query.all())
+            moved = -sum(m.quantity for m in BatchMovement.query.all())
+
+            assert errors == []
+            assert sum(allocated) == 16
+            assert remaining == 0
+            assert moved == 16
+            assert all(m.quantity_after == m.quantity_before + m.quantity
+                       for m in BatchMovement.query.all())
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,220 @@
+"""
+Tests for the POS catalog snapshot and change feed.
+
+Covers:
+- Snapshot contents, per-location stock and caching by version
+- ETag revalidation and gzip encoding on /pos/catalog
+- Deltas carry only changed products, including deactivations and stock moves
+- Polling an unchanged catalog stays cheap
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.models import db, Location, LocationStock, Product
+
+
+def _kiosk():
+    return Location.query.filter_by(code='K-001').first()
+
+
+def _by_id(payload):
+    fields = payload['fields']
+    return {row[0]: dict(zip(fields, row)) for row in payload['products']}
+
+
+def _age_catalog(minutes=10):
+    """Push every change stamp into the past so deltas start empty."""
+    past = datetime.utcnow() - timedelta(minutes=minutes)
+    db.session.query(Product).update({Product.updated_at: past}, synchronize_session=False)
+    db.session.query(LocationStock).update(
+        {LocationStock.updated_at: past, LocationStock.last_movement_at: past},
+        synchronize_session=False)
+    db.session.commit()
+
+
+class _QueryCounter:
+    """Count SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class TestSnapshot:
+    """catalog_snapshot() serializes active products with location stock."""
+
+    def test_snapshot_has_location_stock(self, fresh_app, init_database):
+        from app.services.catalog_service import catalog_snapshot, clear_catalog_cache
+
+        with fresh_app.app_context():
+            clear_catalog_cache()
+            kiosk = _kiosk()
+            product = Product.query.filter_by(code='PRD001').first()
+            stock = LocationStock.query.filter_by(location_id=kiosk.id, product_id=product.id).first()
+            stock.reserved_quantity = 2
+            inactive = Product.query.filter_by(code='PRD003').first()
+            inactive.is_active = False
+            db.session.commit()
+
+            payload = json.loads(catalog_snapshot(kiosk.id).body)
+            rows = _by_id(payload)
+
+            assert rows[product.id]['quantity'] == stock.quantity - 2
+            assert rows[product.id]['barcode'] == product.barcode
+            assert rows[product.id]['selling_price'] == float(product.selling_price)
+            assert inactive.id not in rows
+            assert payload['version'] != '0'
+
+    def test_snapshot_is_reused_until_version_moves(self, fresh_app, init_database):
+        from app.services.catalog_service import catalog_snapshot, clear_catalog_cache
+
+        with fresh_app.app_context():
+            clear_catalog_cache()
+            kiosk_id = _kiosk().id
+            first = catalog_snapshot(kiosk_id)
+            assert catalog_snapshot(kiosk_id) is first
+
+            product = Product.query.filter_by(code='PRD001').first()
+            product.selling_price = 999
+            db.session.commit()
+            clear_catalog_cache()
+
+            second = catalog_snapshot(kiosk_id)
+            assert second.version > first.version
+            assert second.etag != first.etag
+            assert _by_id(json.loads(second.body))[product.id]['selling_price'] == 999
+
+
+class TestChanges:
+    """catalog_changes() returns only rows changed since a version."""
+
+    def test_delta_contains_only_changed_rows(self, fresh_app, init_database):
+        from app.services.catalog_service import (catalog_changes, catalog_version,
+                                                  clear_catalog_cache)
+
+        with fresh_app.app_context():
+            _age_catalog(10)
+            clear_catalog_cache()
+            kiosk = _kiosk()
+            since = catalog_version(kiosk.id)
+            # Move untouched rows out of the overlap window
+            _age_catalog(30)
+            clear_catalog_cache()
+            assert catalog_changes(kiosk.id, since)['products'] == []
+
+            priced = Product.query.filter_by(code='PRD001').first()
+            priced.selling_price = 123
+            moved = Product.query.filter_by(code='PRD002').first()
+            stock = LocationStock.query.filter_by(location_id=kiosk.id, product_id=moved.id).first()
+            stock.quantity = 3
+            dropped = Product.query.filter_by(code='PRD003').first()
+            dropped.is_active = False
+            db.session.commit()
+            clear_catalog_cache()
+
+            delta = catalog_changes(kiosk.id, since)
+            rows = _by_id(delta)
+
+            assert set(rows) == {priced.id, moved.id, dropped.id}
+            assert rows[priced.id]['selling_price'] == 123
+            assert rows[moved.id]['quantity'] == 3
+            assert rows[dropped.id]['is_active'] is False
+            assert delta['version'] > since
+
+    def test_other_locations_stock_is_not_a_change(self, fresh_app, init_database):
+        from app.services.catalog_service import (catalog_changes, catalog_version,
+                                                  clear_catalog_cache)
+
+        with fresh_app.app_context():
+            _age_catalog()
+            clear_catalog_cache()
+            kiosk = _kiosk()
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            since = catalog_version(kiosk.id)
+
+            stock = LocationStock.query.filter_by(location_id=warehouse.id).first()
+            stock.quantity += 5
+            db.session.commit()
+            clear_catalog_cache()
+
+            assert catalog_version(kiosk.id) == since
+            assert catalog_changes(kiosk.id, since)['products'] == []
+
+    def test_bad_version_asks_for_reload(self, fresh_app, init_database):
+        from app.services.catalog_service import catalog_changes
+
+        with fresh_app.app_context():
+            assert catalog_changes(_kiosk().id, 'not-a-version') is None
+            assert catalog_changes(_kiosk().id, None) is None
+
+    def test_unchanged_poll_is_cached(self, fresh_app, init_database):
+        from app.services.catalog_service import (catalog_changes, catalog_version,
+                                                  clear_catalog_cache)
+
+        with fresh_app.app_context():
+            clear_catalog_cache()
+            kiosk_id = _kiosk().id
+            since = catalog_version(kiosk_id)
+
+            with _QueryCounter(db.engine) as counter:
+                for _ in range(50):
+                    catalog_changes(kiosk_id, since)
+
+            assert counter.count == 0
+
+
+class TestCatalogRoutes:
+    """HTTP caching on the catalog endpoints."""
+
+    def test_etag_and_gzip(self, auth_manager, fresh_app):
+        from app.services.catalog_service import clear_catalog_cache
+
+        with fresh_app.app_context():
+            clear_catalog_cache()
+
+        response = auth_manager.get('/pos/catalog', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        payload = json.loads(gzip.decompress(response.data))
+        assert payload['products']
+
+        etag = response.headers['ETag']
+        response = auth_manager.get('/pos/catalog', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
+        plain = auth_manager.get('/pos/catalog')
+        assert 'Content-Encoding' not in plain.headers
+        assert json.loads(plain.data)['version'] == payload['version']
+
+    def test_changes_endpoint(self, auth_manager, fresh_app):
+        response = auth_manager.get('/pos/catalog')
+        version = response.get_json()['version']
+
+        response = auth_manager.get(f'/pos/catalog/changes?since={version}')
+        assert response.status_code == 200
+        assert response.get_json()['version'] == version
+
+        response = auth_manager.get('/pos/catalog/changes?since=garbage')
+        assert response.status_code == 409
+        assert response.get_json()['reload'] is True
+
+    def test_pos_page_loads_catalog(self, auth_manager):
+        response = auth_manager.get('/pos/')
+        assert response.status_code == 200
+        assert "fetch('/pos/catalog'" in response.get_data(as_text=True)
@@ -0,0 +1,185 @@
+"""
+Tests for idempotent checkout and offline sale replay.
+
+Covers:
+- complete-sale with an idempotency key records the sale once
+- Batch replay reports created, duplicate and rejected sales
+- Replaying 1,000 queued sales after an outage
+"""
+
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.models import db, Location, LocationStock, Product, Sale, StockMovement
+
+
+def _cart(product, quantity=1, **extra):
+    total = float(product.selling_price) * quantity
+    data = {
+        'items': [{
+            'product_id': product.id,
+            'quantity': quantity,
+            'unit_price': float(product.selling_price),
+            'subtotal': total
+        }],
+        'subtotal': total,
+        'total': total,
+        'payment_method': 'cash',
+        'amount_paid': total
+    }
+    data.update(extra)
+    return data
+
+
+def _kiosk_stock(product):
+    kiosk = Location.query.filter_by(code='K-001').first()
+    return LocationStock.query.filter_by(location_id=kiosk.id, product_id=product.id).first()
+
+
+class TestIdempotentCheckout:
+    """complete-sale honours client idempotency keys."""
+
+    def test_retry_returns_original_sale(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            before = _kiosk_stock(product).quantity
+            data = _cart(product, 2, idempotency_key='tab-1-0001')
+
+            first = auth_manager.post('/pos/complete-sale', json=data).get_json()
+            second = auth_manager.post('/pos/complete-sale', json=data).get_json()
+
+            assert first['success'] and second['success']
+            assert second['sale_id'] == first['sale_id']
+            assert second['sale_number'] == first['sale_number']
+            assert second['replayed'] is True
+            assert Sale.query.filter_by(idempotency_key='tab-1-0001').count() == 1
+            db.session.expire_all()
+            assert _kiosk_stock(product).quantity == before - 2
+
+    def test_header_key_is_accepted(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            data = _cart(product)
+            headers = {'Idempotency-Key': 'hdr-0001'}
+
+            first = auth_manager.post('/pos/complete-sale', json=data, headers=headers).get_json()
+            second = auth_manager.post('/pos/complete-sale', json=data, headers=headers).get_json()
+
+            assert second['sale_id'] == first['sale_id']
+            assert Sale.query.count() == 1
+
+    def test_sales_without_key_still_work(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            auth_manager.post('/pos/complete-sale', json=_cart(product))
+            auth_manager.post('/pos/complete-sale', json=_cart(product))
+
+            assert Sale.query.count() == 2
+
+    def test_rejected_sale_does_not_burn_key(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            available = _kiosk_stock(product).available_quantity
+
+            response = auth_manager.post('/pos/complete-sale',
+                                         json=_cart(product, available + 1, idempotency_key='k-retry'))
+            assert response.status_code == 400
+
+            response = auth_manager.post('/pos/complete-sale',
+                                         json=_cart(product, 1, idempotency_key='k-retry'))
+            assert response.get_json()['success']
+            assert 'replayed' not in response.get_json()
+
+
+class TestReplay:
+    """Queued offline sales replay in one transaction with per-sale results."""
+
+    def test_reports_each_sale(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            available = _kiosk_stock(product).available_quantity
+            sold_at = (datetime.now() - timedelta(hours=2)).replace(microsecond=0)
+
+            auth_manager.post('/pos/complete-sale', json=_cart(product, 1, idempotency_key='q-1'))
+
+            response = auth_manager.post('/pos/replay-sales', json={'sales': [
+                _cart(product, 1, idempotency_key='q-1'),
+                _cart(product, 1, idempotency_key='q-2', sold_at=sold_at.isoformat()),
+                _cart(product, available + 10, idempotency_key='q-3'),
+                _cart(product, 1),
+            ]})
+            assert response.status_code == 200
+            results = response.get_json()['results']
+
+            assert [r['status'] for r in results] == ['duplicate', 'created', 'rejected', 'rejected']
+            assert 'Insufficient stock' in results[2]['error']
+            assert 'idempotency key' in results[3]['error']
+
+            created = Sale.query.filter_by(idempotency_key='q-2').one()
+            assert created.sale_date == sold_at
+            assert Sale.query.filter_by(idempotency_key='q-3').count() == 0
+            assert Sale.query.count() == 2
+            assert StockMovement.query.filter_by(reference=results[2].get('sale_number')).count() == 0
+
+    def test_rejects_stale_offline_sales(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            old = (datetime.now() - timedelta(days=30)).isoformat()
+
+            response = auth_manager.post('/pos/replay-sales', json={'sales': [
+                _cart(product, 1, idempotency_key='old-1', sold_at=old)
+            ]})
+
+            assert response.get_json()['results'][0]['status'] == 'rejected'
+            assert Sale.query.count() == 0
+
+    def test_oversized_batch_refused(self, fresh_app, auth_manager):
+        from app.services.checkout_service import REPLAY_BATCH_LIMIT
+
+        response = auth_manager.post('/pos/replay-sales', json={
+            'sales': [{'idempotency_key': str(i)} for i in range(REPLAY_BATCH_LIMIT + 1)]
+        })
+        assert response.status_code == 400
+
+
+class TestReplayBenchmark:
+    """1,000 queued sales replay after an outage."""
+
+    SALES = 1000
+
+    def test_replay_1000_sales(self, fresh_app, auth_manager):
+        from app.services.checkout_service import REPLAY_BATCH_LIMIT
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            stock = _kiosk_stock(product)
+            stock.quantity = self.SALES + 10
+            stock.reserved_quantity = 0
+            db.session.commit()
+            product_id = product.id
+            queue = [_cart(product, 1, idempotency_key=uuid.uuid4().hex) for _ in range(self.SALES)]
+
+        started = time.perf_counter()
+        for start in range(0, self.SALES, REPLAY_BATCH_LIMIT):
+            response = auth_manager.post('/pos/replay-sales',
+                                         json={'sales': queue[start:start + REPLAY_BATCH_LIMIT]})
+            assert response.status_code == 200
+            assert {r['status'] for r in response.get_json()['results']} == {'created'}
+        elapsed = time.perf_counter() - started
+
+        # Replaying the same queue again (terminal never saw the responses)
+        started = time.perf_counter()
+        for start in range(0, self.SALES, REPLAY_BATCH_LIMIT):
+            response = auth_manager.post('/pos/replay-sales',
+                                         json={'sales': queue[start:start + REPLAY_BATCH_LIMIT]})
+            assert {r['status'] for r in response.get_json()['results']} == {'duplicate'}
+        replay_elapsed = time.perf_counter() - started
+
+        print(f'\n1000 offline sales: first replay {elapsed:.2f}s, duplicate replay {replay_elapsed:.2f}s')
+        assert elapsed < 60
+        assert replay_elapsed < elapsed
+
+        with fresh_app.app_context():
+            assert Sale.query.count() == self.SALES
+            assert _kiosk_stock(Product.query.get(product_id)).quantity == 10
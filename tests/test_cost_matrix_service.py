@@ -0,0 +1,223 @@
+"""
+Tests for the location cost matrix service.
+
+Covers:
+- Per-pair cost computation (percentage and fixed kiosk charges)
+- Bulk upsert of LocationProductCost rows
+- Cost history recorded only for products whose landed cost changed
+- In-memory cost lookup and invalidation
+"""
+
+import pytest
+from decimal import Decimal
+
+from app.models import db, Product, Location
+from app.models_extended import LocationProductCost, ProductCostHistory
+
+
+@pytest.fixture
+def cost_setup(fresh_app, init_database):
+    """Give the kiosk a 10% charge and return (warehouse_id, kiosk_id)."""
+    with fresh_app.app_context():
+        kiosk = Location.query.filter_by(code='K-001').first()
+        kiosk.kiosk_charge_type = 'percentage'
+        kiosk.kiosk_charge_rate = Decimal('10.00')
+        db.session.commit()
+        warehouse = Location.query.filter_by(code='WH-001').first()
+        return warehouse.id, kiosk.id
+
+
+class TestComputeCostEntry:
+    """Tests for the pure per-pair computation."""
+
+    def test_percentage_charge(self):
+        from app.services.cost_matrix_service import compute_cost_entry
+
+        entry = compute_cost_entry(Decimal('200'), 'percentage', Decimal('10'))
+
+        assert entry.landed_cost == Decimal('200.00')
+        assert entry.kiosk_charge == Decimal('20.00')
+        assert entry.final_cost == Decimal('220.00')
+        assert entry.suggested_selling_price == Decimal('286.00')
+
+    def test_fixed_charge(self):
+        from app.services.cost_matrix_service import compute_cost_entry
+
+        entry = compute_cost_entry(Decimal('200'), 'fixed', Decimal('15'))
+
+        assert entry.kiosk_charge == Decimal('15.00')
+        assert entry.final_cost == Decimal('215.00')
+
+    def test_no_charge(self):
+        from app.services.cost_matrix_service import compute_cost_entry
+
+        entry = compute_cost_entry(Decimal('99.99'), 'percentage', None)
+
+        assert entry.kiosk_charge == Decimal('0.00')
+        assert entry.final_cost == Decimal('99.99')
+
+
+class TestRebuildLocationCosts:
+    """Tests for bulk upsert of location product costs."""
+
+    def test_creates_rows_for_all_pairs(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import rebuild_location_costs
+
+        with fresh_app.app_context():
+            result = rebuild_location_costs()
+
+            active_products = Product.query.filter_by(is_active=True).count()
+            assert result['pairs'] == active_products * 2
+            assert result['inserted'] == result['pairs']
+            assert LocationProductCost.query.count() == result['pairs']
+
+    def test_rerun_is_noop(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import rebuild_location_costs
+
+        with fresh_app.app_context():
+            rebuild_location_costs()
+            result = rebuild_location_costs()
+
+            assert result['inserted'] == 0
+            assert result['updated'] == 0
+            assert result['unchanged'] == result['pairs']
+            assert ProductCostHistory.query.count() == 0
+
+    def test_charge_change_updates_only_that_location(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import rebuild_location_costs
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            rebuild_location_costs()
+
+            kiosk = Location.query.get(kiosk_id)
+            kiosk.kiosk_charge_rate = Decimal('20.00')
+            db.session.commit()
+
+            result = rebuild_location_costs(location_ids=[kiosk_id])
+            assert result['updated'] == result['pairs']
+
+            product = Product.query.filter_by(code='PRD001').first()
+            lpc = LocationProductCost.query.filter_by(
+                location_id=kiosk_id, product_id=product.id
+            ).first()
+            landed = product.cost_price
+            assert lpc.final_cost == (landed * Decimal('1.2')).quantize(Decimal('0.01'))
+
+            # Landed costs did not move, so no history rows
+            assert ProductCostHistory.query.count() == 0
+
+    def test_history_only_for_changed_products(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import rebuild_location_costs
+
+        with fresh_app.app_context():
+            rebuild_location_costs()
+
+            product = Product.query.filter_by(code='PRD002').first()
+            product.base_cost = Decimal('280.00')
+            product.packaging_cost = Decimal('25.00')
+            db.session.commit()
+
+            result = rebuild_location_costs(user_id=1, reason='Packaging increase')
+
+            assert result['updated'] == 2
+            assert result['history_recorded'] == 1
+            history = ProductCostHistory.query.all()
+            assert len(history) == 1
+            assert history[0].product_id == product.id
+            assert history[0].change_reason == 'Packaging increase'
+
+    def test_recalculate_location_costs_delegates(self, fresh_app, cost_setup):
+        from app.utils.cost_calculations import recalculate_location_costs
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            count = recalculate_location_costs(kiosk_id)
+
+            assert count == Product.query.filter_by(is_active=True).count()
+            assert LocationProductCost.query.filter_by(location_id=kiosk_id).count() == count
+            assert recalculate_location_costs(99999) == 0
+
+
+class TestCostMatrixLookup:
+    """Tests for the in-memory cost lookup."""
+
+    def test_lookup_without_queries(self, fresh_app, cost_setup):
+        from sqlalchemy import event
+        from app.services.cost_matrix_service import rebuild_location_costs, get_cost_matrix
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            rebuild_location_costs()
+            matrix = get_cost_matrix()
+            product_ids = [p.id for p in Product.query.filter_by(is_active=True)]
+
+            statements = []
+
+            def count(*args):
+                statements.append(args)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                for product_id in product_ids:
+                    assert matrix.final_cost(product_id, kiosk_id) is not None
+                    assert get_cost_matrix().get(product_id, warehouse_id) is not None
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+            assert statements == []
+
+    def test_rebuild_invalidates_lookup(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import rebuild_location_costs, get_cost_matrix
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            assert len(get_cost_matrix()) == 0
+
+            rebuild_location_costs()
+
+            assert len(get_cost_matrix()) == LocationProductCost.query.count()
+
+    def test_fallback_for_missing_pair(self, fresh_app, cost_setup):
+        from app.services.cost_matrix_service import get_cost_matrix, invalidate_cost_matrix
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            invalidate_cost_matrix()
+            product = Product.query.filter_by(code='PRD001').first()
+
+            final = get_cost_matrix().final_cost(product, kiosk_id)
+
+            expected = (product.cost_price * Decimal('1.1')).quantize(Decimal('0.01'))
+            assert final == expected
+
+    def test_location_final_cost_reads_matrix(self, fresh_app, cost_setup):
+        from sqlalchemy import event
+        from app.services.cost_matrix_service import rebuild_location_costs, invalidate_cost_matrix
+
+        warehouse_id, kiosk_id = cost_setup
+        with fresh_app.app_context():
+            rebuild_location_costs()
+            kiosk = Location.query.get(kiosk_id)
+            product = Product.query.filter_by(code='PRD001').first()
+            row = LocationProductCost.query.filter_by(location_id=kiosk_id, product_id=product.id).one()
+            row.final_cost = Decimal('123.45')
+            db.session.commit()
+            invalidate_cost_matrix()
+            kiosk = Location.query.get(kiosk_id)
+            product = Product.query.filter_by(code='PRD001').first()
+
+            assert kiosk.get_final_cost_for_product(product) == 123.45
+
+            statements = []
+
+            def count(*args):
+                statements.append(args)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                assert kiosk.get_final_cost_for_product(product) == 123.45
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+            assert statements == []
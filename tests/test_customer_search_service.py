@@ -0,0 +1,162 @@
+"""
+Tests for indexed customer search.
+
+Covers:
+- Phone normalization to E.164 from the formats numbers arrive in
+- Lookups by any phone format, last digits, name word prefix and email
+- Search tokens follow renames and deletions
+- Searches use indexes and stay fast with many customers
+"""
+
+import time
+
+import pytest
+from sqlalchemy import insert, text
+
+from app.models import db, Customer, CustomerSearchToken
+from app.utils.helpers import normalize_phone, search_tokens
+
+
+class TestNormalizePhone:
+    """normalize_phone() maps local and international forms to E.164."""
+
+    @pytest.mark.parametrize('phone', [
+        '03001234567', '3001234567', '923001234567', '+92 300 1234567',
+        '0092-300-1234567', '(0300) 123 4567'
+    ])
+    def test_pakistani_forms(self, phone):
+        assert normalize_phone(phone) == '+923001234567'
+
+    def test_foreign_and_invalid(self):
+        assert normalize_phone('+1 415 555 0100') == '+14155550100'
+        assert normalize_phone('12345') is None
+        assert normalize_phone('') is None
+        assert normalize_phone(None) is None
+
+    def test_tokens(self):
+        assert search_tokens("Ali O'Neil-Khan", 'Ali.Khan@Example.com') == {
+            'ali', 'o', 'neil', 'khan', 'ali.khan@example.com'
+        }
+
+
+class TestCustomerSearch:
+    """customer_search_filter() and friends."""
+
+    def _names(self, query, **kwargs):
+        from app.services.customer_search_service import search_customers
+        return [customer.name for customer in search_customers(query, **kwargs)]
+
+    def test_model_keeps_phone_columns(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            customer = Customer.query.filter_by(phone='03001234567').first()
+            assert customer.phone_e164 == '+923001234567'
+            assert customer.phone_reversed == '765432100329'
+
+            customer.phone = '+92 321 7654321'
+            assert customer.phone_e164 == '+923217654321'
+
+    def test_phone_searches(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            assert self._names('+92 300 1234567') == ['John Doe']
+            assert self._names('923001234567') == ['John Doe']
+            assert self._names('4567') == ['John Doe']
+            assert self._names('1234568') == ['Jane Smith']
+            assert set(self._names('0300123')) == {'John Doe', 'Jane Smith', 'Ahmed Khan'}
+
+    def test_name_and_email_searches(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            assert self._names('jo') == ['John Doe']
+            assert self._names('smi') == ['Jane Smith']
+            assert self._names('ahmed kh') == ['Ahmed Khan']
+            assert self._names('jane@test') == ['Jane Smith']
+            assert self._names('zz') == []
+            assert 'Inactive Customer' not in self._names('inactive')
+            assert self._names('inactive', active_only=False) == ['Inactive Customer']
+
+    def test_tokens_follow_changes(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            customer = Customer.query.filter_by(phone='03001234567').first()
+            customer.name = 'Johnny Walker'
+            db.session.commit()
+
+            assert self._names('walk') == ['Johnny Walker']
+            assert self._names('doe') == []
+
+            customer_id = customer.id
+            db.session.delete(customer)
+            db.session.commit()
+            assert CustomerSearchToken.query.filter_by(customer_id=customer_id).count() == 0
+
+    def test_rebuild_index(self, fresh_app, init_database):
+        from app.services.customer_search_service import rebuild_customer_search_index
+
+        with fresh_app.app_context():
+            total = Customer.query.count()
+            db.session.execute(text('UPDATE customers SET phone_e164 = NULL, phone_reversed = NULL'))
+            db.session.execute(CustomerSearchToken.__table__.delete())
+            db.session.commit()
+
+            assert rebuild_customer_search_index(batch_size=2) == total
+            assert self._names('4567') == ['John Doe']
+            assert self._names('jane') == ['Jane Smith']
+
+    def test_routes_use_index(self, fresh_app, auth_admin):
+        response = auth_admin.get('/customers/search?q=%2B923001234567')
+        assert [c['name'] for c in response.get_json()['customers']] == ['John Doe']
+
+        response = auth_admin.get('/pos/customer-lookup/+923001234568')
+        assert response.get_json()['customer']['name'] == 'Jane Smith'
+
+        response = auth_admin.get('/api/search?q=smith')
+        assert [c['name'] for c in response.get_json()['customers']] == ['Jane Smith']
+
+
+class TestCustomerSearchScale:
+    """Index plans and latency with 100,000 customers."""
+
+    CUSTOMERS = 100_000
+
+    def _populate(self):
+        rows, tokens = [], []
+        first_names = ['ali', 'sara', 'usman', 'ayesha', 'bilal', 'hina', 'omar', 'zainab']
+        for n in range(1, self.CUSTOMERS + 1):
+            phone = f'03{n:09d}'
+            digits = '92' + phone[1:]
+            name = f'{first_names[n % 8].title()} Customer{n}'
+            rows.append({'id': n + 100, 'name': name, 'phone': phone,
+                         'phone_e164': '+' + digits, 'phone_reversed': digits[::-1],
+                         'email': f'user{n}@example.com', 'is_active': True,
+                         'loyalty_points': 0})
+            tokens.extend({'token': token, 'customer_id': n + 100}
+                          for token in search_tokens(name, rows[-1]['email']))
+        db.session.execute(insert(Customer), rows)
+        db.session.execute(insert(CustomerSearchToken), tokens)
+        db.session.commit()
+
+    def test_searches_use_indexes(self, fresh_app, init_database):
+        from app.services.customer_search_service import customer_search_filter, search_customers
+
+        with fresh_app.app_context():
+            self._populate()
+
+            for query in ('4567', '03000012345', 'customer777', 'user4242@example'):
+                statement = Customer.query.filter(customer_search_filter(query, active_only=True))\
+                    .order_by(Customer.name, Customer.id).limit(10).statement
+                compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+                plan = ' | '.join(row[-1] for row in
+                                  db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+                assert 'SCAN' not in plan and 'ix_customers_active_name_id' not in plan, plan
+
+            timings = {}
+            for query in ('4567', '03000012345', 'customer777', 'user4242@example', 'ayesha cust'):
+                started = time.perf_counter()
+                for _ in range(20):
+                    found = search_customers(query, limit=10)
+                timings[query] = (time.perf_counter() - started) / 20 * 1000
+                assert found, query
+
+            print('\n100k customers, ms per search: ' +
+                  ', '.join(f'{query!r} {ms:.1f}' for query, ms in timings.items()))
+            # Selective searches are index lookups; 'ayesha cust' matches 12,500 customers
+            assert max(ms for query, ms in timings.items() if query != 'ayesha cust') < 20
+            assert timings['ayesha cust'] < 200
@@ -0,0 +1,196 @@
+"""
+Tests for the customer 360 profile behind the POS phone lookup.
+
+Covers:
+- Profile contents match the purchase history
+- Cached lookups skip the history queries until the customer's next sale
+- Independent sub-queries on a thread pool
+- Lookup latency on a customer with 2,000 orders
+"""
+
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from app.models import db, Customer, Location, Product, Sale, SaleItem, User
+
+
+class _QueryCounter:
+    """Count SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def _record_sales(customer_id, orders, start=None):
+    """Bulk insert `orders` sales for a customer, alternating products and payment methods."""
+    user_id = User.query.filter_by(username='cashier').first().id
+    location_id = Location.query.filter_by(code='K-001').first().id
+    products = Product.query.filter(Product.code.in_(['PRD001', 'PRD002'])).order_by(Product.code).all()
+    start = start or datetime.utcnow() - timedelta(days=orders)
+    first_id = (db.session.query(db.func.max(Sale.id)).scalar() or 0) + 1
+
+    sales, items = [], []
+    for n in range(orders):
+        product = products[0] if n % 3 else products[1]
+        sales.append({
+            'id': first_id + n, 'sale_number': f'BULK-{customer_id}-{n:05d}',
+            'sale_date': start + timedelta(hours=n), 'customer_id': customer_id,
+            'user_id': user_id, 'location_id': location_id,
+            'subtotal': 100, 'total': 100, 'payment_method': 'card' if n % 4 else 'cash',
+            'status': 'completed'
+        })
+        items.append({'sale_id': first_id + n, 'product_id': product.id,
+                      'quantity': 2, 'unit_price': 50, 'subtotal': 100})
+    db.session.execute(insert(Sale), sales)
+    db.session.execute(insert(SaleItem), items)
+    db.session.commit()
+
+
+class TestCustomerProfile:
+    """customer_profile() assembles history from grouped queries."""
+
+    def test_profile_contents(self, fresh_app, init_database):
+        from app.services.customer_service import clear_customer_cache, lookup_customer_profile
+
+        with fresh_app.app_context():
+            clear_customer_cache()
+            john = Customer.query.filter_by(phone='03001234567').first()
+            jane = Customer.query.filter_by(phone='03001234568').first()
+            _record_sales(john.id, 6)
+            # Jane bought PRD003, which John never did
+            prd3 = Product.query.filter_by(code='PRD003').first()
+            prd3.is_active = True
+            _record_sales(jane.id, 1)
+            db.session.query(SaleItem).filter(SaleItem.sale_id == db.session.query(
+                db.func.max(Sale.id)).scalar_subquery()).update({SaleItem.product_id: prd3.id},
+                                                               synchronize_session=False)
+            db.session.commit()
+
+            profile = lookup_customer_profile('03001234567')
+
+            assert profile['customer']['name'] == 'John Doe'
+            assert profile['stats']['total_orders'] == 6
+            assert profile['customer']['total_purchases'] == 600
+            assert profile['stats']['avg_order_value'] == 100
+            assert profile['stats']['preferred_payment'] == 'card'
+            last = Sale.query.filter_by(customer_id=john.id).order_by(Sale.sale_date.desc()).first()
+            assert profile['last_order']['sale_number'] == last.sale_number
+            assert profile['last_order']['items'][0]['quantity'] == 2
+            top = profile['frequently_purchased']
+            assert [p['purchase_count'] for p in top] == [4, 2]
+            assert [r['product_id'] for r in profile['recommendations']] == [prd3.id]
+            assert lookup_customer_profile('00000000000') is None
+
+    def test_cached_until_next_sale(self, fresh_app, auth_manager):
+        from app.services.customer_service import clear_customer_cache
+
+        with fresh_app.app_context():
+            clear_customer_cache()
+            customer = Customer.query.filter_by(phone='03001234567').first()
+            product = Product.query.filter_by(code='PRD001').first()
+            _record_sales(customer.id, 3)
+
+            with _QueryCounter(db.engine) as cold:
+                first = auth_manager.get('/pos/customer-lookup/03001234567').get_json()
+            with _QueryCounter(db.engine) as warm:
+                second = auth_manager.get('/pos/customer-lookup/03001234567').get_json()
+
+            assert first == second
+            assert first['stats']['total_orders'] == 3
+            assert warm.count < cold.count
+            price = float(product.selling_price)
+            customer_id = customer.id
+
+        auth_manager.post('/pos/complete-sale', json={
+            'items': [{'product_id': product.id, 'quantity': 1,
+                       'unit_price': price, 'subtotal': price}],
+            'customer_id': customer_id, 'subtotal': price, 'total': price,
+            'payment_method': 'cash', 'amount_paid': price
+        })
+
+        third = auth_manager.get('/pos/customer-lookup/03001234567').get_json()
+        assert third['stats']['total_orders'] == 4
+        assert third['last_order']['payment_method'] == 'cash'
+
+    def test_invalidation_while_building_is_not_cached(self, fresh_app, init_database):
+        from app.services import customer_service as service
+
+        with fresh_app.app_context():
+            service.clear_customer_cache()
+            customer = Customer.query.filter_by(phone='03001234567').first()
+
+            original = service._order_stats
+
+            def racing_stats(customer_id):
+                # A sale commits between reading and caching the history
+                result = original(customer_id)
+                service.invalidate_customer_profile(customer_id)
+                return result
+
+            service._order_stats = racing_stats
+            try:
+                service.customer_profile(customer)
+            finally:
+                service._order_stats = original
+
+            assert customer.id not in service._profiles.get(db.engine, {})
+
+    def test_run_parallel_keeps_order(self, fresh_app):
+        from app.services.customer_service import run_parallel
+
+        with fresh_app.app_context():
+            tasks = [(pow, (2, n)) for n in range(8)]
+            assert run_parallel(tasks, 4) == [2 ** n for n in range(8)]
+            assert run_parallel(tasks, 0) == [2 ** n for n in range(8)]
+
+
+class TestCustomerLookupBenchmark:
+    """Lookup latency for a customer with 2,000 orders."""
+
+    ORDERS = 2000
+    LOOKUPS = 40
+
+    def test_lookup_p95(self, fresh_app, init_database):
+        from app.services.customer_service import (clear_customer_cache, invalidate_customer_profile,
+                                                   lookup_customer_profile)
+
+        with fresh_app.app_context():
+            clear_customer_cache()
+            customer = Customer.query.filter_by(phone='03001234567').first()
+            _record_sales(customer.id, self.ORDERS)
+            lookup_customer_profile(customer.phone)  # warm the popularity ranking
+
+            cold = []
+            for _ in range(self.LOOKUPS):
+                invalidate_customer_profile(customer.id)
+                started = time.perf_counter()
+                profile = lookup_customer_profile(customer.phone)
+                cold.append(time.perf_counter() - started)
+
+            warm = []
+            for _ in range(self.LOOKUPS):
+                started = time.perf_counter()
+                lookup_customer_profile(customer.phone)
+                warm.append(time.perf_counter() - started)
+
+            cold_p95 = statistics.quantiles(cold, n=20)[-1] * 1000
+            warm_p95 = statistics.quantiles(warm, n=20)[-1] * 1000
+            print(f'\n{self.ORDERS} orders: p95 uncached {cold_p95:.1f} ms, cached {warm_p95:.1f} ms')
+
+            assert profile['stats']['total_orders'] == self.ORDERS
+            assert warm_p95 < 30
+            assert cold_p95 < 100
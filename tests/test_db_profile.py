@@ -0,0 +1,171 @@
+"""
+Tests for the database engine profile.
+
+Covers:
+- Pool options per backend and explicit overrides
+- SQLite pragmas applied on connect
+- Pool metrics and the developer endpoint
+- Checkout throughput on a SQLite file with and without the profile
+"""
+
+import threading
+import time
+
+from sqlalchemy import create_engine, insert, select, text, update
+from sqlalchemy.exc import OperationalError
+
+from app.models import db, Product, Sale, SaleItem, User
+from app.utils.db_profile import (attach_engine_listeners, configure_engine_options,
+                                  engine_options, pool_metrics)
+
+
+class TestEngineOptions:
+    """engine_options() and configure_engine_options()."""
+
+    def test_options_by_backend(self, app):
+        assert engine_options('sqlite:///:memory:', app.config) == {}
+
+        sqlite = engine_options('sqlite:////var/pos/pos.db', app.config)
+        assert sqlite['pool_size'] == app.config['DB_POOL_SIZE']
+        assert sqlite['connect_args']['timeout'] == app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+        assert 'pool_pre_ping' not in sqlite
+
+        postgres = engine_options('postgresql://pos@db/pos', app.config)
+        assert postgres['pool_pre_ping'] is True
+        assert postgres['pool_recycle'] == app.config['DB_POOL_RECYCLE']
+        assert postgres['max_overflow'] == app.config['DB_MAX_OVERFLOW']
+
+    def test_explicit_options_win_and_replica_bind(self, app):
+        class Stub:
+            config = {**app.config,
+                      'SQLALCHEMY_DATABASE_URI': 'postgresql://pos@db/pos',
+                      'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 3},
+                      'DATABASE_REPLICA_URL': 'postgresql://pos@replica/pos'}
+
+        configure_engine_options(Stub)
+
+        assert Stub.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 3
+        assert Stub.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping'] is True
+        assert Stub.config['SQLALCHEMY_BINDS']['replica']['url'] == 'postgresql://pos@replica/pos'
+
+
+class TestSQLitePragmas:
+    """Pragmas are applied to every new SQLite file connection."""
+
+    def test_pragmas(self, app, tmp_path):
+        engine = create_engine(f'sqlite:///{tmp_path / "pos.db"}',
+                               **engine_options(f'sqlite:///{tmp_path / "pos.db"}', app.config))
+        attach_engine_listeners(engine, app.config)
+        try:
+            with engine.connect() as connection:
+                assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+                assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+                assert connection.execute(text('PRAGMA busy_timeout')).scalar() == \
+                    app.config['SQLITE_BUSY_TIMEOUT_MS']
+
+            metrics = pool_metrics(engine)
+            assert metrics['pool'] == 'QueuePool'
+            assert metrics['connects'] == 1
+            assert metrics['checkouts'] == 1
+            assert metrics['checked_out'] == 0
+        finally:
+            engine.dispose()
+
+    def test_engine_endpoint(self, fresh_app, client, init_database):
+        with fresh_app.app_context():
+            User.query.filter_by(username='admin').update({'is_developer': True})
+            db.session.commit()
+        client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+
+        data = client.get('/developer/engine').get_json()
+
+        assert data['primary']['backend'] == 'sqlite'
+        assert data['primary']['checkouts'] >= 1
+        assert 'replica' not in data
+
+
+class TestCheckoutLoad:
+    """Checkout throughput while report queries run, before and after the profile."""
+
+    WRITERS = 6
+    READERS = 2
+    SECONDS = 2
+
+    def _run(self, uri, options, config):
+        engine = create_engine(uri, **options)
+        if config is not None:
+            attach_engine_listeners(engine, config)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO users(username, email, password_hash, full_name, role, is_active) "
+                "VALUES ('load', 'load@test.com', 'x', 'Load', 'cashier', 1)"
+            ))
+            connection.execute(insert(Product), [{
+                'code': f'LD{n:03d}', 'name': f'Load {n}', 'cost_price': 1, 'selling_price': 2,
+                'quantity': 10 ** 6, 'is_active': True
+            } for n in range(200)])
+            connection.execute(insert(Sale), [{
+                'sale_number': f'HIST-{n}', 'user_id': 1, 'subtotal': 2, 'total': 2,
+                'payment_method': 'cash', 'status': 'completed'
+            } for n in range(5000)])
+
+        stop = time.perf_counter() + self.SECONDS
+        counts = {'checkouts': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def checkout(worker):
+            n = 0
+            while time.perf_counter() < stop:
+                n += 1
+                product_id = 1 + (worker * 7 + n) % 200
+                try:
+                    with engine.begin() as connection:
+                        price = connection.execute(
+                            select(Product.selling_price).where(Product.id == product_id)).scalar()
+                        sale_id = connection.execute(insert(Sale).values(
+                            sale_number=f'LOAD-{worker}-{n}', user_id=1, subtotal=price, total=price,
+                            payment_method='cash', status='completed')).inserted_primary_key[0]
+                        connection.execute(insert(SaleItem).values(
+                            sale_id=sale_id, product_id=product_id, quantity=1,
+                            unit_price=price, subtotal=price))
+                        connection.execute(update(Product).where(Product.id == product_id)
+                                           .values(quantity=Product.quantity - 1))
+                    with lock:
+                        counts['checkouts'] += 1
+                except OperationalError:
+                    with lock:
+                        counts['locked'] += 1
+
+        def report():
+            while time.perf_counter() < stop:
+                with engine.connect() as connection:
+                    connection.execute(text(
+                        "SELECT s.payment_method, count(*), sum(s.total) FROM sales s "
+                        "JOIN sales s2 ON s2.id % 100 = s.id % 100 AND s2.id < 3000 "
+                        "WHERE s.id < 3000 GROUP BY s.payment_method"
+                    )).all()
+
+        threads = [threading.Thread(target=checkout, args=(w,)) for w in range(self.WRITERS)]
+        threads += [threading.Thread(target=report) for _ in range(self.READERS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+        return counts['checkouts'] / elapsed, counts['locked']
+
+    def test_throughput(self, app, tmp_path):
+        before_uri = f'sqlite:///{tmp_path / "before.db"}'
+        after_uri = f'sqlite:///{tmp_path / "after.db"}'
+
+        before, before_locked = self._run(before_uri, {}, None)
+        after, after_locked = self._run(after_uri, engine_options(after_uri, app.config), app.config)
+
+        print(f'\ncheckouts/s with {self.READERS} report readers: '
+              f'default {before:.1f} ({before_locked} locked), '
+              f'profile {after:.1f} ({after_locked} locked)')
+        assert after_locked == 0
+        assert after > before * 2
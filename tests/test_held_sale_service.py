@@ -0,0 +1,169 @@
+"""
+Tests for the server-side held-sale store.
+
+Covers:
+- Holding carts no longer grows the session cookie
+- Listing, retrieval by index or ID, and deletion
+- Expiry of parked carts
+- Recalling a cart parked on another terminal at the same location
+- The in-memory payload LRU
+"""
+
+from datetime import datetime, timedelta
+
+from app.models import db, HeldSale, Location, Product, User
+
+
+def _held_cart(product, quantity=1):
+    return {
+        'items': [{
+            'product_id': product.id,
+            'quantity': quantity,
+            'unit_price': float(product.selling_price),
+            'subtotal': float(product.selling_price) * quantity
+        }],
+        'notes': 'back in five'
+    }
+
+
+def _session_cookie(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else ''
+
+
+class TestHeldSaleRoutes:
+    """Hold/retrieve/delete use the held_sales table."""
+
+    def test_cookie_size_is_constant(self, fresh_app, auth_cashier):
+        with fresh_app.app_context():
+            cart = _held_cart(Product.query.filter_by(code='PRD001').first(), 3)
+
+        auth_cashier.post('/pos/hold-sale', json=cart)
+        baseline = len(_session_cookie(auth_cashier))
+        for _ in range(40):
+            assert auth_cashier.post('/pos/hold-sale', json=cart).status_code == 200
+
+        assert len(_session_cookie(auth_cashier)) == baseline
+        assert len(auth_cashier.get('/pos/retrieve-held-sales').get_json()['sales']) == 41
+
+    def test_retrieve_by_index_and_id(self, fresh_app, auth_cashier):
+        with fresh_app.app_context():
+            first = Product.query.filter_by(code='PRD001').first()
+            second = Product.query.filter_by(code='PRD002').first()
+            first_cart, second_cart = _held_cart(first), _held_cart(second, 2)
+
+        auth_cashier.post('/pos/hold-sale', json=first_cart)
+        held_id = auth_cashier.post('/pos/hold-sale', json=second_cart).get_json()['id']
+
+        sales = auth_cashier.get('/pos/retrieve-held-sales').get_json()['sales']
+        assert [sale['index'] for sale in sales] == [0, 1]
+        assert sales[1]['id'] == held_id
+        assert sales[1]['item_count'] == 2
+        assert sales[1]['items'] == second_cart['items']
+
+        by_index = auth_cashier.get('/pos/retrieve-held-sales?index=1').get_json()['sale']
+        by_id = auth_cashier.get(f'/pos/held-sales/{held_id}').get_json()['sale']
+        assert by_index['id'] == by_id['id'] == held_id
+        assert auth_cashier.get('/pos/retrieve-held-sales?index=5').status_code == 404
+
+        assert auth_cashier.post('/pos/delete-held-sale/0').status_code == 200
+        sales = auth_cashier.get('/pos/retrieve-held-sales').get_json()['sales']
+        assert [sale['id'] for sale in sales] == [held_id]
+
+        assert auth_cashier.post(f'/pos/held-sales/{held_id}/delete').status_code == 200
+        assert auth_cashier.get(f'/pos/held-sales/{held_id}').status_code == 404
+
+    def test_recall_on_another_terminal(self, fresh_app, auth_cashier):
+        from app.services.held_sale_service import hold_sale
+
+        with fresh_app.app_context():
+            manager = User.query.filter_by(username='manager').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            held_id = hold_sale(manager.id, kiosk.id,
+                                _held_cart(Product.query.filter_by(code='PRD001').first())).id
+            db.session.commit()
+
+        # Own list stays per cashier; the location scope shows every terminal's carts
+        assert auth_cashier.get('/pos/retrieve-held-sales').get_json()['sales'] == []
+        shared = auth_cashier.get('/pos/retrieve-held-sales?scope=location').get_json()['sales']
+        assert [sale['id'] for sale in shared] == [held_id]
+        assert shared[0]['user_name'] == 'Manager User'
+
+        assert auth_cashier.get(f'/pos/held-sales/{held_id}').status_code == 200
+        assert auth_cashier.post(f'/pos/held-sales/{held_id}/delete').status_code == 200
+        with fresh_app.app_context():
+            assert db.session.get(HeldSale, held_id) is None
+
+    def test_other_location_cannot_see_cart(self, fresh_app, auth_cashier):
+        from app.services.held_sale_service import hold_sale
+
+        with fresh_app.app_context():
+            user = User.query.filter_by(username='warehouse_mgr').first()
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            held_id = hold_sale(user.id, warehouse.id,
+                                _held_cart(Product.query.filter_by(code='PRD001').first())).id
+            db.session.commit()
+
+        assert auth_cashier.get('/pos/retrieve-held-sales?scope=location').get_json()['sales'] == []
+        assert auth_cashier.get(f'/pos/held-sales/{held_id}').status_code == 404
+        assert auth_cashier.post(f'/pos/held-sales/{held_id}/delete').status_code == 404
+
+
+class TestHeldSaleService:
+    """Expiry, legacy session import and the payload LRU."""
+
+    def _ids(self):
+        user = User.query.filter_by(username='cashier').first()
+        return user.id, Location.query.filter_by(code='K-001').first().id
+
+    def test_expired_carts_are_hidden_and_purged(self, fresh_app, init_database):
+        from app.services.held_sale_service import hold_sale, list_held_sales, purge_expired
+
+        with fresh_app.app_context():
+            user_id, location_id = self._ids()
+            cart = _held_cart(Product.query.filter_by(code='PRD001').first())
+            stale = hold_sale(user_id, location_id, cart, ttl=timedelta(minutes=5))
+            fresh = hold_sale(user_id, location_id, cart)
+            db.session.commit()
+            stale_id, fresh_id = stale.id, fresh.id
+
+            later = datetime.utcnow() + timedelta(minutes=10)
+            assert [held.id for held in list_held_sales(location_id, now=later)] == [fresh_id]
+
+            assert purge_expired(later) == 1
+            db.session.commit()
+            assert db.session.get(HeldSale, stale_id) is None
+            assert db.session.get(HeldSale, fresh_id) is not None
+
+    def test_legacy_session_holds_are_imported(self, fresh_app, init_database):
+        from app.services.held_sale_service import import_session_holds, list_held_sales
+
+        with fresh_app.app_context():
+            user_id, location_id = self._ids()
+            session = {'held_sales': [_held_cart(Product.query.filter_by(code='PRD001').first())]}
+
+            assert import_session_holds(session, user_id, location_id) == 1
+            db.session.commit()
+
+            assert 'held_sales' not in session
+            assert len(list_held_sales(location_id, user_id)) == 1
+            assert import_session_holds(session, user_id, location_id) == 0
+
+    def test_payload_lru(self, fresh_app, init_database):
+        from app.services import held_sale_service as service
+
+        with fresh_app.app_context():
+            fresh_app.config['HELD_SALES_LRU_SIZE'] = 2
+            service.clear_held_sale_cache()
+            user_id, location_id = self._ids()
+            cart = _held_cart(Product.query.filter_by(code='PRD001').first())
+            held = [service.hold_sale(user_id, location_id, cart) for _ in range(3)]
+            db.session.commit()
+
+            assert list(service._lru[db.engine]) == [held[1].id, held[2].id]
+            assert service.held_sale_payload(held[0])['items'] == cart['items']
+            assert list(service._lru[db.engine]) == [held[2].id, held[0].id]
+
+            service.delete_held_sale(held[2])
+            db.session.commit()
+            assert held[2].id not in service._lru[db.engine]
@@ -0,0 +1,195 @@
+"""
+Tests for keyset pagination.
+
+Covers:
+- Opaque, signed cursors
+- Walking forward and back visits every row once, including NULL sort keys
+- Deep pages seek instead of OFFSET and reuse the cached row count
+- Listing routes page with cursors and ignore legacy ?page= links
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.models import db, Customer, Sale, Location
+
+
+def _add_customers(count):
+    db.session.bulk_insert_mappings(Customer, [{
+        # Duplicate names force the id tie-breaker to matter
+        'name': f'Customer {i // 3:04d}',
+        'is_active': True
+    } for i in range(count)])
+    db.session.commit()
+
+
+def _add_sales(count, location_id=None, null_dates=0):
+    start = datetime(2026, 1, 1)
+    db.session.bulk_insert_mappings(Sale, [{
+        'sale_number': f'SALE-KS-{i:05d}',
+        # Pairs of sales share a timestamp
+        'sale_date': None if i < null_dates else start + timedelta(minutes=i // 2),
+        'user_id': 1,
+        'location_id': location_id,
+        'subtotal': 10,
+        'total': 10,
+        'payment_method': 'cash'
+    } for i in range(count)])
+    db.session.commit()
+
+
+def _walk(query, keys, per_page):
+    """Follow next cursors to the end, then prev cursors back to the start."""
+    from app.utils.pagination import keyset_paginate
+
+    forward, pages = [], []
+    page = keyset_paginate(query, keys, per_page=per_page)
+    while True:
+        pages.append(page)
+        forward.extend(row.id for row in page.items)
+        if not page.has_next:
+            break
+        page = keyset_paginate(query, keys, cursor=page.next_cursor, per_page=per_page)
+
+    backward = [row.id for row in page.items]
+    while page.has_prev:
+        page = keyset_paginate(query, keys, cursor=page.prev_cursor, per_page=per_page)
+        backward = [row.id for row in page.items] + backward
+    return forward, backward, pages, page
+
+
+class _QueryCounter:
+    """Record SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, *args):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class TestCursors:
+    """Cursors are opaque and tamper-proof."""
+
+    def test_round_trip(self, fresh_app):
+        from app.utils.pagination import encode_cursor, decode_cursor
+
+        with fresh_app.test_request_context():
+            moment = datetime(2026, 3, 4, 5, 6, 7)
+            token = encode_cursor([moment, 'Ali', 42], 'prev', 7)
+
+            assert 'Ali' not in token
+            assert decode_cursor(token) == ([moment, 'Ali', 42], 'prev', 7)
+
+    def test_tampered_cursor_starts_over(self, fresh_app):
+        from app.utils.pagination import encode_cursor, decode_cursor
+
+        with fresh_app.test_request_context():
+            token = encode_cursor([1], 'next', 2)
+            assert decode_cursor(token[:-2] + 'xx') is None
+            assert decode_cursor('garbage') is None
+            assert decode_cursor(None) is None
+
+
+class TestKeysetPaginate:
+    """Seek pagination returns every row exactly once in sort order."""
+
+    def test_walks_ascending_with_ties(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            _add_customers(95)
+            query = Customer.query.filter(Customer.name.like('Customer %'))
+            keys = [(Customer.name, False), (Customer.id, False)]
+
+            forward, backward, pages, first = _walk(query, keys, per_page=10)
+
+            expected = [c.id for c in query.order_by(Customer.name, Customer.id)]
+            assert forward == expected
+            assert backward == expected
+            assert [p.page for p in pages] == list(range(1, 11))
+            assert len(pages[-1].items) == 5
+            assert pages[0].total == 95 and pages[0].pages == 10
+            assert first.page == 1 and not first.has_prev
+
+    def test_walks_descending_with_null_keys(self, fresh_app, init_database):
+        with fresh_app.app_context():
+            _add_sales(37, null_dates=4)
+            keys = [(Sale.sale_date, True), (Sale.id, True)]
+
+            forward, backward, _, _ = _walk(Sale.query, keys, per_page=6)
+
+            dated = Sale.query.filter(Sale.sale_date.isnot(None)).order_by(
+                Sale.sale_date.desc(), Sale.id.desc())
+            undated = Sale.query.filter(Sale.sale_date.is_(None)).order_by(Sale.id.desc())
+            expected = [s.id for s in dated] + [s.id for s in undated]
+            assert forward == expected
+            assert backward == expected
+
+    def test_deep_pages_seek_without_offset_or_recount(self, fresh_app, init_database):
+        from app.utils.pagination import keyset_paginate, clear_count_cache
+
+        with fresh_app.app_context():
+            _add_sales(300)
+            clear_count_cache()
+            keys = [(Sale.sale_date, True), (Sale.id, True)]
+            query = Sale.query.filter(Sale.total > 0)
+
+            page = keyset_paginate(query, keys, per_page=10)
+            for _ in range(20):
+                page = keyset_paginate(query, keys, cursor=page.next_cursor, per_page=10)
+
+            with _QueryCounter(db.engine) as counter:
+                deep = keyset_paginate(query, keys, cursor=page.next_cursor, per_page=10)
+
+            assert deep.page == 22
+            assert len(counter.statements) == 1
+            statement, parameters = counter.statements[0]
+            assert 'count(' not in statement.lower()
+            # SQLite always renders "LIMIT ? OFFSET ?"; nothing is skipped
+            if 'OFFSET' in statement.upper():
+                assert parameters[-1] == 0
+            assert deep.total == 300
+
+
+class TestListingRoutes:
+    """Listings page with cursors."""
+
+    def test_sales_list_follows_cursor(self, fresh_app, auth_manager):
+        import re
+        from html import unescape
+
+        count = fresh_app.config['ITEMS_PER_PAGE'] + 5
+        newest = f'SALE-KS-{count - 1:05d}'
+        with fresh_app.app_context():
+            kiosk = Location.query.filter_by(code='K-001').first()
+            _add_sales(count, location_id=kiosk.id)
+
+        response = auth_manager.get('/pos/sales')
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        assert newest in html
+        assert 'SALE-KS-00000' not in html
+
+        next_link = unescape(re.search(r'href="([^"]*cursor=[^"]*)"[^>]*>Next', html).group(1))
+        response = auth_manager.get(next_link)
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        assert 'SALE-KS-00000' in html
+        assert newest not in html
+
+    def test_legacy_page_links_still_render(self, auth_admin):
+        for url in ('/customers/?page=3', '/inventory/?page=1000000',
+                    '/settings/activity-log?page=50', '/pos/sales?page=9999'):
+            assert auth_admin.get(url).status_code == 200
+
+    def test_garbage_cursor_shows_first_page(self, auth_admin):
+        response = auth_admin.get('/customers/?cursor=not-a-cursor')
+        assert response.status_code == 200
@@ -0,0 +1,169 @@
+"""
+Tests for the full-text search index.
+
+Covers:
+- create_all installs the FTS5 table and sync triggers
+- Triggers follow inserts, updates, deactivation and deletes
+- BM25 ranking and per-kind limits
+- search_filter() for list pages and the LIKE fallback
+- Navbar global search and rebuild
+- Latency with a large index
+"""
+
+import time
+
+from sqlalchemy import insert, inspect, text
+
+from app.models import db, Customer, Product, PurchaseOrder, Sale, Supplier
+
+
+class TestIndexSync:
+    """Triggers keep search_documents in step with the source tables."""
+
+    def test_installed_on_create_all(self, fresh_app, init_database):
+        from app.services.search_service import SQLiteFTSBackend, get_backend
+
+        with fresh_app.app_context():
+            assert inspect(db.engine).has_table('search_documents')
+            assert isinstance(get_backend(), SQLiteFTSBackend)
+
+    def test_triggers_follow_changes(self, fresh_app, init_database):
+        from app.services.search_service import search
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            assert search('prd001', ['product'])['product'] == [product.id]
+
+            product.name = 'Velvet Oud Intense'
+            db.session.commit()
+            assert search('velv int', ['product'])['product'] == [product.id]
+
+            product.is_active = False
+            db.session.commit()
+            assert search('velvet', ['product'])['product'] == []
+
+            product.is_active = True
+            db.session.commit()
+            assert search('velvet', ['product'])['product'] == [product.id]
+
+            customer = Customer.query.filter_by(phone='03001234567').first()
+            customer_id = customer.id
+            assert search('john', ['customer'])['customer'] == [customer_id]
+            db.session.delete(customer)
+            db.session.commit()
+            assert search('john', ['customer'])['customer'] == []
+
+    def test_supplier_rename_reindexes_purchase_orders(self, fresh_app, init_database):
+        from app.services.search_service import search
+
+        with fresh_app.app_context():
+            supplier = Supplier(name='Gulf Traders', is_active=True)
+            db.session.add(supplier)
+            db.session.flush()
+            order = PurchaseOrder(po_number='PO-20260101-0007', supplier_id=supplier.id)
+            db.session.add(order)
+            db.session.commit()
+            assert search('gulf', ['purchase_order'])['purchase_order'] == [order.id]
+
+            supplier.name = 'Najd Perfumery'
+            db.session.commit()
+            assert search('gulf', ['purchase_order'])['purchase_order'] == []
+            assert search('najd', ['purchase_order'])['purchase_order'] == [order.id]
+
+    def test_ranking_prefers_title_matches(self, fresh_app, init_database):
+        from app.services.search_service import search
+
+        with fresh_app.app_context():
+            in_title = Supplier(name='Amber House Traders', is_active=True)
+            in_body = Supplier(name='Gulf Traders', contact_person='Amber Khan', is_active=True)
+            db.session.add_all([in_body, in_title])
+            db.session.commit()
+
+            assert search('amber', ['supplier'])['supplier'] == [in_title.id, in_body.id]
+            assert search('amber', ['supplier'], limit=1)['supplier'] == [in_title.id]
+
+    def test_search_filter_for_list_pages(self, fresh_app, init_database):
+        from app.services.search_service import search_filter
+
+        with fresh_app.app_context():
+            ids = [p.id for p in Product.query.filter(search_filter('product', 'prd00')).all()]
+            assert len(ids) == Product.query.filter_by(is_active=True).count()
+            assert Product.query.filter(search_filter('product', 'nothing-like-this')).count() == 0
+
+    def test_like_fallback(self, fresh_app, init_database):
+        from app.services import search_service
+
+        with fresh_app.app_context():
+            search_service._backends[db.engine] = search_service.LikeBackend()
+            try:
+                product = Product.query.filter_by(code='PRD001').first()
+                assert search_service.search('RD00', ['product'])['product']
+                assert Product.query.filter(
+                    search_service.search_filter('product', product.name)).first() == product
+            finally:
+                search_service._backends.pop(db.engine, None)
+
+    def test_rebuild(self, fresh_app, init_database):
+        from app.services.search_service import rebuild_search_index, search
+
+        with fresh_app.app_context():
+            db.session.execute(text('DELETE FROM search_documents'))
+            db.session.commit()
+            assert search('john', ['customer'])['customer'] == []
+
+            counts = rebuild_search_index()
+
+            assert counts['customer'] == Customer.query.count()
+            assert counts['product'] == Product.query.filter_by(is_active=True).count()
+            assert search('john', ['customer'])['customer']
+
+
+class TestGlobalSearch:
+    """The navbar search endpoint uses the index."""
+
+    def test_results_by_kind(self, fresh_app, auth_admin):
+        with fresh_app.app_context():
+            sale = Sale(sale_number='SALE-20260101-4321', user_id=1, subtotal=0, total=0,
+                        payment_method='cash')
+            db.session.add(sale)
+            db.session.commit()
+
+        data = auth_admin.get('/api/search?q=john').get_json()
+        assert [c['name'] for c in data['customers']] == ['John Doe']
+
+        data = auth_admin.get('/api/search?q=4321').get_json()
+        assert [s['name'] for s in data['sales']] == ['SALE-20260101-4321']
+
+        data = auth_admin.get('/api/search?q=cust').get_json()
+        assert any(page['url'] == '/customers' for page in data['pages'])
+
+
+class TestSearchBenchmark:
+    """Latency with 100,000 indexed documents."""
+
+    PRODUCTS = 100_000
+
+    def test_latency(self, fresh_app, init_database):
+        from app.services.search_service import search
+
+        words = ['oud', 'amber', 'musk', 'rose', 'saffron', 'vanilla', 'cedar', 'jasmine']
+        with fresh_app.app_context():
+            db.session.execute(insert(Product), [{
+                'code': f'BX{n:07d}', 'name': f'{words[n % 8].title()} {words[n // 8 % 8]} Blend {n}',
+                'brand': 'Bench', 'cost_price': 1, 'selling_price': 2, 'quantity': 0,
+                'is_active': True
+            } for n in range(self.PRODUCTS)])
+            db.session.commit()
+
+            timings = {}
+            for query in ('bx0012345', 'blend 4242', 'saffron ced', 'oud'):
+                started = time.perf_counter()
+                for _ in range(10):
+                    found = search(query, ['product'])['product']
+                timings[query] = (time.perf_counter() - started) / 10 * 1000
+                assert found, query
+
+            print(f'\n{self.PRODUCTS} documents, ms per search: ' +
+                  ', '.join(f'{query!r} {ms:.1f}' for query, ms in timings.items()))
+            assert timings['bx0012345'] < 20
+            assert timings['blend 4242'] < 50
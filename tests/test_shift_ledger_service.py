@@ -0,0 +1,291 @@
+"""
+Tests for the shift ledger service.
+
+Covers:
+- Sales, split payments, refunds, returns and edits keep the ledger current
+- Day close reads the ledger and freezes an immutable Z-report snapshot
+- Reconciliation against raw sales detects and repairs drift
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db, DayClose, Location, Product, Sale, ShiftLedger
+
+
+def _sell(client, product, quantity=1, payment_method='cash', payments=None):
+    """Post a one-line sale through the POS."""
+    total = float(product.selling_price) * quantity
+    data = {
+        'items': [{
+            'product_id': product.id,
+            'quantity': quantity,
+            'unit_price': float(product.selling_price),
+            'subtotal': total
+        }],
+        'subtotal': total,
+        'total': total,
+        'payment_method': payment_method,
+        'amount_paid': total
+    }
+    if payments:
+        data['payments'] = payments
+    response = client.post('/pos/complete-sale', json=data)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['sale_id'], Decimal(str(total)).quantize(Decimal('0.01'))
+
+
+def _kiosk():
+    return Location.query.filter_by(code='K-001').first()
+
+
+class _QueryCounter:
+    """Count SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class TestLedgerUpdates:
+    """The ledger follows sales, refunds, returns and edits."""
+
+    def test_sale_increments_ledger(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import ledger_totals
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            _, first = _sell(auth_manager, product, 2)
+            _, second = _sell(auth_manager, product, 1, payment_method='card')
+
+            totals = ledger_totals(_kiosk().id, Sale.query.first().sale_date.date())
+
+            assert totals['sale_count'] == 2
+            assert totals['net_sales'] == first + second
+            assert totals['total_cash'] == first
+            assert totals['total_card'] == second
+            assert ShiftLedger.query.count() == 1
+
+    def test_split_payment_spread_over_methods(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import ledger_totals
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            total = Decimal(str(product.selling_price)) * 2
+            cash = (total / 2).quantize(Decimal('0.01'))
+            _sell(auth_manager, product, 2, payments=[
+                {'method': 'cash', 'amount': float(cash)},
+                {'method': 'easypaisa', 'amount': float(total - cash)}
+            ])
+
+            totals = ledger_totals(_kiosk().id, Sale.query.first().sale_date.date())
+
+            assert totals['total_cash'] == cash
+            assert totals['total_easypaisa'] == total - cash
+            assert totals['total_other'] == 0
+
+    def test_refund_moves_sale_to_refunds(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import ledger_totals
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            sale_id, amount = _sell(auth_manager, product, 1)
+
+            response = auth_manager.post(f'/pos/refund-sale/{sale_id}')
+            assert response.get_json()['success']
+
+            totals = ledger_totals(_kiosk().id, Sale.query.get(sale_id).sale_date.date())
+            assert totals['sale_count'] == 0
+            assert totals['total_cash'] == 0
+            assert totals['refund_count'] == 1
+            assert totals['total_refunds'] == amount
+
+    def test_cash_return_comes_out_of_the_drawer(self, fresh_app, auth_manager):
+        from app.models_extended import FeatureFlag
+        from app.services.shift_ledger_service import ledger_totals
+
+        with fresh_app.app_context():
+            db.session.add(FeatureFlag(name='returns_management', display_name='Returns Management',
+                                       category='sales', is_enabled=True, requires_config=False))
+            db.session.commit()
+            product = Product.query.filter_by(code='PRD001').first()
+            sale_id, amount = _sell(auth_manager, product, 2)
+            item = Sale.query.get(sale_id).items.first()
+
+            response = auth_manager.post('/returns/create', json={
+                'sale_id': sale_id,
+                'return_type': 'refund',
+                'return_reason': 'damaged',
+                'items': [{'sale_item_id': item.id, 'quantity': 1, 'restock': True}]
+            })
+            return_id = response.get_json()['id']
+            response = auth_manager.post(f'/returns/complete/{return_id}')
+            assert response.get_json()['success'], response.get_json()
+
+            refund = Decimal(str(item.unit_price)).quantize(Decimal('0.01'))
+            totals = ledger_totals(_kiosk().id, date.today())
+            assert totals['sale_count'] == 1
+            assert totals['net_sales'] == amount
+            assert totals['refund_count'] == 1
+            assert totals['total_refunds'] == refund
+            assert totals['total_cash'] == amount - refund
+
+    def test_edit_moves_sale_to_new_method(self, fresh_app, auth_admin):
+        from app.services.shift_ledger_service import ledger_totals, reconcile_ledgers, record_sale
+
+        with fresh_app.app_context():
+            kiosk_id = _kiosk().id
+            product = Product.query.filter_by(code='PRD001').first()
+            sale = Sale(sale_number='SALE-EDIT-1', user_id=1, location_id=kiosk_id,
+                        subtotal=product.selling_price, total=product.selling_price,
+                        payment_method='cash', amount_paid=product.selling_price)
+            db.session.add(sale)
+            db.session.flush()
+            record_sale(sale)
+            db.session.commit()
+            sale_id = sale.id
+            business_date = sale.sale_date.date()
+
+        response = auth_admin.post(f'/pos/edit-sale/{sale_id}', data={
+            'payment_method': 'card', 'discount': '0', 'discount_type': 'amount'
+        })
+        assert response.status_code == 302
+
+        with fresh_app.app_context():
+            totals = ledger_totals(kiosk_id, business_date)
+            assert totals['sale_count'] == 1
+            assert totals['total_cash'] == 0
+            assert totals['total_card'] == Decimal(str(Sale.query.get(sale_id).total)).quantize(Decimal('0.01'))
+            assert reconcile_ledgers() == []
+
+    def test_concurrent_first_writes_share_one_row(self, fresh_app, init_database):
+        from app.services.shift_ledger_service import LedgerEntry, post_entry, ledger_totals
+
+        with fresh_app.app_context():
+            kiosk = _kiosk()
+            today = date.today()
+            for _ in range(3):
+                post_entry(LedgerEntry(kiosk.id, today, {'sale_count': 1, 'total_card': Decimal('5.50')}))
+            db.session.commit()
+
+            assert ShiftLedger.query.count() == 1
+            totals = ledger_totals(kiosk.id, today)
+            assert totals['sale_count'] == 3
+            assert totals['total_card'] == Decimal('16.50')
+
+
+class TestDayClose:
+    """Closing a day reads the ledger and freezes the Z-report."""
+
+    def test_close_uses_ledger_and_freezes_snapshot(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import load_z_report_snapshot
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD002').first()
+            _, amount = _sell(auth_manager, product, 3)
+            card = sum(_sell(auth_manager, product, 1, payment_method='card')[1] for _ in range(4))
+            kiosk_id = _kiosk().id
+
+            with _QueryCounter(db.engine) as counter:
+                response = auth_manager.post('/day-close/close', data={'location_id': kiosk_id})
+            assert response.status_code == 302
+
+            # Totals come from the ledger; only the two grouped Z-report
+            # sections read sales, however many were made
+            sales_reads = [s for s in counter.statements if 'sales.sale_date' in s]
+            assert len(sales_reads) == 2
+
+            day_close = DayClose.query.filter_by(location_id=kiosk_id).one()
+            assert day_close.total_sales == 5
+            assert Decimal(str(day_close.total_cash)) == amount
+
+            snapshot = load_z_report_snapshot(day_close)
+            assert snapshot['totals']['net_sales'] == str(amount + card)
+            assert snapshot['totals']['total_card'] == str(card)
+            assert snapshot['top_products'][0]['code'] == 'PRD002'
+            assert sum(h['count'] for h in snapshot['hourly_sales'].values()) == 5
+
+            # Later sales do not change the frozen report
+            _sell(auth_manager, product, 1)
+            assert load_z_report_snapshot(DayClose.query.get(day_close.id)) == snapshot
+
+            response = auth_manager.get(f'/day-close/z-report/{day_close.id}')
+            assert response.status_code == 200
+
+    def test_snapshot_cannot_be_rewritten(self, fresh_app, auth_manager):
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            _sell(auth_manager, product, 1)
+            kiosk_id = _kiosk().id
+            auth_manager.post('/day-close/close', data={'location_id': kiosk_id})
+
+            day_close = DayClose.query.filter_by(location_id=kiosk_id).one()
+            with pytest.raises(ValueError):
+                day_close.z_report_data = '{}'
+
+
+class TestReconciliation:
+    """Reconciliation compares the ledger with raw sales."""
+
+    def test_ledger_matches_raw_sales(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import reconcile_ledgers
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            sale_id, _ = _sell(auth_manager, product, 2)
+            _sell(auth_manager, product, 1, payment_method='jazzcash')
+            _sell(auth_manager, product, 1, payments=[
+                {'method': 'cash', 'amount': 1},
+                {'method': 'card', 'amount': 2}
+            ])
+            auth_manager.post(f'/pos/refund-sale/{sale_id}')
+
+            assert reconcile_ledgers() == []
+
+    def test_detects_and_repairs_drift(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import reconcile_ledgers, ledger_totals
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            _, amount = _sell(auth_manager, product, 1)
+            row = ShiftLedger.query.one()
+            row.total_cash = Decimal('0.00')
+            db.session.commit()
+
+            discrepancies = reconcile_ledgers(location_id=_kiosk().id)
+            assert len(discrepancies) == 1
+            assert discrepancies[0]['fields']['total_cash'] == {'ledger': Decimal('0.00'), 'raw': amount}
+
+            reconcile_ledgers(repair=True)
+            assert reconcile_ledgers() == []
+            assert ledger_totals(row.location_id, row.business_date)['total_cash'] == amount
+
+    def test_repair_backfills_missing_rows(self, fresh_app, auth_manager):
+        from app.services.shift_ledger_service import reconcile_ledgers
+
+        with fresh_app.app_context():
+            product = Product.query.filter_by(code='PRD001').first()
+            _sell(auth_manager, product, 1)
+            ShiftLedger.query.delete()
+            db.session.commit()
+
+            assert len(reconcile_ledgers()) == 1
+            reconcile_ledgers(repair=True)
+
+            assert ShiftLedger.query.count() == 1
+            assert reconcile_ledgers() == []
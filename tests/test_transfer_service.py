@@ -0,0 +1,317 @@
+"""
+Tests for the transfer execution service.
+
+Covers:
+- Dispatch deducts source stock and releases reservations in bulk
+- Receive creates missing destination stock and records movements
+- Bulk transfer creation with block-allocated numbers and atomic reservation
+- Constant query count and timing for a 500-line replenishment
+"""
+
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.models import (db, Location, LocationStock, Product, StockMovement,
+                        StockTransfer, StockTransferItem, User)
+
+
+def _make_transfer(source, destination, lines, status='approved', number='TRF-T-001'):
+    """Create a transfer with {product_id: qty} lines and reserve source stock."""
+    transfer = StockTransfer(
+        transfer_number=number,
+        source_location_id=source.id,
+        destination_location_id=destination.id,
+        status=status
+    )
+    db.session.add(transfer)
+    db.session.flush()
+    for product_id, qty in lines.items():
+        db.session.add(StockTransferItem(
+            transfer_id=transfer.id,
+            product_id=product_id,
+            quantity_requested=qty,
+            quantity_approved=qty
+        ))
+        stock = LocationStock.query.filter_by(location_id=source.id, product_id=product_id).first()
+        if stock:
+            stock.reserved_quantity = (stock.reserved_quantity or 0) + qty
+    db.session.commit()
+    return transfer
+
+
+def _add_products(warehouse, count):
+    """Bulk create products stocked only at the warehouse."""
+    db.session.bulk_insert_mappings(Product, [{
+        'code': f'BULK{i:04d}',
+        'name': f'Bulk Product {i}',
+        'cost_price': 10,
+        'selling_price': 20,
+        'quantity': 100,
+        'reorder_level': 7,
+        'is_active': True
+    } for i in range(count)])
+    db.session.flush()
+    ids = [pid for (pid,) in db.session.query(Product.id).filter(Product.code.like('BULK%'))]
+    db.session.bulk_insert_mappings(LocationStock, [{
+        'location_id': warehouse.id,
+        'product_id': pid,
+        'quantity': 100,
+        'reserved_quantity': 0,
+        'reorder_level': 7
+    } for pid in ids])
+    db.session.commit()
+    return ids
+
+
+class _QueryCounter:
+    """Count SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class TestDispatchAndReceive:
+    """Tests for dispatch_transfers and receive_transfers."""
+
+    def test_dispatch_deducts_source_stock(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD001').first()
+            before = LocationStock.query.filter_by(
+                location_id=warehouse.id, product_id=product.id
+            ).first().quantity
+
+            transfer = _make_transfer(warehouse, kiosk, {product.id: 5})
+            result = dispatch_transfers([transfer], user_id=1, notes='Van 2')
+
+            stock = LocationStock.query.filter_by(location_id=warehouse.id, product_id=product.id).first()
+            assert result['lines'] == 1
+            assert stock.quantity == before - 5
+            assert stock.reserved_quantity == 0
+            assert stock.last_movement_at is not None
+            assert transfer.status == 'dispatched'
+            assert transfer.dispatch_notes == 'Van 2'
+            assert transfer.items.first().quantity_dispatched == 5
+
+            movement = StockMovement.query.filter_by(transfer_id=transfer.id).one()
+            assert movement.movement_type == 'transfer_out'
+            assert movement.quantity == -5
+            assert movement.location_id == warehouse.id
+
+    def test_dispatch_clamps_at_zero(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD001').first()
+            stock = LocationStock.query.filter_by(location_id=warehouse.id, product_id=product.id).first()
+            stock.quantity = 2
+            db.session.commit()
+
+            transfer = _make_transfer(warehouse, kiosk, {product.id: 5})
+            dispatch_transfers([transfer], user_id=1)
+
+            stock = LocationStock.query.filter_by(location_id=warehouse.id, product_id=product.id).first()
+            assert stock.quantity == 0
+            assert stock.reserved_quantity == 0
+
+    def test_receive_creates_missing_destination_stock(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers, receive_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location(code='K-NEW', name='New Kiosk', location_type='kiosk',
+                             parent_warehouse_id=warehouse.id)
+            db.session.add(kiosk)
+            db.session.commit()
+            product = Product.query.filter_by(code='PRD002').first()
+
+            transfer = _make_transfer(warehouse, kiosk, {product.id: 8})
+            dispatch_transfers([transfer], user_id=1)
+            item = transfer.items.first()
+
+            result = receive_transfers([transfer], user_id=1, received_quantities={item.id: 6})
+
+            stock = LocationStock.query.filter_by(location_id=kiosk.id, product_id=product.id).one()
+            assert result['stock_rows_created'] == 1
+            assert stock.quantity == 6
+            assert stock.reorder_level == product.reorder_level
+            assert transfer.status == 'received'
+            assert transfer.items.first().quantity_received == 6
+            assert transfer.items.first().discrepancy_amount == -2
+
+            movement = StockMovement.query.filter_by(
+                transfer_id=transfer.id, movement_type='transfer_in'
+            ).one()
+            assert movement.quantity == 6
+            assert movement.location_id == kiosk.id
+
+    def test_receive_defaults_to_dispatched_quantity(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers, receive_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD003').first()
+            before = LocationStock.query.filter_by(
+                location_id=kiosk.id, product_id=product.id
+            ).first().quantity
+
+            transfer = _make_transfer(warehouse, kiosk, {product.id: 4})
+            dispatch_transfers([transfer], user_id=1)
+            receive_transfers([transfer], user_id=1)
+
+            stock = LocationStock.query.filter_by(location_id=kiosk.id, product_id=product.id).first()
+            assert stock.quantity == before + 4
+
+
+class TestBulkTransfers:
+    """Tests for create_bulk_transfers."""
+
+    def test_creates_one_transfer_per_destination(self, fresh_app, init_database):
+        from app.services.transfer_service import create_bulk_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            other = Location(code='K-002', name='Second Kiosk', location_type='kiosk',
+                             parent_warehouse_id=warehouse.id)
+            db.session.add(other)
+            db.session.commit()
+            product = Product.query.filter_by(code='PRD001').first()
+
+            transfers = create_bulk_transfers(
+                warehouse.id, product.id, {kiosk.id: 3, other.id: 4}, user_id=1
+            )
+
+            numbers = sorted(t.transfer_number for t in transfers)
+            assert len(transfers) == 2
+            assert len(set(numbers)) == 2
+            assert int(numbers[1].split('-')[-1]) == int(numbers[0].split('-')[-1]) + 1
+            assert all(t.status == 'approved' for t in transfers)
+
+            stock = LocationStock.query.filter_by(location_id=warehouse.id, product_id=product.id).first()
+            assert stock.reserved_quantity == 7
+
+    def test_rejects_overallocation(self, fresh_app, init_database):
+        from app.services.transfer_service import create_bulk_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD001').first()
+            stock = LocationStock.query.filter_by(location_id=warehouse.id, product_id=product.id).first()
+
+            with pytest.raises(ValueError):
+                create_bulk_transfers(warehouse.id, product.id,
+                                      {kiosk.id: stock.quantity + 1}, user_id=1)
+
+            assert StockTransfer.query.count() == 0
+
+    def test_numbers_continue_past_999(self, fresh_app, init_database):
+        from datetime import datetime
+        from app.utils.location_context import generate_transfer_numbers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            today = datetime.utcnow().strftime('%Y%m%d')
+            for n in (999, 1000):
+                db.session.add(StockTransfer(
+                    transfer_number=f'TRF-{today}-{n:03d}',
+                    source_location_id=warehouse.id,
+                    destination_location_id=kiosk.id
+                ))
+            db.session.commit()
+
+            with _QueryCounter(db.engine) as counter:
+                numbers = generate_transfer_numbers(2)
+
+            assert numbers == [f'TRF-{today}-1001', f'TRF-{today}-1002']
+            assert counter.count == 1
+
+    def test_bulk_transfer_route(self, auth_warehouse_manager, fresh_app):
+        with fresh_app.app_context():
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product = Product.query.filter_by(code='PRD001').first()
+            kiosk_id, product_id = kiosk.id, product.id
+
+        response = auth_warehouse_manager.post('/warehouse/bulk-transfer', data={
+            'product_id': product_id,
+            'kiosk_id[]': [kiosk_id],
+            'quantity[]': ['5']
+        }, follow_redirects=True)
+
+        assert response.status_code == 200
+        with fresh_app.app_context():
+            transfer = StockTransfer.query.one()
+            assert transfer.destination_location_id == kiosk_id
+            assert transfer.items.first().quantity_approved == 5
+
+
+class TestLargeReplenishment:
+    """A 500-line warehouse replenishment stays set-based."""
+
+    LINES = 500
+
+    def test_dispatch_and_receive_500_lines(self, fresh_app, init_database):
+        from app.services.transfer_service import dispatch_transfers, receive_transfers
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            product_ids = _add_products(warehouse, self.LINES)
+
+            transfer = StockTransfer(transfer_number='TRF-BULK-500', source_location_id=warehouse.id,
+                                     destination_location_id=kiosk.id, status='approved')
+            db.session.add(transfer)
+            db.session.flush()
+            db.session.bulk_insert_mappings(StockTransferItem, [{
+                'transfer_id': transfer.id, 'product_id': pid,
+                'quantity_requested': 3, 'quantity_approved': 3
+            } for pid in product_ids])
+            db.session.commit()
+            transfer = StockTransfer.query.get(transfer.id)
+
+            started = time.perf_counter()
+            with _QueryCounter(db.engine) as dispatch_queries:
+                dispatch_transfers([transfer], user_id=1)
+            transfer = StockTransfer.query.get(transfer.id)
+            with _QueryCounter(db.engine) as receive_queries:
+                receive_transfers([transfer], user_id=1)
+            elapsed = time.perf_counter() - started
+
+            assert elapsed < 1.0
+            # Statement count is independent of the number of lines
+            # (ORM flushes of the item rows are batched into one executemany)
+            assert dispatch_queries.count < 20
+            assert receive_queries.count < 20
+
+            assert StockMovement.query.filter_by(transfer_id=transfer.id).count() == 2 * self.LINES
+            source_total = db.session.query(db.func.sum(LocationStock.quantity)).filter(
+                LocationStock.location_id == warehouse.id,
+                LocationStock.product_id.in_(product_ids)
+            ).scalar()
+            dest_total = db.session.query(db.func.sum(LocationStock.quantity)).filter(
+                LocationStock.location_id == kiosk.id,
+                LocationStock.product_id.in_(product_ids)
+            ).scalar()
+            assert source_total == 97 * self.LINES
+            assert dest_total == 3 * self.LINES
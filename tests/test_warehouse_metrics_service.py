@@ -0,0 +1,229 @@
+"""
+Tests for the warehouse metrics service.
+
+Covers:
+- Grouped per-kiosk KPIs (stock, low stock, sales, open transfers)
+- Constant query count as the number of kiosks grows
+- Short-lived per-warehouse cache and invalidation
+- Draft PO stats API
+"""
+
+import pytest
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from app.models import db, Location, LocationStock, Product, Sale, StockTransfer, User
+
+
+def _add_kiosks(warehouse, count, start=0):
+    """Create child kiosks with stock for every active product."""
+    products = Product.query.filter_by(is_active=True).all()
+    kiosks = []
+    for i in range(start, start + count):
+        kiosk = Location(
+            code=f'K-T{i:03d}',
+            name=f'Test Kiosk {i}',
+            location_type='kiosk',
+            parent_warehouse_id=warehouse.id,
+            is_active=True
+        )
+        db.session.add(kiosk)
+        db.session.flush()
+        for product in products:
+            db.session.add(LocationStock(
+                location_id=kiosk.id,
+                product_id=product.id,
+                quantity=i,
+                reorder_level=5
+            ))
+        kiosks.append(kiosk)
+    db.session.commit()
+    return kiosks
+
+
+class _QueryCounter:
+    """Count SQL statements executed on the engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class TestKioskMetrics:
+    """Tests for grouped kiosk KPI computation."""
+
+    def test_metrics_match_per_kiosk_data(self, fresh_app, init_database):
+        from app.services.warehouse_metrics_service import compute_kiosk_metrics
+
+        with fresh_app.app_context():
+            kiosk = Location.query.filter_by(code='K-001').first()
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            cashier = User.query.filter_by(username='cashier').first()
+
+            db.session.add_all([
+                Sale(sale_number='S-M-1', user_id=cashier.id, location_id=kiosk.id,
+                     subtotal=Decimal('100'), total=Decimal('100'), payment_method='cash'),
+                Sale(sale_number='S-M-2', user_id=cashier.id, location_id=kiosk.id,
+                     subtotal=Decimal('250'), total=Decimal('250'), payment_method='card'),
+                StockTransfer(transfer_number='TRF-M-1', source_location_id=warehouse.id,
+                              destination_location_id=kiosk.id, status='requested'),
+                StockTransfer(transfer_number='TRF-M-2', source_location_id=warehouse.id,
+                              destination_location_id=kiosk.id, status='dispatched'),
+                StockTransfer(transfer_number='TRF-M-3', source_location_id=warehouse.id,
+                              destination_location_id=kiosk.id, status='received'),
+            ])
+            db.session.commit()
+
+            metrics = compute_kiosk_metrics([kiosk.id])[kiosk.id]
+
+            expected_stock = sum(s.quantity for s in LocationStock.query.filter_by(location_id=kiosk.id))
+            expected_low = LocationStock.query.filter(
+                LocationStock.location_id == kiosk.id,
+                LocationStock.quantity <= LocationStock.reorder_level
+            ).count()
+
+            assert metrics['total_stock'] == expected_stock
+            assert metrics['low_stock'] == expected_low
+            assert metrics['sales_count'] == 2
+            assert metrics['sales_revenue'] == 350.0
+            assert metrics['requested_count'] == 1
+            assert metrics['dispatched_count'] == 1
+            assert metrics['pending_transfers'] == 2
+
+    def test_kiosk_without_activity(self, fresh_app, init_database):
+        from app.services.warehouse_metrics_service import compute_kiosk_metrics
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location(code='K-EMPTY', name='Empty', location_type='kiosk',
+                             parent_warehouse_id=warehouse.id)
+            db.session.add(kiosk)
+            db.session.commit()
+
+            metrics = compute_kiosk_metrics([kiosk.id])[kiosk.id]
+
+            assert metrics['total_stock'] == 0
+            assert metrics['sales_count'] == 0
+            assert metrics['pending_transfers'] == 0
+
+    def test_query_count_independent_of_kiosk_count(self, fresh_app, init_database):
+        from app.services.warehouse_metrics_service import get_warehouse_metrics
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            _add_kiosks(warehouse, 3)
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            few = Location.query.filter_by(parent_warehouse_id=warehouse.id).all()
+
+            with _QueryCounter(db.engine) as small:
+                get_warehouse_metrics(warehouse, kiosks=few, use_cache=False)
+
+            _add_kiosks(warehouse, 30, start=3)
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            many = Location.query.filter_by(parent_warehouse_id=warehouse.id).all()
+
+            with _QueryCounter(db.engine) as large:
+                result = get_warehouse_metrics(warehouse, kiosks=many, use_cache=False)
+
+            assert len(result['kiosks']) == len(few) + 30
+            assert large.count == small.count
+
+
+class TestMetricsCache:
+    """Tests for the per-warehouse cache."""
+
+    def test_cached_until_invalidated(self, fresh_app, init_database):
+        from app.services.warehouse_metrics_service import (
+            get_warehouse_metrics, invalidate_warehouse_metrics
+        )
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+
+            first = get_warehouse_metrics(warehouse)
+
+            with _QueryCounter(db.engine) as counter:
+                second = get_warehouse_metrics(warehouse, kiosks=[kiosk])
+            assert second is first
+            assert counter.count == 0
+
+            invalidate_warehouse_metrics(warehouse.id)
+            with _QueryCounter(db.engine) as counter:
+                get_warehouse_metrics(warehouse, kiosks=[kiosk])
+            assert counter.count > 0
+
+    @pytest.mark.parametrize('action,status', [('approve', 'approved'), ('reject', 'rejected')])
+    def test_approve_and_reject_invalidate(self, auth_warehouse_manager, fresh_app, action, status):
+        from app.services.warehouse_metrics_service import get_warehouse_metrics
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            kiosk = Location.query.filter_by(code='K-001').first()
+            transfer = StockTransfer(
+                transfer_number='TRF-M-001',
+                source_location_id=warehouse.id,
+                destination_location_id=kiosk.id,
+                status='requested'
+            )
+            db.session.add(transfer)
+            db.session.commit()
+            transfer_id = transfer.id
+
+            before = get_warehouse_metrics(warehouse)
+            assert before['summary']['pending_requests'] == 1
+
+        response = auth_warehouse_manager.post(f'/transfers/{transfer_id}/approve',
+                                               data={'action': action})
+        assert response.status_code == 302
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+            assert StockTransfer.query.get(transfer_id).status == status
+            after = get_warehouse_metrics(warehouse)
+            assert after is not before
+            assert after['summary']['pending_requests'] == 0
+
+    def test_warehouse_summary(self, fresh_app, init_database):
+        from app.services.warehouse_metrics_service import compute_warehouse_summary
+
+        with fresh_app.app_context():
+            warehouse = Location.query.filter_by(code='WH-001').first()
+
+            summary = compute_warehouse_summary(warehouse.id)
+
+            assert summary['total_products'] == LocationStock.query.filter_by(
+                location_id=warehouse.id
+            ).count()
+            assert summary['pending_requests'] == 0
+            assert float(summary['stock_value']) > 0
+
+
+class TestWarehouseRoutesUseMetrics:
+    """Route-level checks for pages fed by the metrics service."""
+
+    def test_analytics_page(self, auth_admin):
+        response = auth_admin.get('/warehouse/analytics')
+        assert response.status_code == 200
+        assert b'Mall Kiosk' in response.data
+
+    def test_reorders_by_store_page(self, auth_admin):
+        response = auth_admin.get('/warehouse/reorders-by-store')
+        assert response.status_code == 200
+
+    def test_draft_po_stats_api(self, auth_admin):
+        response = auth_admin.get('/warehouse/api/draft-pos/stats')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert set(data) == {'draft_pos', 'ordered_pos', 'low_stock_items', 'suppliers_with_low_stock'}